@@ -1,8 +1,14 @@
-from fastapi import FastAPI, UploadFile, Form
-from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
+import asyncio
+import os
+from fastapi import FastAPI, HTTPException, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Annotated
 from mapper.readMapper.readMapper import ReadMapper, AReadMapper
+from mapper.readMapper.jobs import JobQueue, QueueFull
+from mapper.models.job import MappingJob
 from mapper.models.readMapper import ReadMapperInput, ReadMapperOutput
 
 class ReadMapperApiInput(BaseModel):
@@ -11,41 +17,135 @@ class ReadMapperApiInput(BaseModel):
     fastTwo: UploadFile
     referenceGenome: UploadFile
 
-app = FastAPI()
 readMapper : AReadMapper = ReadMapper()
+jobs : JobQueue = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one worker pool for the lifetime of the server, references stay loaded between requests
+    readMapper.start(
+        workers=int(os.environ.get("MAPPER_WORKERS", 0)),
+        storeDir=os.environ.get("MAPPER_REFERENCE_DIR", "mapper/io/references/"),
+        maxTasksPerChild=int(os.environ.get("MAPPER_MAX_TASKS_PER_CHILD", 1000)),
+        storeMaxMB=float(os.environ.get("MAPPER_REFERENCE_STORE_MB", 4096)),
+    )
+    # mapping runs off the event loop, load beyond the queue is turned away with 503
+    global jobs
+    jobs = JobQueue(
+        readMapper,
+        workDir=os.environ.get("MAPPER_JOB_DIR"),
+        runners=int(os.environ.get("MAPPER_JOB_RUNNERS", 1)),
+        maxQueued=int(os.environ.get("MAPPER_MAX_QUEUED_JOBS", 8)),
+    )
+    yield
+    jobs.close()
+    readMapper.close()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
 async def root():
     return {"message": "Test"}
 
-@app.post("/mapper/mapReads")
-async def mapReads(
-    fastOne: UploadFile,
-    fastTwo: UploadFile,
-    referenceGenome: UploadFile
-    ):
-    outputFileName : str = "SAMOutputFile.SAM"
-    outputFolderLocation: str = "mapper/io/outputs/"
-    outputFileLocation : str = outputFolderLocation + outputFileName
-    readMapperInput = ReadMapperInput(
-        readsOne        = fastOne.file,
-        readsTwo        = fastTwo.file,
-        referenceGenome = referenceGenome.file,
-        outputLocation  = outputFileLocation,
-        kmerSize=15,
-        windowSize=30,
-    ) 
-
-    readMapperOutput : ReadMapperOutput = readMapper.mapReads(readMapperInput)
+async def submitJob(fastOne: UploadFile, fastTwo: UploadFile, referenceGenome: UploadFile | None,
+                    referenceId: str | None, stream: bool = False, copy: bool = True) -> MappingJob:
+    # a reference is either uploaded with the reads or named by the id POST /references returned
+    if (referenceGenome is None) == (referenceId is None):
+        raise HTTPException(status_code=422, detail="send either referenceGenome or reference_id")
+    if referenceId is not None and referenceId not in readMapper.references:
+        raise HTTPException(status_code=404, detail=f"unknown reference {referenceId}")
+    try:
+        # copying the uploads blocks, keep it off the event loop
+        return await run_in_threadpool(
+            jobs.submit,
+            fastOne.file,
+            fastTwo.file,
+            referenceGenome.file if referenceGenome else None,
+            stream=stream,
+            copy=copy,
+            referenceId=referenceId,
+            kmerSize=15,
+            windowSize=30,
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+def getJob(jobId: str) -> MappingJob:
+    job = jobs.get(jobId)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job {jobId}")
+    return job
 
+def resultResponse(job: MappingJob) -> FileResponse:
+    outputFileName : str = "SAMOutputFile.SAM"
     headers = {
-        "Mapped-Reads-Count": str(readMapperOutput.numberOfMappedReads),
+        "Mapped-Reads-Count": str(job.output.numberOfMappedReads),
         "Access-Control-Expose-Headers": "Mapped-Reads-Count" 
     }
 
     return FileResponse(
-        path=outputFileLocation,
+        path=os.path.join(job.directory, "output.sam"),
         filename=outputFileName,
         headers = headers
-    )
\ No newline at end of file
+    )
+
+@app.post("/mapper/mapReads")
+async def mapReads(
+    fastOne: UploadFile,
+    fastTwo: UploadFile,
+    referenceGenome: UploadFile | None = None,
+    reference_id: Annotated[str | None, Form()] = None,
+    stream: bool = False
+    ):
+    # queued like any other job, the response waits for it, so the job can parse the uploads in place
+    job : MappingJob = await submitJob(fastOne, fastTwo, referenceGenome, reference_id, stream=stream, copy=False)
+    if stream:
+        # SAM chunks as batches complete, held in memory only; the mapped-read count is not known up front
+        return StreamingResponse(
+            job.stream.chunks(),
+            media_type="text/plain",
+            headers={"Content-Disposition": 'attachment; filename="SAMOutputFile.SAM"'},
+        )
+    await asyncio.wrap_future(job.future)
+    if job.status != "done":
+        raise HTTPException(status_code=500, detail=job.error)
+    return resultResponse(job)
+
+@app.post("/references", status_code=201)
+async def addReference(referenceGenome: UploadFile):
+    # indexed once; mapping requests then send reference_id instead of the FASTA
+    return await run_in_threadpool(readMapper.addReference, referenceGenome.file, 15, 30)
+
+@app.get("/references")
+async def listReferences():
+    return readMapper.references.list()
+
+@app.post("/jobs", status_code=202)
+async def createJob(
+    fastOne: UploadFile,
+    fastTwo: UploadFile,
+    referenceGenome: UploadFile | None = None,
+    reference_id: Annotated[str | None, Form()] = None
+    ):
+    job : MappingJob = await submitJob(fastOne, fastTwo, referenceGenome, reference_id)
+    return {"id": job.id, "status": job.status, "queuePosition": jobs.position(job)}
+
+@app.get("/jobs/{jobId}")
+async def jobStatus(jobId: str):
+    job : MappingJob = getJob(jobId)
+    status = job.summary()
+    if job.status == "queued":
+        status["queuePosition"] = jobs.position(job)
+    return status
+
+@app.get("/jobs/{jobId}/result")
+async def jobResult(jobId: str):
+    job : MappingJob = getJob(jobId)
+    if job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"job failed: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"job is {job.status}")
+    if job.stream is not None:
+        raise HTTPException(status_code=409, detail="the output of this job was streamed")
+    return resultResponse(job)
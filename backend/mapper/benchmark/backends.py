@@ -0,0 +1,132 @@
+"""
+Throughput and memory of the process and thread backends, optionally under several
+interpreters (e.g. python3.13 and the free-threaded python3.13t).
+
+Every (interpreter, backend) run is a fresh child process; the parent samples the RSS
+of the child and all of its workers and prints one row per run:
+
+    python -m mapper.benchmark.backends -r ref.fa -1 r1.fq -2 r2.fq --workers 8 \
+        --python python3.13 python3.13t --json backends.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import psutil
+
+SAMPLE_SECONDS = 0.05
+# the directory holding the mapper package, where the children run
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare the process and thread backends')
+    parser.add_argument('-r', '--reference', required=True, help='Reference genome FASTA file')
+    parser.add_argument('-1', '--reads1', required=True, help='First paired-end reads FASTQ file')
+    parser.add_argument('-2', '--reads2', required=True, help='Second paired-end reads FASTQ file')
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes / threads (0 = available CPUs)')
+    parser.add_argument('--backends', nargs='+', default=['process', 'thread'], help='Backends to compare')
+    parser.add_argument('--python', nargs='+', default=[sys.executable], help='Interpreters to run each backend under')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)   # backend to run in this process
+    return parser.parse_args()
+
+
+def run_child(args) -> Dict:
+    # one mapping run, timed from the first batch to the last result
+    from ..constants.constants import KMERSIZE, WINDOWSIZE
+    from ..index.build_index import ReferenceIndexBuilder
+    from ..mmm_parser.parser import Parser
+    from ..mmm_parser.readParser import ReadParser
+    from ..parallelization.executor import gil_enabled, make_executor
+
+    with open(args.reference) as referenceFile:
+        referenceFile.readline()
+        referenceString = "".join(line.strip() for line in referenceFile)
+    with open(args.reads1) as readFrontFile, open(args.reads2) as readBackFile:
+        readPairs = ReadParser(Parser(readFile=readFrontFile, referenceFile=None),
+                               Parser(readFile=readBackFile, referenceFile=None)).parseAllReadPairs()
+    startTime = time.perf_counter()
+    referenceIndex = ReferenceIndexBuilder(referenceString, k=KMERSIZE, w=WINDOWSIZE).build_sorted_index()
+    indexTime = time.perf_counter() - startTime
+
+    with make_executor(args.child, args.workers, referenceIndex, referenceString) as executor:
+        startTime = time.perf_counter()
+        results = list(executor.imap(list(enumerate(readPairs))))
+        mapTime = time.perf_counter() - startTime
+    reads = sum(len(alignments) for alignments, _ in results)
+    return {
+        "python": sys.executable,
+        "version": sys.version.split()[0],
+        "gil": gil_enabled(),
+        "backend": args.child,
+        "workers": args.workers,
+        "reads": reads,
+        "index_s": indexTime,
+        "map_s": mapTime,
+        "reads_per_s": reads / mapTime if mapTime > 0 else 0.0,
+    }
+
+
+def tree_rss(proc: psutil.Process) -> int:
+    # RSS of a process and all of its descendants; pages shared between them count once per process
+    total = 0
+    for p in [proc] + proc.children(recursive=True):
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def run_parent(args) -> List[Dict]:
+    results = []
+    for python in args.python:
+        for backend in args.backends:
+            cmd = [python, "-m", "mapper.benchmark.backends", "--child", backend,
+                   "-r", os.path.abspath(args.reference), "-1", os.path.abspath(args.reads1),
+                   "-2", os.path.abspath(args.reads2), "--workers", str(args.workers)]
+            child = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, cwd=BACKEND_DIR)
+            proc, peak = psutil.Process(child.pid), 0
+            while child.poll() is None:
+                try:
+                    peak = max(peak, tree_rss(proc))
+                except psutil.Error:
+                    break
+                time.sleep(SAMPLE_SECONDS)
+            out, _ = child.communicate()
+            if child.returncode != 0:
+                print(f"{python} --backend {backend}: failed with exit code {child.returncode}", file=sys.stderr)
+                continue
+            result = json.loads(out.strip().splitlines()[-1])
+            result["peak_rss_mb"] = peak / 2**20
+            results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.workers <= 0:
+        from ..parallelization.executor import available_cpus
+        args.workers = available_cpus()
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    results = run_parent(args)
+    print(f"{'python':<10} {'GIL':<4} {'backend':<8} {'workers':>7} {'reads/s':>10} {'map s':>8} {'peak RSS MB':>12}")
+    for r in results:
+        print(f"{r['version']:<10} {'on' if r['gil'] else 'off':<4} {r['backend']:<8} {r['workers']:>7} "
+              f"{r['reads_per_s']:>10.0f} {r['map_s']:>8.2f} {r['peak_rss_mb']:>12.1f}")
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Throughput, per-stage times, peak memory and accuracy of the pipeline over a grid of
+genome sizes, read counts and worker counts, on simulated data (benchmark.simulate).
+
+Every dataset is simulated once into --data-dir (reused on later runs with the same
+parameters) and every (genome size, pairs, workers) cell is one main.py run with
+--no-sam --profile --memory; the results go to one JSON file. From backend/, where the
+mapper is a package:
+
+    python -m mapper.benchmark.grid --genome-sizes 1000000 10000000 --pairs 10000 100000 \
+        --workers 1 4 8 --json grid.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from .simulate import DATASET_FILES, add_simulation_args, read_profile, simulate
+
+# the directory holding the mapper package, where `python -m mapper.main` runs
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the mapper over a grid of simulated datasets')
+    parser.add_argument('--genome-sizes', type=int, nargs='+', default=[1000000], help='Reference lengths in bases')
+    parser.add_argument('--pairs', type=int, nargs='+', default=[10000], help='Read pairs per dataset')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0], help='Worker counts (0 = available CPUs)')
+    parser.add_argument('--backend', default='process', help='Executor backend of every run')
+    parser.add_argument('--data-dir', default='io/bench', help='Where simulated datasets are kept')
+    parser.add_argument('--json', default='bench-results.json', help='Results file')
+    parser.add_argument('--mapper-args', nargs=argparse.REMAINDER, default=[],
+                        help='Further main.py arguments for every run (last on the command line)')
+    add_simulation_args(parser)
+    return parser.parse_args()
+
+
+def dataset(args, genomeSize: int, pairs: int) -> Dict[str, str]:
+    # one directory per set of simulation parameters, so a changed profile is simulated afresh
+    profile = read_profile(args)
+    name = (f"g{genomeSize}_p{pairs}_s{args.seed}_r{args.repeats}x{args.repeat_length}d{args.repeat_divergence}"
+            f"_l{profile.length}_e{profile.substitution}-{profile.insertion}-{profile.deletion}"
+            f"_i{profile.insertMean}-{profile.insertSd}")
+    directory = os.path.join(args.data_dir, name)
+    if os.path.exists(os.path.join(directory, "truth.txt")):
+        return {fileName: os.path.join(directory, fileName) for fileName in DATASET_FILES}
+    print(f"simulating {directory}", file=sys.stderr)
+    return simulate(directory, genomeSize, pairs, profile, args.seed, args.repeats, args.repeat_length,
+                    args.repeat_divergence)
+
+
+def run(args, paths: Dict[str, str], workers: int) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="mapper-bench-") as scratch:
+        resultsPath = os.path.join(scratch, "results.json")
+        cmd = [sys.executable, "-m", "mapper.main", "-r", paths["ref.fa"], "-1", paths["r1.fq"], "-2", paths["r2.fq"],
+               "--truth", paths["truth.txt"], "--no-sam", "--profile", "--memory", "-t", str(workers),
+               "--backend", args.backend, "--results-json", resultsPath] + args.mapper_args
+        completed = subprocess.run(cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed with exit code {completed.returncode}")
+        with open(resultsPath) as resultsFile:
+            return json.load(resultsFile)
+
+
+def summarize(result: Dict) -> Dict:
+    # the figures of one run worth comparing across the grid
+    return {
+        "reads": result["reads"],
+        "workers": result["workers"],
+        "reads_per_minute": result["reads_per_minute"],
+        "index_s": result["index_s"],
+        "mapping_s": result["mapping_s"],
+        "total_s": result["total_s"],
+        "stages_s": result["stats"]["seconds"],
+        "peak_rss_mb": result["memory"]["peak"]["rss_mb"],
+        "peak_pss_mb": result["memory"]["peak"]["pss_mb"],
+        "memory": result["memory"],
+        "precision": result["metrics"]["Precision"],
+        "recall": result["metrics"]["Recall"],
+        "metrics": result["metrics"],
+    }
+
+
+def main():
+    args = parse_args()
+    args.data_dir = os.path.abspath(args.data_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+    results: List[Dict] = []
+    print(f"{'genome bp':>11} {'pairs':>8} {'workers':>7} {'reads/min':>11} {'map s':>8} "
+          f"{'peak PSS MB':>12} {'precision':>9} {'recall':>7}")
+    for genomeSize in args.genome_sizes:
+        for pairs in args.pairs:
+            paths = dataset(args, genomeSize, pairs)
+            for workers in args.workers:
+                result = dict(genome_size=genomeSize, pairs=pairs, **summarize(run(args, paths, workers)))
+                results.append(result)
+                print(f"{genomeSize:>11} {pairs:>8} {result['workers']:>7} {result['reads_per_minute']:>11.0f} "
+                      f"{result['mapping_s']:>8.2f} {result['peak_pss_mb']:>12.1f} {result['precision']:>9.4f} "
+                      f"{result['recall']:>7.4f}")
+                # written after every run, an interrupted grid keeps what it measured
+                with open(args.json, "w") as out:
+                    json.dump({"config": vars(args), "results": results}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
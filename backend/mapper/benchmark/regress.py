@@ -0,0 +1,221 @@
+"""
+Performance regression gate: times every mapping stage on a fixed simulated dataset
+and compares the result with a committed baseline.
+
+    hash     rolling k-mer hash over every read
+    extract  minimizer extraction
+    lookup   batched index lookup of the minimizers
+    chain    diagonal chaining of every read's anchors
+    dp       window alignment of every mapped read at its locus
+    sam      SAM records of every alignment
+    map      the whole worker pipeline, batch by batch (the macro benchmark)
+
+Each stage runs --repeat times and keeps its fastest run, in microseconds per read
+(per window / record for dp and sam). A stage slower than its baseline by more than
+--tolerance fails the gate (exit code 1), as does a change in the alignments
+themselves: the digest of the mapped output is part of the baseline, so the compiled
+and the pure-Python twins drifting apart shows up even when they stay fast.
+
+Baselines are kept per implementation, benchmark/baselines/compiled.json for the
+Cython build and pure.json without it. From backend/, where the mapper is a package:
+
+    python -m mapper.benchmark.regress              # compare, print per-stage deltas
+    python -m mapper.benchmark.regress --update     # measure and store a new baseline
+
+Every run records the command that produced it; make bench-baseline stores the
+baseline of the build at hand with the defaults, as the committed ones were made.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .simulate import ReadProfile, simulate_pairs, simulate_reference
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+BATCH_PAIRS = 256
+STAGES = ("hash", "extract", "lookup", "chain", "dp", "sam", "map")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare per-stage mapping performance with a stored baseline')
+    parser.add_argument('--baseline', help='Baseline JSON (default: benchmark/baselines/<implementation>.json)')
+    parser.add_argument('--update', action='store_true', help='Store this run as the baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown per stage (0.15 = 15%%)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per stage, the fastest counts')
+    parser.add_argument('--genome-size', type=int, default=200000, help='Reference length of the benchmark dataset')
+    parser.add_argument('--pairs', type=int, default=1000, help='Read pairs of the benchmark dataset')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the benchmark dataset')
+    parser.add_argument('--json', help='Also write this run to this JSON file')
+    return parser.parse_args()
+
+
+def implementation() -> str:
+    from ..extend import extender
+    return "compiled" if extender.__file__.endswith((".so", ".pyd")) else "pure"
+
+
+def dataset(genomeSize: int, pairs: int, seed: int):
+    # a fixed dataset: repeats and sequencing errors so that every stage has work to do
+    from ..models.read import Read
+
+    rng = np.random.default_rng(seed)
+    reference = simulate_reference(genomeSize, rng, repeats=genomeSize // 10000, repeatDivergence=0.02)
+    readsOne, readsTwo, truth = io.StringIO(), io.StringIO(), io.StringIO()
+    simulate_pairs(reference, pairs, ReadProfile(substitution=0.01, insertion=0.001, deletion=0.001), rng,
+                   readsOne, readsTwo, truth)
+
+    def reads(fastq: io.StringIO, isFront: bool) -> List:
+        lines = fastq.getvalue().split("\n")
+        return [Read(lines[i][1:], lines[i + 1], lines[i + 3], isFront) for i in range(0, len(lines) - 1, 4)]
+    return reference, list(zip(reads(readsOne, True), reads(readsTwo, False)))
+
+
+def fastest(fn: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - startTime)
+    return best
+
+
+def digest(alignments: List) -> str:
+    out = hashlib.blake2b(digest_size=16)
+    for a in alignments:
+        out.update(f"{a.readId}\t{a.flag}\t{a.ref_start}\t{a.ref_end}\t{a.cigar}\t{a.mapq}\n".encode())
+    return out.hexdigest()
+
+
+def measure(args) -> Dict:
+    from ..constants.constants import KMERSIZE, WINDOWSIZE
+    from ..extend.chainer import Chainer
+    from ..extend.extender import Extender
+    from ..hashing.hash import Hash
+    from ..index.build_index import ReferenceIndexBuilder
+    from ..models.sam import SAM, SAMInput
+    from ..parallelization.batch_reads import _init_worker, process_read_pair_batch
+    from ..seed.minimizer import Minimizer
+
+    reference, readPairs = dataset(args.genome_size, args.pairs, args.seed)
+    sequences = [read.getSequence() for readPair in readPairs for read in readPair]
+    index = ReferenceIndexBuilder(reference, k=KMERSIZE, w=WINDOWSIZE).build_sorted_index()
+    minimizer = Minimizer(k=KMERSIZE, w=WINDOWSIZE, reference_index=index)
+    chainer = Chainer()
+    extender = Extender()
+    batches = [list(enumerate(readPairs))[i:i + BATCH_PAIRS] for i in range(0, len(readPairs), BATCH_PAIRS)]
+
+    alignments: List = []
+
+    def map_all():
+        # as one worker would: initialised once, then batch after batch
+        _init_worker(index, reference)
+        alignments.clear()
+        for batch in batches:
+            alignments.extend(process_read_pair_batch(batch)[0])
+
+    def hash_all():
+        hasher = Hash(KMERSIZE)
+        for seq in sequences:
+            h = hasher.hash_sequence(seq[:KMERSIZE])
+            for i in range(KMERSIZE, len(seq)):
+                h = hasher.update(h, seq[i - KMERSIZE], seq[i])
+
+    # the macro benchmark first: its alignments feed the dp and sam stages
+    seconds = {"map": fastest(map_all, args.repeat)}
+    minimizers = [minimizer.extract(seq) for seq in sequences]
+    anchors = minimizer.lookup_batch(minimizers, index)
+    # dp windows: every mapped read at its locus, padded as a rescue window would be
+    windows = [(a.readId, seq, reference, max(0, a.ref_start - 16), a.ref_end + 16, a.strand_plus)
+               for a, seq in zip(alignments, sequences) if a.mapped]
+
+    def write_sam():
+        samWriter = SAM(referenceName="bench", referenceSize=len(reference), outputFile=io.StringIO())
+        for a in alignments:
+            samWriter.WriteReadToSam(SAMInput(QNAME=a.readId, FLAG=a.flag, RNAME="bench", POS=a.ref_start,
+                                              MAPQ=a.mapq, CIGAR=a.cigar if a.mapped else "*", RNEXT=a.rnext,
+                                              PNEXT=a.pnext, TLEN=a.ref_end - a.ref_start, QUAL=a.qual))
+
+    seconds["hash"] = fastest(hash_all, args.repeat)
+    seconds["extract"] = fastest(lambda: [minimizer.extract(seq) for seq in sequences], args.repeat)
+    seconds["lookup"] = fastest(lambda: minimizer.lookup_batch(minimizers, index), args.repeat)
+    seconds["chain"] = fastest(lambda: [chainer.chains(Minimizer.anchors_of(anchors, j))
+                                        for j in range(len(sequences))], args.repeat)
+    seconds["dp"] = fastest(lambda: [extender.align_window(*window) for window in windows], args.repeat)
+    seconds["sam"] = fastest(write_sam, args.repeat)
+
+    ops = {stage: len(sequences) for stage in STAGES}
+    ops["dp"], ops["sam"] = len(windows), len(alignments)
+    return {
+        "implementation": implementation(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "dataset": {"genome_size": args.genome_size, "pairs": args.pairs, "seed": args.seed},
+        "repeat": args.repeat,
+        "digest": digest(alignments),
+        "mapped": sum(1 for a in alignments if a.mapped),
+        "stages": {stage: {"seconds": seconds[stage], "ops": ops[stage],
+                           "us_per_op": 1e6 * seconds[stage] / ops[stage] if ops[stage] else 0.0}
+                   for stage in STAGES},
+    }
+
+
+def compare(run: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    # failures; the per-stage table is printed on the way
+    failures = []
+    if run["dataset"] != baseline["dataset"]:
+        failures.append(f"dataset {run['dataset']} differs from the baseline's {baseline['dataset']}")
+        return failures
+    print(f"{'stage':<8} {'baseline us':>12} {'current us':>11} {'delta':>8}")
+    for stage in STAGES:
+        if stage not in baseline["stages"]:
+            continue
+        before = baseline["stages"][stage]["us_per_op"]
+        after = run["stages"][stage]["us_per_op"]
+        delta = after / before - 1 if before > 0 else 0.0
+        status = ""
+        if delta > tolerance:
+            status = "REGRESSION"
+            failures.append(f"{stage}: {after:.2f} us vs {before:.2f} us ({100 * delta:+.1f}%)")
+        print(f"{stage:<8} {before:>12.2f} {after:>11.2f} {100 * delta:>+7.1f}% {status}")
+    if run["digest"] != baseline["digest"]:
+        failures.append(f"alignments differ from the baseline ({run['mapped']} mapped vs {baseline['mapped']})")
+    return failures
+
+
+def main():
+    args = parse_args()
+    run = measure(args)
+    run["command"] = " ".join(["python -m mapper.benchmark.regress"] + sys.argv[1:])
+    baselinePath = args.baseline if args.baseline else os.path.join(BASELINE_DIR, f"{run['implementation']}.json")
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(run, out, indent=2)
+    if args.update:
+        os.makedirs(os.path.dirname(baselinePath), exist_ok=True)
+        with open(baselinePath, "w") as out:
+            json.dump(run, out, indent=2)
+        print(f"baseline written to {baselinePath}")
+        return
+    if not os.path.exists(baselinePath):
+        sys.exit(f"no baseline at {baselinePath}, create one with --update")
+    with open(baselinePath) as baselineFile:
+        baseline = json.load(baselineFile)
+    print(f"{run['implementation']} build, python {run['python']}, against {baselinePath} "
+          f"(python {baseline['python']}), tolerance {100 * args.tolerance:.0f}%")
+    failures = compare(run, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
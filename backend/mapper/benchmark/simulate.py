@@ -0,0 +1,194 @@
+"""
+Deterministic simulator of a reference genome and paired-end reads from it, for
+benchmarks at any scale. The same arguments and seed always give the same files:
+
+    ref.fa      - one random reference, optionally with diverged repeat copies injected
+    r1.fq r2.fq - read pairs p<i>/1 and p<i>/2 from both strands, with substitutions,
+                  insertions and deletions at the given per-base rates
+    truth.txt   - readId<TAB>start<TAB>end of every read on the reference (0-based,
+                  end exclusive), the format SolutionIndexBuilder reads
+
+    python -m mapper.benchmark.simulate -o bench-data/1m --genome-size 1000000 --pairs 100000 \
+        --repeats 200 --repeat-length 1000 --substitution-rate 0.01
+    python -m mapper.benchmark.simulate -o bench-data/long --profile long --pairs 100
+"""
+
+import argparse
+import os
+from dataclasses import dataclass, replace
+from typing import IO, Tuple
+
+import numpy as np
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+# the three other bases of each base, for substitutions
+SUBSTITUTES = {"A": "CGT", "C": "AGT", "G": "ACT", "T": "ACG"}
+FASTA_WIDTH = 80
+DATASET_FILES = ("ref.fa", "r1.fq", "r2.fq", "truth.txt")
+
+
+@dataclass
+class ReadProfile:
+    length: int = 100             # bases per read
+    substitution: float = 0.001   # per-base rates
+    insertion: float = 0.0001
+    deletion: float = 0.0001
+    insertMean: float = 300.0     # fragment length, normally distributed
+    insertSd: float = 30.0
+    quality: int = 40             # Phred score of every base
+
+    @property
+    def errorRate(self) -> float:
+        return self.substitution + self.insertion + self.deletion
+
+
+# presets of --profile: Illumina-like short reads, and multi-kb reads with indels for --long-reads
+PROFILES = {
+    "short": ReadProfile(),
+    "long": ReadProfile(length=5000, substitution=0.01, insertion=0.005, deletion=0.005,
+                        insertMean=8000.0, insertSd=1000.0),
+}
+# ReadProfile field of each argument that overrides its preset
+PROFILE_ARGS = {"length": "read_length", "substitution": "substitution_rate", "insertion": "insertion_rate",
+                "deletion": "deletion_rate", "insertMean": "insert_mean", "insertSd": "insert_sd"}
+
+
+def simulate_reference(size: int, rng: np.random.Generator, repeats: int = 0, repeatLength: int = 1000,
+                       repeatDivergence: float = 0.0) -> str:
+    """
+    Uniform random bases, then `repeats` copies of random segments of repeatLength
+    pasted elsewhere, each copy with repeatDivergence of its bases substituted.
+    """
+    genome = BASES[rng.integers(0, 4, size)]
+    repeatLength = min(repeatLength, size)
+    for _ in range(repeats):
+        source, target = rng.integers(0, size - repeatLength + 1, 2)
+        copy = genome[source:source + repeatLength].copy()
+        diverged = rng.random(repeatLength) < repeatDivergence
+        copy[diverged] = BASES[(np.searchsorted(BASES, copy[diverged]) + rng.integers(1, 4, diverged.sum())) % 4]
+        genome[target:target + repeatLength] = copy
+    return genome.tobytes().decode()
+
+
+def reverse_complement(sequence: str) -> str:
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def sequence_read(template: str, profile: ReadProfile, rng: np.random.Generator) -> Tuple[str, int]:
+    """
+    Read profile.length bases off the start of template with sequencing errors; returns
+    the read and the number of template bases it covers.
+    """
+    length = profile.length
+    draws = rng.random(len(template))
+    pieces, size, position = [], 0, 0
+    for i in np.flatnonzero(draws < profile.errorRate):
+        # error-free bases up to the error
+        take = min(i - position, length - size)
+        pieces.append(template[position:position + take])
+        size += take
+        position += take
+        if size == length:
+            break
+        draw = draws[i]
+        if draw < profile.substitution:
+            pieces.append(SUBSTITUTES[template[i]][rng.integers(0, 3)])
+            size += 1
+            position = i + 1
+        elif draw < profile.substitution + profile.insertion:
+            # an extra base before template[i], which is still read
+            pieces.append("ACGT"[rng.integers(0, 4)])
+            size += 1
+            position = i
+        else:
+            position = i + 1
+    take = length - size
+    pieces.append(template[position:position + take])
+    return "".join(pieces), position + take
+
+
+def simulate_pairs(reference: str, pairs: int, profile: ReadProfile, rng: np.random.Generator,
+                   readsOne: IO, readsTwo: IO, truth: IO):
+    # room for the deletions of a read past its fragment
+    margin = profile.length // 2
+    lengths = np.clip(np.rint(rng.normal(profile.insertMean, profile.insertSd, pairs)), profile.length,
+                      len(reference) - 2 * margin).astype(np.int64)
+    quality = chr(33 + profile.quality)
+    for i, insert in enumerate(lengths):
+        start = int(rng.integers(margin, len(reference) - insert - margin + 1))
+        end = start + int(insert)
+        # the leftmost read is forward, its mate the reverse complement of the fragment end
+        left, leftSpan = sequence_read(reference[start:end + margin], profile, rng)
+        right, rightSpan = sequence_read(reverse_complement(reference[start - margin:end]), profile, rng)
+        reads = [(left, start, start + leftSpan), (right, end - rightSpan, end)]
+        if rng.random() < 0.5:
+            # fragment from the reverse strand: the first read is the reverse one
+            reads.reverse()
+        for mate, (sequence, readStart, readEnd), out in zip((1, 2), reads, (readsOne, readsTwo)):
+            out.write(f"@p{i}/{mate}\n{sequence}\n+\n{quality * len(sequence)}\n")
+            truth.write(f"p{i}/{mate}\t{readStart}\t{readEnd}\n")
+
+
+def simulate(directory: str, genomeSize: int, pairs: int, profile: ReadProfile = None, seed: int = 1,
+             repeats: int = 0, repeatLength: int = 1000, repeatDivergence: float = 0.0) -> dict:
+    """
+    Write ref.fa, r1.fq, r2.fq and truth.txt to directory; returns their paths.
+    """
+    profile = profile if profile else ReadProfile()
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, name) for name in DATASET_FILES}
+
+    reference = simulate_reference(genomeSize, rng, repeats, repeatLength, repeatDivergence)
+    with open(paths["ref.fa"], "w") as out:
+        out.write(f">sim{seed} simulated {genomeSize} bp, {repeats} repeats\n")
+        for i in range(0, len(reference), FASTA_WIDTH):
+            out.write(reference[i:i + FASTA_WIDTH] + "\n")
+    # truth.txt appears last, once the dataset is complete
+    partial = paths["truth.txt"] + ".partial"
+    with open(paths["r1.fq"], "w") as readsOne, open(paths["r2.fq"], "w") as readsTwo, open(partial, "w") as truth:
+        simulate_pairs(reference, pairs, profile, rng, readsOne, readsTwo, truth)
+    os.replace(partial, paths["truth.txt"])
+    return paths
+
+
+def add_simulation_args(parser: argparse.ArgumentParser):
+    parser.add_argument('--seed', type=int, default=1, help='Random seed, the same seed gives the same files')
+    parser.add_argument('--repeats', type=int, default=0, help='Repeat copies injected into the reference')
+    parser.add_argument('--repeat-length', type=int, default=1000, help='Bases per repeat copy')
+    parser.add_argument('--repeat-divergence', type=float, default=0.0, help='Fraction of substituted bases per repeat copy')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='short',
+                        help='Read preset, the options below override its values')
+    parser.add_argument('--read-length', type=int, help='Bases per read (short: 100, long: 5000)')
+    parser.add_argument('--substitution-rate', type=float, help='Per-base substitution rate (short: 0.001, long: 0.01)')
+    parser.add_argument('--insertion-rate', type=float, help='Per-base insertion rate (short: 0.0001, long: 0.005)')
+    parser.add_argument('--deletion-rate', type=float, help='Per-base deletion rate (short: 0.0001, long: 0.005)')
+    parser.add_argument('--insert-mean', type=float, help='Mean fragment length (short: 300, long: 8000)')
+    parser.add_argument('--insert-sd', type=float, help='Standard deviation of the fragment length (short: 30, long: 1000)')
+
+
+def read_profile(args) -> ReadProfile:
+    overrides = {field: getattr(args, arg) for field, arg in PROFILE_ARGS.items() if getattr(args, arg) is not None}
+    return replace(PROFILES[args.profile], **overrides)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Simulate a reference genome and paired-end reads with ground truth')
+    parser.add_argument('-o', '--output', required=True, help='Directory for ref.fa, r1.fq, r2.fq and truth.txt')
+    parser.add_argument('--genome-size', type=int, default=1000000, help='Reference length in bases')
+    parser.add_argument('--pairs', type=int, default=10000, help='Read pairs')
+    add_simulation_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = simulate(args.output, args.genome_size, args.pairs, read_profile(args), args.seed,
+                     args.repeats, args.repeat_length, args.repeat_divergence)
+    for name, path in paths.items():
+        print(f"{name:<10} {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Sweep of the seeding and alignment parameters on a sample of reads with ground truth:
+every combination of k, w, DP band and minimizer occurrence cutoff maps the same
+sample in this process, one worker, and the speed-accuracy Pareto front is printed
+(settings no other setting beats on both reads/s and recall):
+
+    python -m mapper.benchmark.tune -r ref.fa -1 r1.fq -2 r2.fq --truth truth.txt --sample 2000 \
+        --k 13 15 17 --w 10 20 30 --band 4 8 16 --max-occurrences 0 64 256 --json tune.json
+
+Each k / w pair builds its own index (timed as index_s). Recall is the fraction of the
+sampled reads placed within 5 bases of the truth, precision that of the mapped reads.
+Simulated data with truth: python -m mapper.benchmark.simulate.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from typing import Dict, List
+
+BATCH_PAIRS = 256
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sweep k, w, band and occurrence cutoff, report the Pareto front')
+    parser.add_argument('-r', '--reference', required=True, help='Reference genome FASTA file')
+    parser.add_argument('-1', '--reads1', required=True, help='First paired-end reads FASTQ file')
+    parser.add_argument('-2', '--reads2', required=True, help='Second paired-end reads FASTQ file')
+    parser.add_argument('--truth', required=True, help='Ground truth file (readId, start, end)')
+    parser.add_argument('--sample', type=int, default=2000, help='Read pairs drawn from the input (0 = all)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the sample')
+    parser.add_argument('--k', type=int, nargs='+', default=[13, 15, 17], help='K-mer sizes')
+    parser.add_argument('--w', type=int, nargs='+', default=[10, 20, 30], help='Minimizer windows')
+    parser.add_argument('--band', type=int, nargs='+', default=[8], help='Narrowest DP bands')
+    parser.add_argument('--max-occurrences', type=int, nargs='+', default=[0], help='Occurrence cutoffs (0 = off)')
+    parser.add_argument('--pair-aware', action='store_true', help='Map every setting pair-aware')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per setting, the fastest counts')
+    parser.add_argument('--json', help='Also write every setting and the front to this JSON file')
+    return parser.parse_args()
+
+
+def load_sample(args):
+    from ..index.solutionIndex import SolutionIndexBuilder
+    from ..mmm_parser.parser import Parser
+    from ..mmm_parser.readParser import ReadParser
+
+    with open(args.reference) as referenceFile:
+        referenceFile.readline()
+        referenceString = "".join(line.strip() for line in referenceFile)
+    with open(args.reads1) as readFrontFile, open(args.reads2) as readBackFile:
+        readPairs = ReadParser(Parser(readFile=readFrontFile, referenceFile=None),
+                               Parser(readFile=readBackFile, referenceFile=None)).parseAllReadPairs()
+    if 0 < args.sample < len(readPairs):
+        # spread over the whole input, which may be sorted by position; kept in input order
+        readPairs = [readPairs[i] for i in sorted(random.Random(args.seed).sample(range(len(readPairs)), args.sample))]
+    with open(args.truth) as truthFile:
+        solutionMap = SolutionIndexBuilder().getSolutionMap(truthFile)
+    sampled = {read.getIdentifier() for readPair in readPairs for read in readPair}
+    return referenceString, readPairs, {readId: hit for readId, hit in solutionMap.items() if readId in sampled}
+
+
+def run(index, referenceString: str, readPairs: List, solutionMap: dict, options, repeat: int) -> Dict:
+    from ..index.solutionIndex import MetricAccumulator
+    from ..parallelization.batch_reads import _init_worker, process_read_pair_batch
+
+    indexed = list(enumerate(readPairs))
+    seconds = float("inf")
+    for _ in range(repeat):
+        alignments = []
+        # as one worker would: initialised once, then batch after batch
+        startTime = time.perf_counter()
+        _init_worker(index, referenceString, options)
+        for i in range(0, len(indexed), BATCH_PAIRS):
+            alignments.extend(process_read_pair_batch(indexed[i:i + BATCH_PAIRS])[0])
+        seconds = min(seconds, time.perf_counter() - startTime)
+    accumulator = MetricAccumulator(solutionMap)
+    accumulator.update(batch_alignments=alignments)
+    metrics = accumulator.compute_final_metrics(total_reads_processed=len(alignments))
+    return {
+        "map_s": seconds,
+        "reads_per_s": len(alignments) / seconds if seconds > 0 else 0.0,
+        "recall": metrics.Recall,
+        "precision": metrics.Precision,
+        "mapped": accumulator.total_mapped_reads,
+    }
+
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
+    # settings no other setting matches on both speed and recall while beating it on one
+    def dominated(r: Dict) -> bool:
+        return any(o["reads_per_s"] >= r["reads_per_s"] and o["recall"] >= r["recall"] and
+                   (o["reads_per_s"] > r["reads_per_s"] or o["recall"] > r["recall"]) for o in results)
+    return sorted((r for r in results if not dominated(r)), key=lambda r: r["reads_per_s"], reverse=True)
+
+
+def main():
+    args = parse_args()
+    from ..index.build_index import ReferenceIndexBuilder
+    from ..models.options import MapperOptions
+
+    referenceString, readPairs, solutionMap = load_sample(args)
+    print(f"{2 * len(readPairs)} reads, {len(solutionMap)} with truth")
+    print(f"{'k':>3} {'w':>3} {'band':>5} {'max occ':>8} {'index s':>8} {'reads/s':>9} {'recall':>7} {'precision':>9}")
+    results: List[Dict] = []
+    for k, w in itertools.product(args.k, args.w):
+        startTime = time.perf_counter()
+        index = ReferenceIndexBuilder(referenceString, k=k, w=w).build_sorted_index()
+        indexSeconds = time.perf_counter() - startTime
+        for band, maxOccurrences in itertools.product(args.band, args.max_occurrences):
+            # no read cache: every setting maps every read
+            options = MapperOptions(k=k, w=w, minBand=band, maxOccurrences=maxOccurrences,
+                                    pairAware=args.pair_aware, readCacheMB=0)
+            result = dict(k=k, w=w, band=band, max_occurrences=maxOccurrences, index_s=indexSeconds,
+                          **run(index, referenceString, readPairs, solutionMap, options, args.repeat))
+            results.append(result)
+            print(f"{k:>3} {w:>3} {band:>5} {maxOccurrences:>8} {indexSeconds:>8.2f} {result['reads_per_s']:>9.0f} "
+                  f"{result['recall']:>7.4f} {result['precision']:>9.4f}")
+
+    front = pareto_front(results)
+    print("\nPareto front (fastest first):")
+    for r in front:
+        print(f"{r['k']:>3} {r['w']:>3} {r['band']:>5} {r['max_occurrences']:>8} {r['index_s']:>8.2f} "
+              f"{r['reads_per_s']:>9.0f} {r['recall']:>7.4f} {r['precision']:>9.4f}")
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump({"config": vars(args), "results": results, "pareto_front": front}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union
 from collections import defaultdict
+import math
+import numpy as np
 
 Anchor = Tuple[int, int, bool]  # (r, q, same_strand)a
+AnchorArrays = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (r, q, same_strand) arrays from Minimizer.lookup_batch
 
 class Chainer:
     def __init__(self):
@@ -12,6 +15,18 @@ class Chainer:
         Exact diagonal grouping (no tolerance). Returns the largest group.
         Input anchors are (reference_position=r, query_position=q, same_strand).
         """
+        best = self.chains(anchors, max_chains=1)
+        return best[0] if best else []
+
+    def chains(self, anchors: Union[List[Anchor], AnchorArrays], max_chains: int = 5) -> List[List[Anchor]]:
+        """
+        Exact diagonal grouping (no tolerance). Returns up to max_chains groups
+        ranked by score (number of anchors), best first. Ties keep the order in
+        which the diagonals were first seen, so chains(...)[0] == chain(...).
+        Anchors may also be given as (r, q, same_strand) NumPy arrays.
+        """
+        if isinstance(anchors, tuple):
+            return self._chains_from_arrays(*anchors, max_chains=max_chains)
         if not anchors:
             return []
 
@@ -23,9 +38,100 @@ class Chainer:
             key = (q - r) if same else (q + r)  # invariants: + => q-r,  - => q+r
             buckets[(same, key)].append((r, q, same))
 
-        # Pick largest exact-diagonal bucket
-        best: List[Anchor] = []
-        for group in buckets.values():
-            if len(group) > len(best):
-                best = group
-        return best
+        # Rank exact-diagonal buckets by score (sorted() is stable on ties)
+        ranked = sorted(buckets.values(), key=len, reverse=True)
+        return ranked[:max_chains]
+
+    def _chains_from_arrays(self,
+                            ref_pos: np.ndarray,
+                            read_pos: np.ndarray,
+                            same: np.ndarray,
+                            max_chains: int) -> List[List[Anchor]]:
+        """
+        Vectorized chains(): same grouping, ranking and tie-breaking as the tuple path,
+        only the selected chains are turned back into anchor tuples.
+        """
+        if len(ref_pos) == 0:
+            return []
+
+        # Ensure deterministic order: sort by (q, r)
+        order = np.lexsort((ref_pos, read_pos))
+        r, q, s = ref_pos[order], read_pos[order], same[order]
+
+        # (same, diagonal) folded into one integer key: + => q-r,  - => q+r
+        key = np.where(s, q - r, q + r) * 2 + s
+        _, first, inverse, counts = np.unique(key, return_index=True, return_inverse=True, return_counts=True)
+
+        # Rank by score, ties by the position the diagonal was first seen at
+        ranked = np.lexsort((first, -counts))[:max_chains]
+        chains = []
+        for g in ranked:
+            members = np.flatnonzero(inverse == g)
+            chains.append(list(zip(r[members].tolist(), q[members].tolist(), s[members].tolist())))
+        return chains
+
+    def gapped_chains(self,
+                      anchors: Union[List[Anchor], AnchorArrays],
+                      k: int,
+                      max_chains: int = 5,
+                      max_gap: int = 5000,
+                      max_skew: int = 500,
+                      lookback: int = 50) -> List[List[Anchor]]:
+        """
+        Gap-tolerant chaining for long reads (minimap2-style DP over anchors).
+        Anchors of one strand are chained when both the read and the reference gap
+        to the predecessor are in (0, max_gap] and differ by at most max_skew (an indel).
+        Each anchor adds up to k to the score, indels cost 0.01*k*skew + 0.5*log2(skew).
+        Returns up to max_chains disjoint chains ranked by score, best first, each in
+        reference order.
+        """
+        if isinstance(anchors, tuple):
+            anchors = list(zip(anchors[0].tolist(), anchors[1].tolist(), anchors[2].tolist()))
+        if not anchors:
+            return []
+
+        # On the reverse strand the read runs backwards along the reference: chain on -q
+        pts = sorted((same, r, q if same else -q) for r, q, same in anchors)
+        n = len(pts)
+        score = [0.0] * n
+        parent = [-1] * n
+        for i in range(n):
+            same_i, x_i, y_i = pts[i]
+            best, best_j = float(k), -1
+            for j in range(i - 1, max(-1, i - 1 - lookback), -1):
+                same_j, x_j, y_j = pts[j]
+                if same_j != same_i:
+                    break
+                dx, dy = x_i - x_j, y_i - y_j
+                if dx > max_gap:
+                    break
+                if dx <= 0 or dy <= 0 or dy > max_gap:
+                    continue
+                skew = abs(dx - dy)
+                if skew > max_skew:
+                    continue
+                gain = min(dx, dy, k) - (0.01 * k * skew + 0.5 * math.log2(skew) if skew else 0.0)
+                if score[j] + gain > best:
+                    best, best_j = score[j] + gain, j
+            score[i], parent[i] = best, best_j
+
+        # Best chain ends first; a chain stops where it runs into an anchor already used
+        used = [False] * n
+        ranked: List[Tuple[float, List[Anchor]]] = []
+        for end in sorted(range(n), key=lambda i: -score[i]):
+            if used[end]:
+                continue
+            members, i = [], end
+            while i >= 0 and not used[i]:
+                used[i] = True
+                members.append(i)
+                i = parent[i]
+            start_score = score[i] if i >= 0 else 0.0
+            chain = []
+            for m in reversed(members):
+                same, r, y = pts[m]
+                chain.append((r, y if same else -y, same))
+            ranked.append((score[end] - start_score, chain))
+
+        ranked.sort(key=lambda c: -c[0])
+        return [chain for _, chain in ranked[:max_chains]]
@@ -1,19 +1,21 @@
 # cython: language_level=3
 # cython: boundscheck=False, wraparound=False, initializedcheck=False, cdivision=True
 
-from cpython.list cimport PyList_GET_SIZE
 # from libc.stdlib cimport  bint
 from typing import List, Tuple
+from libc.math cimport log2
+import numpy as np
 
 
 Anchor = Tuple[int, int, bool]  # (r, q, same_strand)a
+AnchorArrays = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (r, q, same_strand) arrays from Minimizer.lookup_batch
 
 cdef class Chainer:
     def __cinit__(self):
         pass
 
     # TODO: try doing cdef for this function at some point
-    def chain(self, anchors: List[Anchor]) -> List[Anchor]:
+    def chain(self, object anchors) -> List[Anchor]:
         """
         Exact diagonal grouping (no tolerance). Returns the largest group.
         Input anchors are (r, q, same_strand) where:
@@ -22,6 +24,18 @@ cdef class Chainer:
            same_strand: bool
         Returns: list[tuple[int, int, bool]]
         """
+        cdef list best = self.chains(anchors, 1)
+        return best[0] if best else []
+
+    def chains(self, object anchors, int max_chains=5) -> List[List[Anchor]]:
+        """
+        Exact diagonal grouping (no tolerance). Returns up to max_chains groups
+        ranked by score (number of anchors), best first. Ties keep the order in
+        which the diagonals were first seen, so chains(...)[0] == chain(...).
+        Anchors may also be given as (r, q, same_strand) NumPy arrays.
+        """
+        if isinstance(anchors, tuple):
+            return self._chains_from_arrays(anchors[0], anchors[1], anchors[2], max_chains)
         if anchors is None:
             return []
         if not anchors:
@@ -58,10 +72,113 @@ cdef class Chainer:
             # Store as a plain Python tuple to match your original Anchor type
             L.append((r, q, bool(same)))
 
-        # Pick largest exact-diagonal bucket
-        cdef list best = []
-        for L in buckets.values():
-            if PyList_GET_SIZE(L) > PyList_GET_SIZE(best):
-                best = L
+        # Rank exact-diagonal buckets by score (list.sort is stable on ties)
+        cdef list ranked = list(buckets.values())
+        ranked.sort(key=len, reverse=True)
+        return ranked[:max_chains]
+
+    def _chains_from_arrays(self, object ref_pos, object read_pos, object same, int max_chains):
+        """
+        Vectorized chains(): same grouping, ranking and tie-breaking as the tuple path,
+        only the selected chains are turned back into anchor tuples.
+        """
+        cdef list chains = []
+        cdef object order, r, q, s, key, first, inverse, counts, ranked, members
+        if len(ref_pos) == 0:
+            return chains
+
+        # Ensure deterministic order: sort by (q, r)
+        order = np.lexsort((ref_pos, read_pos))
+        r = ref_pos[order]
+        q = read_pos[order]
+        s = same[order]
+
+        # (same, diagonal) folded into one integer key: + => q-r,  - => q+r
+        key = np.where(s, q - r, q + r) * 2 + s
+        _, first, inverse, counts = np.unique(key, return_index=True, return_inverse=True, return_counts=True)
+
+        # Rank by score, ties by the position the diagonal was first seen at
+        ranked = np.lexsort((first, -counts))[:max_chains]
+        for g in ranked:
+            members = np.flatnonzero(inverse == g)
+            chains.append(list(zip(r[members].tolist(), q[members].tolist(), s[members].tolist())))
+        return chains
+
+    def gapped_chains(self, object anchors, int k, int max_chains=5, int max_gap=5000,
+                      int max_skew=500, int lookback=50):
+        """
+        Gap-tolerant chaining for long reads (minimap2-style DP over anchors).
+        Anchors of one strand are chained when both the read and the reference gap
+        to the predecessor are in (0, max_gap] and differ by at most max_skew (an indel).
+        Each anchor adds up to k to the score, indels cost 0.01*k*skew + 0.5*log2(skew).
+        Returns up to max_chains disjoint chains ranked by score, best first, each in
+        reference order.
+        """
+        cdef list pts, chain, members, ranked
+        cdef Py_ssize_t n, i, j, end, m
+        cdef long x_i, y_i, dx, dy, skew
+        cdef bint same_i
+        cdef double best, gain, start_score
+        cdef Py_ssize_t best_j
+        cdef double[::1] score
+        cdef long[::1] xs, ys
+        cdef long[::1] parent
+        cdef unsigned char[::1] strand, used
+
+        if isinstance(anchors, tuple):
+            anchors = list(zip(anchors[0].tolist(), anchors[1].tolist(), anchors[2].tolist()))
+        if not anchors:
+            return []
+
+        # On the reverse strand the read runs backwards along the reference: chain on -q
+        pts = sorted([(same, r, q if same else -q) for r, q, same in anchors])
+        n = len(pts)
+        strand = np.array([p[0] for p in pts], dtype=np.uint8)
+        xs = np.array([p[1] for p in pts], dtype=np.int_)
+        ys = np.array([p[2] for p in pts], dtype=np.int_)
+        score = np.zeros(n, dtype=np.float64)
+        parent = np.full(n, -1, dtype=np.int_)
+        for i in range(n):
+            same_i, x_i, y_i = strand[i], xs[i], ys[i]
+            best, best_j = k, -1
+            j = i - 1
+            while j >= 0 and j >= i - lookback:
+                if strand[j] != same_i:
+                    break
+                dx = x_i - xs[j]
+                dy = y_i - ys[j]
+                if dx > max_gap:
+                    break
+                if dx > 0 and 0 < dy <= max_gap:
+                    skew = dx - dy if dx > dy else dy - dx
+                    if skew <= max_skew:
+                        gain = min(dx, dy, k)
+                        if skew:
+                            gain -= 0.01 * k * skew + 0.5 * log2(<double>skew)
+                        if score[j] + gain > best:
+                            best = score[j] + gain
+                            best_j = j
+                j -= 1
+            score[i] = best
+            parent[i] = best_j
+
+        # Best chain ends first; a chain stops where it runs into an anchor already used
+        used = np.zeros(n, dtype=np.uint8)
+        ranked = []
+        for end in np.argsort(-np.asarray(score), kind="stable"):
+            if used[end]:
+                continue
+            members = []
+            i = end
+            while i >= 0 and not used[i]:
+                used[i] = 1
+                members.append(i)
+                i = parent[i]
+            start_score = score[i] if i >= 0 else 0.0
+            chain = []
+            for m in reversed(members):
+                chain.append((xs[m], ys[m] if strand[m] else -ys[m], bool(strand[m])))
+            ranked.append((score[end] - start_score, chain))
 
-        return best
+        ranked.sort(key=lambda c: -c[0])
+        return [c[1] for c in ranked[:max_chains]]
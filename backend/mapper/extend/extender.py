@@ -1,15 +1,14 @@
-from dataclasses import dataclass
-from typing import List, Tuple, Optional, Dict, Any
-from .chainer import Chainer
+from dataclasses import dataclass, field
+from typing import List, Tuple, Optional, Dict, Any, Iterable, Union
+from .chainer import Chainer, AnchorArrays
+from ..models.stats import MappingStats
+from ..constants.constants import KMERSIZE, WINDOWSIZE
 from array import array
 import numpy as np
+import math
 import time
 
 
-# TODO: 
-# 1. have a reject high edit rates
-# 2. Check the band size and filling
-# 3. check the bucket size for window
 
 # Public datatypes
 @dataclass
@@ -26,6 +25,12 @@ class Alignment:
     rnext: str = "*"        # Ref. name of the mate/next read
     pnext: int = 0          # Position of the mate/next read
     qual: str = "*"         # ASCII of Phred-scaled base quality +33
+    # Candidate-chain bookkeeping (MAPQ estimation)
+    edit_distance: int = -1 # edit distance of this hit over the whole read
+    secondary: List["Alignment"] = field(default_factory=list)  # other distinct hits, best first
+
+MAPQ_UNIQUE = 60            # MAPQ for a hit without any secondary
+MAPQ_PER_EDIT = 10          # MAPQ gained per edit separating the best and second-best hit
 
 
 # Helper
@@ -34,7 +39,7 @@ def rc(seq: str) -> str:
             'T': 'A', 
             'G': 'C', 
             'C': 'G'}
-    return ''.join(comp.get(c) for c in seq[::-1].upper())
+    return ''.join(comp.get(c, 'N') for c in seq[::-1].upper())
 
 def compress_cigar(ops: List[str]) -> str:
     if not ops:
@@ -49,7 +54,7 @@ def compress_cigar(ops: List[str]) -> str:
     out.append(f"{run_c}{run_o}")
     return ''.join(out)
 
-def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int) -> Tuple[int, int, bool]:
+def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int, k: int = KMERSIZE) -> Tuple[int, int, bool]:
     # Project every anchor to a [start, end) span on the reference
     r0, q0, same = chain[0]
 
@@ -59,36 +64,261 @@ def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int) -
         ref_hi = c + read_len + pad_bp
         strand_plus = True
     else:
-        c = r0 + q0
+        # the anchor's k-mer ends where the reverse-complemented read starts
+        c = r0 + q0 + k
         ref_lo = (c - read_len) - pad_bp
         ref_hi = c + pad_bp
         strand_plus = False
 
     return ref_lo, ref_hi, strand_plus
 
+def ungapped_mismatches(q: str, t: str) -> int:
+    """
+    Hamming distance of two equal-length sequences, compared as byte arrays.
+    'N' in q never matches, as in the DP.
+    """
+    qb = np.frombuffer(q.upper().encode("ascii", "replace"), dtype=np.uint8)
+    tb = np.frombuffer(t.upper().encode("ascii", "replace"), dtype=np.uint8)
+    return int(np.count_nonzero((qb != tb) | (qb == ord('N'))))
+
+def myers_semiglobal(q: str, t: str) -> Tuple[int, int]:
+    """
+    Bit-parallel (Myers/Hyyro) semi-global edit distance: q aligned end-to-end, free
+    start and end on t. The read is one arbitrary-width Python int, so every text
+    column costs O(len(q)/64) machine-word operations.
+    Both strings must already be uppercase; 'N' in q never matches (as in the DP).
+    Returns (score, j_end): the minimum of the last DP row and its first column.
+    """
+    m = len(q)
+    if m == 0:
+        return 0, 0
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+
+    # Peq[c]: bit i set where q[i] matches text character c
+    peq: Dict[str, int] = {}
+    for i, c in enumerate(q):
+        if c != 'N':
+            peq[c] = peq.get(c, 0) | (1 << i)
+
+    pv, mv = mask, 0            # vertical deltas of column 0 are all +1 (D[i][0] = i)
+    score = best = m
+    j_end = 0
+    for j, c in enumerate(t, 1):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # row 0 is free on the reference, so nothing is shifted in
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        if score < best:
+            best, j_end = score, j
+    return best, j_end
+
+def band_holds(m: int, n: int, diag_est_local: Optional[int], band: Optional[int], score: int, j_end: int) -> bool:
+    """
+    True if every optimal alignment ending in column j_end stays inside the band used by
+    _banded_semiglobal. Such a path has cost == score, so with one diagonal step per
+    indel it lives on diagonals [d - score, d + score] around its end diagonal
+    d = j_end - m, never starts left of column 0 and never passes column j_end.
+    """
+    if diag_est_local is None or band is None:
+        return True
+    d_end = j_end - m
+    for i in range(1, m + 1):
+        lo = max(0, i - score, i + d_end - score)
+        hi = min(j_end, i + d_end + score)
+        if lo > hi:
+            continue
+        center = max(0, min(n, i + diag_est_local))
+        if lo < center - band or hi > center + band:
+            return False
+    return True
+
+# q-gram codes: A C G T -> 0..3, anything else -> 4
+_QGRAM_CODE = np.full(256, 4, dtype=np.int64)
+_QGRAM_CODE[[ord(base) for base in "ACGT"]] = np.arange(4)
+
+def _qgram_counts(s: str, q: int) -> np.ndarray:
+    # occurrences of every q-gram of s, indexed by its base-5 code
+    codes = _QGRAM_CODE[np.frombuffer(s.upper().encode("ascii", "replace"), dtype=np.uint8)]
+    n = len(codes) - q + 1
+    grams = codes[:n].copy()
+    for i in range(1, q):
+        grams *= 5
+        grams += codes[i:i + n]
+    return np.bincount(grams, minlength=5 ** q)
+
+def qgram_lower_bound(p: str, t: str, q: int) -> int:
+    """
+    Alignment-free lower bound of the semi-global edit distance of p inside t
+    (q-gram lemma): an occurrence with e edits leaves at least len(p) - q + 1 - q*e
+    of p's q-grams intact, and each of them also occurs in t.
+    """
+    if len(p) < q:
+        return 0
+    shared = int(np.minimum(_qgram_counts(p, q), _qgram_counts(t, q)).sum()) if len(t) >= q else 0
+    return max(0, -(-(len(p) - q + 1 - shared) // q))
+
+def anchor_coverage(read_positions: Iterable[int], k: int) -> int:
+    """
+    Read bases covered by the k-mers of anchors at these read positions.
+    """
+    covered, end = 0, 0
+    for q in sorted(read_positions):
+        if q + k > end:
+            covered += q + k - max(q, end)
+            end = q + k
+    return covered
+
+def edit_lower_bound(read_positions: Iterable[int], read_len: int, k: int, w: int) -> int:
+    """
+    Edits an alignment of the read needs at least, given the read positions of every
+    anchor on its diagonals: an error-free stretch of w + k - 1 read bases holds a whole
+    minimizer window, whose minimizer would have been one of those anchors, so every
+    uncovered stretch of length g carries at least g // (w + k - 1) edits.
+    Assumes every shared minimizer was looked up (no occurrence cutoff or quality mask).
+    """
+    span = w + k - 1
+    bound, end = 0, 0
+    for q in sorted(read_positions):
+        if q > end:
+            bound += (q - end) // span
+        end = max(end, q + k)
+    return bound + max(0, read_len - end) // span
+
+def anchor_diagonals(anchors: Union[List[Tuple[int, int, bool]], AnchorArrays]
+                     ) -> Dict[bool, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Every anchor by strand: its diagonal (as in Chainer.chains), in ascending order,
+    and its read position.
+    """
+    if isinstance(anchors, tuple):
+        ref_pos, read_pos, same = (np.asarray(a) for a in anchors)
+    else:
+        table = np.array(anchors, dtype=np.int64).reshape(-1, 3)
+        ref_pos, read_pos, same = table[:, 0], table[:, 1], table[:, 2].astype(bool)
+    diagonals = {}
+    for strand in (True, False):
+        r, q = ref_pos[same == strand].astype(np.int64), read_pos[same == strand].astype(np.int64)
+        key = q - r if strand else q + r
+        order = np.argsort(key, kind="stable")
+        diagonals[strand] = (key[order], q[order])
+    return diagonals
+
+def locus_read_positions(diagonals: Dict[bool, Tuple[np.ndarray, np.ndarray]],
+                         chain: List[Tuple[int, int, bool]], band: int) -> np.ndarray:
+    """
+    Read positions of the anchors of the chain's locus: the alignments its window can
+    hold stay within `band` diagonals of the chain, so every anchor there counts,
+    including the anchors of a neighbouring chain split off by an indel.
+    """
+    same = chain[0][2]
+    keys = [q - r if same else q + r for r, q, _ in chain]
+    diagonal, read_pos = diagonals[same]
+    lo = np.searchsorted(diagonal, min(keys) - band, side="left")
+    hi = np.searchsorted(diagonal, max(keys) + band, side="right")
+    return read_pos[lo:hi]
+
+def locus_edit_lower_bound(diagonals: Dict[bool, Tuple[np.ndarray, np.ndarray]],
+                           chain: List[Tuple[int, int, bool]], read_len: int, k: int, w: int, band: int) -> int:
+    """
+    edit_lower_bound of the alignments the chain's window can hold (locus_read_positions).
+    """
+    return edit_lower_bound(locus_read_positions(diagonals, chain, band).tolist(), read_len, k, w)
+
+def estimate_mapq(best: Alignment) -> int:
+    """
+    MAPQ from the edit-distance gap to the best secondary hit:
+    unique hits get 60, ties get 0, each extra edit on the runner-up adds MAPQ_PER_EDIT.
+    """
+    if not best.secondary:
+        return MAPQ_UNIQUE
+    gap = best.secondary[0].edit_distance - best.edit_distance
+    return max(0, min(MAPQ_UNIQUE, MAPQ_PER_EDIT * gap))
+
+
 # Extender implementation
 class Extender:
     """
-    1) Chains anchors (ref_pos, read_pos, same_strand) to pick a best colinear seed.
-    2) Creates a small reference window around the chain.
-    3) Semi-global (global-on-read) banded edit-distance alignment within that window.
+    1) Chains anchors (ref_pos, read_pos, same_strand) into candidate colinear seeds, best first.
+    2) Creates a small reference window around each chain.
+    3) Chains spanning the read are first compared base by base on their diagonal;
+       reads within ungapped_max_rate mismatches get an all-M CIGAR without any DP.
+    4) Otherwise semi-global (global-on-read) banded edit-distance alignment within that window.
+       - the band follows the chain's diagonal spread and the read length, and is
+         doubled (with the window) up to max_band while the alignment escapes it
+    In long-read mode chains tolerate gaps (Chainer.gapped_chains) and only the gaps
+    between consecutive anchors and the read ends are aligned, then stitched together.
        - costs: match=0, mismatch=1, gap=1
-       - returns: Alignment with CIGAR and absolute coords.
+       - stops once no remaining chain can reach the best hit's edit distance
+         (locus_edit_lower_bound), unless seeds are incomplete (complete_seeds=False)
+       - optionally, chains with too few anchors or too little read coverage in their locus
+         (counting the chains an indel split off), or a q-gram lower bound above the
+         edit-rate limit are dropped before any alignment
+       - returns: Alignment with CIGAR, absolute coords, MAPQ and secondary hits.
     """
-    def __init__(self, max_edit_rate: float = 0.40):
+    def __init__(self,
+                 max_edit_rate: float = 0.40,
+                 max_chains: int = 5,
+                 k: int = KMERSIZE,
+                 w: int = WINDOWSIZE,
+                 ungapped_max_rate: float = 0.05,
+                 min_band: int = 8,
+                 band_rate: float = 0.05,
+                 max_band: int = 128,
+                 long_reads: bool = False,
+                 min_chain_anchors: int = 1,
+                 min_chain_coverage: float = 0.0,
+                 qgram_filter: bool = False,
+                 complete_seeds: bool = True,
+                 profile: bool = False):
         self.chainer = Chainer()
         self.max_edit_rate = max_edit_rate
+        self.max_chains = max_chains            # candidate chains considered per read
+        self.k = k                              # k-mer size of the anchors
+        self.w = w                              # minimizer window of the anchors
+        self.ungapped_max_rate = ungapped_max_rate  # mismatch rate accepted without DP
+        self.min_band = min_band                # narrowest DP band (and window padding)
+        self.band_rate = band_rate              # band grows with the read length at this rate
+        self.max_band = max_band                # widening stops here
+        self.long_reads = long_reads            # gap-tolerant chains aligned piecewise
+        self.min_chain_anchors = min_chain_anchors    # chains with fewer anchors in their locus are not aligned
+        self.min_chain_coverage = min_chain_coverage  # ... nor chains whose locus k-mers cover less of the read
+        # q-gram length of the lower-bound filter: the lemma can only prove an edit rate
+        # below 1/q, so take the longest (most selective) q that still reaches max_edit_rate;
+        # 2-grams are shared by any two DNA windows, below q=3 the filter is off
+        self.qgram_q = min(6, math.ceil(1 / max_edit_rate) - 1) if qgram_filter and max_edit_rate > 0 else 0
+        if self.qgram_q < 3:
+            self.qgram_q = 0
+        # every minimizer shared with the reference is an anchor (no occurrence cutoff or
+        # quality mask): the early exit counts a missing anchor as edits and needs this
+        self.complete_seeds = complete_seeds
+        self.stats = MappingStats()
+        self.profile = profile                  # per-stage timers and counters, see MappingStats.profile_report
+        # DP scratch buffers, see _dp_buffers
+        self._dp_rows = (array('i'), array('i'))
+        self._dp_trace = bytearray()
+        self._dp_bounds = array('i')
 
     # Public API
     def extend(self,
                readId: str,
                read: str,
                reference: str,
-               anchors: List[Tuple[int, int, bool]]) -> Optional[Alignment]:
+               anchors: Union[List[Tuple[int, int, bool]], AnchorArrays]) -> Optional[Alignment]:
         """
         :param read:      read sequence (A/C/G/T/N)
         :param reference: whole reference string
-        :param anchors:   list of (ref_pos, read_pos, same_strand)
+        :param anchors:   list of (ref_pos, read_pos, same_strand), or the same as arrays (Minimizer.anchors_of)
         :return: Alignment or None if no good chain
         """
         startTime = time.perf_counter()
@@ -100,41 +330,363 @@ class Extender:
             cigar="",
             mapped=False
         )
-        chain = self.chainer.chain(anchors)
-        if not chain:
+        if self.long_reads:
+            chains = self.chainer.gapped_chains(anchors, self.k, max_chains=self.max_chains)
+        else:
+            chains = self.chainer.chains(anchors, max_chains=self.max_chains)
+        if self.profile:
+            self._profile_chains(chains, startTime)
+        if not chains:
             return invalidAlignment
 
         read_len = len(read)
-        ref_len = len(reference)
-        min_pad = 10
+        read_rc = None
+        hits: List[Alignment] = []
+        best: Optional[Alignment] = None
+        visited: List[Tuple[int, int, bool]] = []   # windows already aligned
+        diagonals = None                            # anchor_diagonals, once the filters or early exit need them
+        n_kept = 0
+
+        for c, chain in enumerate(chains):
+            if self.min_chain_anchors > 1 or self.min_chain_coverage > 0:
+                if diagonals is None:
+                    diagonals = anchor_diagonals(anchors)
+                if self._reject_chain(locus_read_positions(diagonals, chain, self.max_band), read_len):
+                    continue
+            n_kept += 1
+            # Chains on a neighbouring diagonal (e.g. split by an indel) share the window
+            # of an earlier chain and would only rediscover the same hit
+            window = construct_extension_window(chain, read_len, 0, self.k)
+            if any(self._same_locus(window, v, read_len) for v in visited):
+                continue
+            visited.append(window)
+
+            if not chain[0][2] and read_rc is None:
+                read_rc = rc(read)
+            if self.long_reads:
+                hit = self._align_chain_gapped(readId, read, read_rc, reference, chain)
+            else:
+                hit = self._align_chain(readId, read, read_rc, reference, chain)
+            if hit is not None:
+                hits.append(hit)
+                if best is None or hit.edit_distance < best.edit_distance:
+                    best = hit
+
+            # Early termination: done once every remaining chain needs more edits than
+            # our best hit, so none of them could beat or tie it
+            if self.complete_seeds and best is not None and c + 1 < len(chains):
+                if diagonals is None:
+                    diagonals = anchor_diagonals(anchors)
+                if all(best.edit_distance < locus_edit_lower_bound(diagonals, rest, read_len, self.k, self.w,
+                                                                   self.max_band)
+                       for rest in chains[c + 1:]):
+                    break
+
+        if n_kept == 0:
+            self.stats.count("filter_rejected_reads")
+        if best is None:
+            self.stats.time("extend", time.perf_counter() - startTime)
+            return invalidAlignment
+
+        best.secondary = sorted((h for h in hits if h is not best), key=lambda h: h.edit_distance)
+        best.mapq = estimate_mapq(best)
+
+        endTime = time.perf_counter()
+        elapsedTime = endTime - startTime
+        self.stats.time("extend", elapsedTime)
+
+        return best
+
+    def _profile_chains(self, chains, startTime):
+        # chaining time (extend starts by chaining) and chain sizes of one read
+        self.stats.time("chain", time.perf_counter() - startTime)
+        self.stats.count("chained_reads")
+        self.stats.count("chains", len(chains))
+        for chain in chains:
+            self.stats.count("chain_anchors", len(chain))
+            self.stats.peak("chain_anchors_max", len(chain))
+
+    def align_window(self,
+                     readId: str,
+                     read: str,
+                     reference: str,
+                     ref_lo: int,
+                     ref_hi: int,
+                     strand_plus: bool) -> Optional[Alignment]:
+        """
+        Align the read anywhere inside reference[ref_lo:ref_hi] on the given strand
+        without seeds (unbanded), e.g. to rescue a mate next to its partner.
+        Returns None if the window is empty or the edit rate is too high.
+        """
+        q_seq = read if strand_plus else rc(read)
+        hit, _ = self._align_in_window(readId, q_seq, reference, ref_lo, ref_hi, strand_plus, None, None)
+        return hit
+
+    def _align_chain(self,
+                     readId: str,
+                     read: str,
+                     read_rc: Optional[str],
+                     reference: str,
+                     chain: List[Tuple[int, int, bool]]) -> Optional[Alignment]:
+        """
+        Align the read inside the window of a single chain.
+        Returns None if the window is empty, the DP fails, or the edit rate is too high.
+        """
+        read_len = len(read)
+        strand_plus = chain[0][2]
 
-        # 1) Window around chain (then clamp to reference)
-        ref_lo, ref_hi, strand_plus = construct_extension_window(chain, read_len, min_pad)
+        # 1) Orient read
+        q_seq = read if strand_plus else read_rc
+
+        # 2) Most reads only carry mismatches: try the chain's diagonal as is
+        hit = self._align_ungapped(readId, q_seq, reference, chain)
+        if hit is not None:
+            return hit
+
+        # 3) Alignment-free lower bound over the widest window the band can grow to
+        if self.qgram_q and self._qgram_rejects(q_seq, reference, chain):
+            return None
+
+        # 4) Window around chain, padded by the band, widened while the alignment escapes it
+        startTime = time.perf_counter()
+        band = initial_band = self._chain_band(chain, read_len)
+        self.stats.count("dp_windows")
+        self.stats.count("band_initial", band)
+        while True:
+            ref_lo, ref_hi, strand_plus = construct_extension_window(chain, read_len, band, self.k)
+            hit, escaped = self._align_in_window(readId, q_seq, reference, ref_lo, ref_hi, strand_plus,
+                                                 band, band, widen=band < self.max_band)
+            if not escaped:
+                break
+            band = min(self.max_band, 2 * band)
+            self.stats.count("band_widenings")
+        if band > initial_band:
+            self.stats.count("band_widened_windows")
+        self.stats.time("dp", time.perf_counter() - startTime)
+        return hit
+
+    def _align_chain_gapped(self,
+                            readId: str,
+                            read: str,
+                            read_rc: Optional[str],
+                            reference: str,
+                            chain: List[Tuple[int, int, bool]]) -> Optional[Alignment]:
+        """
+        Long reads: anchors are taken as matches, the gaps between consecutive anchors
+        are aligned globally and the read ends semi-globally, and the pieces are
+        stitched into one CIGAR. DP memory is bounded by the largest gap, not the read.
+        Returns None if a piece cannot be aligned or the edit rate is too high.
+        """
+        startTime = time.perf_counter()
+        read_len, k = len(read), self.k
+        strand_plus = chain[0][2]
+        q_seq = (read if strand_plus else read_rc).upper()
+
+        # 1) Anchors -> colinear matched blocks (y, r, length) on the oriented read;
+        #    overlapping anchors on one diagonal merge, conflicting ones are dropped
+        blocks: List[List[int]] = []
+        for r, q, _ in sorted(chain, key=lambda a: a[0]):
+            y = q if strand_plus else read_len - q - k
+            if blocks:
+                by, br, bl = blocks[-1]
+                if y - r == by - br and y <= by + bl:
+                    blocks[-1][2] = max(bl, y + k - by)
+                    continue
+                if y < by + bl or r < br + bl:
+                    continue
+            blocks.append([y, r, k])
+
+        ops: List[str] = []
+        score = 0
+
+        # 2) Read start up to the first block, free start on the reference
+        y0, r0, _ = blocks[0]
+        pad = self._end_band(y0)
+        t_lo = max(0, r0 - y0 - pad)
+        res = self._align_piece(q_seq[:y0], reference[t_lo:r0].upper(), (r0 - t_lo) - y0, pad, True, False)
+        if res is None:
+            return None
+        ref_start = t_lo + res["t_start"] if res["ops"] else r0
+        ops += res["ops"]
+        score += res["score"]
+
+        for b, (y, r, length) in enumerate(blocks):
+            # 3) The anchored block itself (minimizer hits are exact barring collisions)
+            ops += ['M'] * length
+            score += ungapped_mismatches(q_seq[y:y + length], reference[r:r + length])
+            if b + 1 == len(blocks):
+                break
+            # 4) Global alignment of the gap to the next block
+            ny, nr, _ = blocks[b + 1]
+            q_gap, t_gap = q_seq[y + length:ny], reference[r + length:nr].upper()
+            band = abs(len(t_gap) - len(q_gap)) + self.min_band
+            self.stats.count("long_gaps")
+            self.stats.peak("long_gap_cells", len(q_gap) * min(len(t_gap) + 1, 2 * band + 1))
+            res = self._align_piece(q_gap, t_gap, 0, band, False, False)
+            if res is None:
+                return None
+            ops += res["ops"]
+            score += res["score"]
+
+        # 5) Last block to the read end, free end on the reference
+        y, r, length = blocks[-1]
+        ye, re_ = y + length, r + length
+        pad = self._end_band(read_len - ye)
+        res = self._align_piece(q_seq[ye:], reference[re_:re_ + (read_len - ye) + pad].upper(), 0, pad, False, True)
+        if res is None:
+            return None
+        ref_end = re_ + res["t_end"] if res["ops"] else re_
+        ops += res["ops"]
+        score += res["score"]
+
+        self.stats.count("long_chains")
+        self.stats.time("long_align", time.perf_counter() - startTime)
+        if score / max(1, read_len) > self.max_edit_rate:
+            return None
+        if not strand_plus:
+            ops = ops[::-1]   # express operations over the original (forward) read
+        return Alignment(
+            readId=readId,
+            ref_start=ref_start,
+            ref_end=ref_end,
+            strand_plus=strand_plus,
+            cigar=compress_cigar(ops),
+            mapped=True,
+            edit_distance=score
+        )
+
+    def _align_piece(self, q: str, t: str, diag: int, band: int, free_start: bool, free_end: bool):
+        # one stretch between anchors (or a read end); the band doubles if the traceback escapes
+        if not q:
+            # nothing left of the read: skipped reference bases only count between anchors
+            pinned = 0 if (free_start or free_end) else len(t)
+            return {"score": pinned, "ops": ['D'] * pinned, "t_start": 0, "t_end": pinned}
+        while True:
+            res = self._banded_semiglobal(q, t, diag, band, free_start=free_start, free_end=free_end)
+            if res is not None or band >= max(len(q), len(t)):
+                return res
+            band *= 2
+            self.stats.count("band_widenings")
+
+    def _reject_chain(self, read_positions: np.ndarray, read_len: int) -> bool:
+        # cheap pre-extension filters on the anchors of a chain's locus (locus_read_positions)
+        if len(read_positions) < self.min_chain_anchors:
+            self.stats.count("filter_anchors")
+            return True
+        if self.min_chain_coverage > 0 and anchor_coverage(read_positions.tolist(), self.k) < self.min_chain_coverage * read_len:
+            self.stats.count("filter_coverage")
+            return True
+        return False
+
+    def _qgram_rejects(self, q_seq: str, reference: str, chain: List[Tuple[int, int, bool]]) -> bool:
+        # True if no alignment inside any window this chain may widen to can pass max_edit_rate
+        ref_lo, ref_hi, _ = construct_extension_window(chain, len(q_seq), self.max_band, self.k)
+        startTime = time.perf_counter()
+        bound = qgram_lower_bound(q_seq, reference[max(0, ref_lo):max(0, ref_hi)], self.qgram_q)
+        self.stats.time("qgram", time.perf_counter() - startTime)
+        self.stats.count("qgram_checks")
+        if bound > self.max_edit_rate * len(q_seq):
+            self.stats.count("filter_qgram")
+            return True
+        return False
+
+    def _chain_band(self, chain: List[Tuple[int, int, bool]], read_len: int) -> int:
+        # room for the chain's own diagonal spread plus indels in a few percent of the read
+        diagonals = [r - q if same else r + q for r, q, same in chain]
+        return self._end_band(read_len, max(diagonals) - min(diagonals))
+
+    def _end_band(self, length: int, spread: int = 0) -> int:
+        band = spread + math.ceil(self.band_rate * length)
+        return min(self.max_band, max(self.min_band, band))
+
+    def _align_ungapped(self,
+                        readId: str,
+                        q_seq: str,
+                        reference: str,
+                        chain: List[Tuple[int, int, bool]]) -> Optional[Alignment]:
+        """
+        Place the oriented read on the chain's diagonal without gaps.
+        Only tried for chains whose anchors span at least half of the read.
+        Returns None if the chain is too short, the placement leaves the reference,
+        or there are more than ungapped_max_rate mismatches.
+        """
+        read_len = len(q_seq)
+        # anchors are sorted by read position
+        if chain[-1][1] + self.k - chain[0][1] < read_len // 2:
+            return None
+
+        r0, q0, same = chain[0]
+        # minus strand: the anchor's k-mer ends where the reverse-complemented read starts
+        ref_start = r0 - q0 if same else r0 + q0 + self.k - read_len
+        ref_end = ref_start + read_len
+        if ref_start < 0 or ref_end > len(reference):
+            return None
+
+        startTime = time.perf_counter()
+        mismatches = ungapped_mismatches(q_seq, reference[ref_start:ref_end])
+        self.stats.time("ungapped", time.perf_counter() - startTime)
+        self.stats.count("ungapped_attempts")
+        if mismatches > self.ungapped_max_rate * read_len:
+            return None
+
+        self.stats.count("ungapped_hits")
+        return Alignment(
+            readId=readId,
+            ref_start=ref_start,
+            ref_end=ref_end,
+            strand_plus=same,
+            cigar=f"{read_len}M",
+            mapped=True,
+            edit_distance=mismatches
+        )
+
+    def _align_in_window(self,
+                         readId: str,
+                         q_seq: str,
+                         reference: str,
+                         ref_lo: int,
+                         ref_hi: int,
+                         strand_plus: bool,
+                         diag: Optional[int],
+                         band: Optional[int],
+                         widen: bool = False) -> Tuple[Optional[Alignment], bool]:
+        """
+        Align q_seq inside reference[ref_lo:ref_hi], banded around local diagonal diag.
+        Returns (alignment or None, escaped). With widen=True a window whose optimal
+        alignment may leave the band is not aligned but reported as escaped, so the
+        caller can retry with a wider band; otherwise the banded DP decides.
+        """
+        # clamp the window to the reference, the diagonal moves with a clipped start
+        if diag is not None and ref_lo < 0:
+            diag += ref_lo
         ref_lo = max(0, ref_lo)
-        ref_hi = min(ref_len, ref_hi)
+        ref_hi = min(len(reference), ref_hi)
         if ref_hi <= ref_lo:
-            return invalidAlignment
-
-        # # 2) Orient read
-        # q_seq = read if strand_plus else rc(read)
+            return None, False
         t_seq = reference[ref_lo:ref_hi]
-        diag = min_pad
 
-        if strand_plus:
-            q_seq = read
-        else:
-            q_seq = rc(read)
-
-        # 3) Call DP
-        res = self._banded_semiglobal(q_seq, t_seq, diag_est_local=diag, band=15)
+        # 3) Bit-parallel score first: it is a lower bound of the banded score, so
+        #    windows failing the edit-rate filter never reach the traceback DP
+        q_seq, t_seq = q_seq.upper(), t_seq.upper()
+        lower, j_end = myers_semiglobal(q_seq, t_seq)
+        if self.profile:
+            self.stats.count("bitparallel_cells", len(q_seq) * len(t_seq))
+        if lower / max(1, len(q_seq)) > self.max_edit_rate:
+            return None, False
+        holds = band_holds(len(q_seq), len(t_seq), diag, band, lower, j_end)
+        if not holds and widen:
+            return None, True
+        res = self._traceback(q_seq, t_seq, diag, band, lower, j_end, holds)
         if not res:
-            return invalidAlignment
-        
+            # the traceback left the band at its widest
+            self.stats.count("band_lost")
+            return None, False
+
         score = res["score"]                     # total edit distance over the whole read
         m = max(1, len(q_seq))                   # safety: avoid div-by-zero for empty reads
         edit_rate = score / m
         if edit_rate > self.max_edit_rate:
-            return invalidAlignment
+            return None, False
 
         # 4) Map back to absolute coords and build CIGAR in forward-read order
         ref_start = ref_lo + res["t_start"]
@@ -145,91 +697,154 @@ class Extender:
             ops = ops[::-1]   # express operations over the original (forward) read
         cigar = compress_cigar(ops)
 
-        endTime = time.perf_counter()
-        elapsedTime = endTime - startTime
-
         return Alignment(
             readId=readId,
             ref_start=ref_start,
             ref_end=ref_end,
             strand_plus=strand_plus,
             cigar=cigar,
-            mapped=True
-        )
+            mapped=True,
+            edit_distance=score
+        ), False
+
+    @staticmethod
+    def _same_locus(a: Tuple[int, int, bool], b: Tuple[int, int, bool], read_len: int) -> bool:
+        # windows are (ref_lo, ref_hi, strand_plus); overlapping by more than half a read => same locus
+        return a[2] == b[2] and abs(a[0] - b[0]) < max(1, read_len // 2)
+
+    def _traceback(self,
+                   q: str,
+                   t: str,
+                   diag_est_local: Optional[int],
+                   band: Optional[int],
+                   score: int,
+                   j_end: int,
+                   holds: bool):
+        """
+        Same result as _banded_semiglobal(q, t, diag_est_local, band), given the unbanded
+        score and end column from myers_semiglobal and band_holds(...) for them.
+        If every optimal alignment ending at j_end fits in the band, the banded optimum,
+        end column and traceback equal the unbanded ones, and only cells within +-score
+        diagonals of the end can lie on (or tie with) such a path, so the DP runs on that
+        thin slice of t only. Otherwise the full banded DP decides.
+        """
+        m = len(q)
+        if not holds:
+            return self._banded_semiglobal(q, t, diag_est_local=diag_est_local, band=band)
+
+        j_lo = max(0, j_end - m - score)
+        res = self._banded_semiglobal(q, t[j_lo:j_end], diag_est_local=j_end - j_lo - m, band=score)
+        if res and j_lo:
+            res["t_start"] += j_lo
+            res["t_end"] += j_lo
+            res["t_steps"] = [s + j_lo for s in res["t_steps"]]
+        return res
+
+    def _dp_buffers(self, n: int, cells: int, m: int):
+        """
+        Per-worker DP scratch space, grown on demand and reused by every window:
+        two int32 score rows of n entries, a uint8 traceback matrix of `cells`
+        entries and the [lo, hi] band bounds of m rows.
+        """
+        if len(self._dp_rows[0]) < n:
+            size = max(n, 2 * len(self._dp_rows[0]))
+            self._dp_rows = (array('i', bytes(4 * size)), array('i', bytes(4 * size)))
+        if len(self._dp_trace) < cells:
+            self._dp_trace = bytearray(max(cells, 2 * len(self._dp_trace)))
+        if len(self._dp_bounds) < 2 * m:
+            self._dp_bounds = array('i', bytes(4 * max(2 * m, 2 * len(self._dp_bounds))))
+        return self._dp_rows[0], self._dp_rows[1], self._dp_trace, self._dp_bounds
 
     # Banded semi-global alignment
-    def _banded_semiglobal(self, q: str, t: str, diag_est_local: Optional[int], band: Optional[int]):
+    def _banded_semiglobal(self,
+                           q: str,
+                           t: str,
+                           diag_est_local: Optional[int],
+                           band: Optional[int],
+                           free_start: bool = True,
+                           free_end: bool = True):
         """
         Semi-global: global on read, local on reference.
         Edit distance costs: match 0, mismatch 1, gap 1.
         Banded around j ≈ i + diag_est_local.
+        free_start/free_end=False pin the alignment to the first/last reference base
+        (both False = global alignment, e.g. between two anchors).
+        q and t must already be uppercase.
         Returns dict with score, ops (list of 'M','I','D'), t_start/t_end, and t_steps for MD.
+        Scores and traceback live in the preallocated _dp_buffers; cells outside a
+        row's band read as INF.
         """
         m, n = len(q), len(t)
         if m == 0:
             return {"score": 0, "ops": [], "t_start": 0, "t_end": 0, "t_steps": []}
         INF = 10**9
 
-        # Row 0: free start anywhere on reference
-        dp_prev = [0] * (n + 1)
-        parents: list[tuple[int,int,list[int]]] = []
+        unbanded = diag_est_local is None or band is None
+        width = n + 1 if unbanded else min(n + 1, 2 * band + 1)
+        dp_prev, dp_cur, trace, bounds = self._dp_buffers(n + 1, m * width, m)
+        if self.profile:
+            self.stats.count("dp_cells", m * width)
 
-        edge_slack = 0
+        # Row 0: free start anywhere on reference (or pay for skipped reference bases)
+        for j in range(n + 1):
+            dp_prev[j] = 0 if free_start else j
+        p_lo, p_hi = 0, n
 
         for i in range(1, m + 1):
-            dp_cur = [INF] * (n + 1)
-
-            if diag_est_local is None or band is None:
+            if unbanded:
                 # Unbanded row
                 j_lo, j_hi = 0, n
             else:
                 center = max(0, min(n, i + diag_est_local))
-                j_lo = max(0, center - (band + edge_slack))
-                j_hi = min(n, center + (band + edge_slack))
+                j_lo = max(0, center - band)
+                j_hi = min(n, center + band)
                 if j_lo > j_hi:
                     j_lo = j_hi = center
-
-            row_dir = [0] * (j_hi - j_lo + 1)
+            bounds[2 * i - 2] = j_lo
+            bounds[2 * i - 1] = j_hi
+            row = (i - 1) * width - j_lo
+            qi = q[i - 1]
 
             for j in range(j_lo, j_hi + 1):
-                ins = dp_prev[j] + 1
-                left = dp_cur[j - 1] + 1 if j > 0 else INF
+                ins = (dp_prev[j] if p_lo <= j <= p_hi else INF) + 1
                 if j > 0:
-                    qi = q[i - 1].upper()
-                    tj = t[j - 1].upper()
-                    sub = 0 if (qi == tj and qi != 'N') else 1
-                    diag = dp_prev[j - 1] + sub
+                    left = (dp_cur[j - 1] if j > j_lo else INF) + 1
+                    sub = 0 if (qi == t[j - 1] and qi != 'N') else 1
+                    diag = (dp_prev[j - 1] if p_lo < j <= p_hi + 1 else INF) + sub
                 else:
-                    diag = INF
+                    left = diag = INF
 
                 if diag <= left and diag <= ins:
                     dp_cur[j] = diag
-                    row_dir[j - j_lo] = 2  # 'M'
+                    trace[row + j] = 2  # 'M'
                 elif left <= ins:
                     dp_cur[j] = left
-                    row_dir[j - j_lo] = 1  # 'D'
+                    trace[row + j] = 1  # 'D'
                 else:
                     dp_cur[j] = ins
-                    row_dir[j - j_lo] = 0  # 'I'
+                    trace[row + j] = 0  # 'I'
 
-            parents.append((j_lo, j_hi, row_dir))
-            dp_prev = dp_cur
+            dp_prev, dp_cur = dp_cur, dp_prev
+            p_lo, p_hi = j_lo, j_hi
 
-        # end anywhere on reference
-        j_end = min(range(n + 1), key=lambda j: dp_prev[j])
-        score = dp_prev[j_end]
+        # end anywhere on reference (first minimum; columns outside the last band are INF)
+        j_end, score = 0, INF
+        for j in range(p_lo, p_hi + 1):
+            if dp_prev[j] < score and (free_end or j == n):
+                j_end, score = j, dp_prev[j]
+        if score >= INF:
+            return None
 
         # backtrack
         i, j = m, j_end
         ops_rev, t_steps_rev = [], []
         while i > 0:
-            j_lo, j_hi, row_dir = parents[i - 1]
+            j_lo, j_hi = bounds[2 * i - 2], bounds[2 * i - 1]
             if j < j_lo or j > j_hi:
-                # if we somehow step outside the stored band, fall back by recomputing
-                # should be rare if band is reasonable, can figure out later
+                # stepped outside the stored band: the caller widens the band
                 return None
             else:
-                d = row_dir[j - j_lo]
+                d = trace[(i - 1) * width + j - j_lo]
 
             if d == 0:        # 'I' from (i-1, j)
                 ops_rev.append('I')
@@ -245,6 +860,11 @@ class Extender:
                 i, j = i - 1, j - 1
             else:
                 return None
+        # pinned start: the reference bases before the first read base are deletions
+        while j > 0 and not free_start:
+            ops_rev.append('D')
+            t_steps_rev.append(j)
+            j -= 1
 
         ops = ops_rev[::-1]
         t_steps = t_steps_rev[::-1]
@@ -256,4 +876,4 @@ class Extender:
         else:
             t_start = t_end = j_end
 
-        return {"score": score, "ops": ops, "t_start": t_start, "t_end": t_end, "t_steps": t_steps}
\ No newline at end of file
+        return {"score": score, "ops": ops, "t_start": t_start, "t_end": t_end, "t_steps": t_steps}
@@ -1,18 +1,20 @@
 # cython: boundscheck=False, wraparound=False, nonecheck=False, cdivision=True
 
 cimport cython
-from dataclasses import dataclass
-from typing import List, Tuple, Optional
-from .chainer import Chainer
+from libc.math cimport ceil
+from libc.stdlib cimport calloc, malloc, free
+from libc.stdint cimport uint64_t
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple, Optional, Union
+from .chainer import Chainer, AnchorArrays
+from ..models.stats import MappingStats
+from ..constants.constants import KMERSIZE, WINDOWSIZE
 from array import array
+from time import perf_counter
 import numpy as np
 cimport numpy as np
 
 np.import_array()
-# TODO: 
-# 1. have a reject high edit rates
-# 2. Check the band size and filling
-# 3. check the bucket size for window
 
 # Public datatypes
 @dataclass
@@ -25,10 +27,17 @@ class Alignment:
     mapped: bool            # if this represens a read that was able to be mapped to the reference 
     # New fields needed for SAM Output
     flag: int = 0           # The calculated bitwise flag
-    mapq: int = 99          # Default high quality (90) if mapped, 0 if unmapped
-    pnext: int = 0          #Position of the mate/next read
+    mapq: int = 60          # Default high quality (60) if mapped, 0 if unmapped
+    rnext: str = "*"        # Ref. name of the mate/next read
+    pnext: int = 0          # Position of the mate/next read
     seq: str = "*"          # Segment sequence
     qual: str = "*"         # ASCII of Phred-scaled base quality +33
+    # Candidate-chain bookkeeping (MAPQ estimation)
+    edit_distance: int = -1 # edit distance of this hit over the whole read
+    secondary: List["Alignment"] = field(default_factory=list)  # other distinct hits, best first
+
+MAPQ_UNIQUE = 60            # MAPQ for a hit without any secondary
+MAPQ_PER_EDIT = 10          # MAPQ gained per edit separating the best and second-best hit
 
 
 cdef inline unsigned char _comp_base(unsigned char b) nogil:
@@ -79,7 +88,7 @@ cdef str compress_cigar(list ops):
     out.append(f"{run_c}{run_o}")
     return ''.join(out)
 
-def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int) -> Tuple[int, int, bool]:
+def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int, k: int = KMERSIZE) -> Tuple[int, int, bool]:
     """
     Given a chain of (ref_pos, read_pos, same_strand),
     compute [ref_lo, ref_hi) window and strand sign.
@@ -96,49 +105,372 @@ def construct_extension_window(chain: List[Tuple], read_len: int, pad_bp: int) -
         ref_hi = c + read_len + pad_bp
         strand_plus = True
     else:
-        c = r0 + q0
+        # the anchor's k-mer ends where the reverse-complemented read starts
+        c = r0 + q0 + k
         ref_lo = (c - read_len) - pad_bp
         ref_hi = c + pad_bp
         strand_plus = False
 
     return ref_lo, ref_hi, strand_plus
 
+cpdef int ungapped_mismatches(str q, str t):
+    """
+    Hamming distance of two equal-length sequences (case-insensitive).
+    'N' in q never matches, as in the DP.
+    """
+    cdef Py_ssize_t i, n = min(len(q), len(t))
+    cdef int a, b       # code points: arithmetic on Py_UCS4 would go through str
+    cdef int mismatches = 0
+    for i in range(n):
+        a = <Py_UCS4>q[i]
+        b = <Py_UCS4>t[i]
+        if 97 <= a <= 122:
+            a -= 32
+        if 97 <= b <= 122:
+            b -= 32
+        if a != b or a == 78:   # 'N'
+            mismatches += 1
+    return mismatches
+
+cdef inline int _nt_code(Py_UCS4 c):
+    # A C G T -> 0..3, N -> 4 (never matches), anything else -> -1
+    if c == 65:     # 'A'
+        return 0
+    elif c == 67:   # 'C'
+        return 1
+    elif c == 71:   # 'G'
+        return 2
+    elif c == 84:   # 'T'
+        return 3
+    elif c == 78:   # 'N'
+        return 4
+    return -1
+
+def _myers_semiglobal_py(str q, str t):
+    """
+    Arbitrary-alphabet fallback of myers_semiglobal on Python ints (one int = whole read).
+    """
+    cdef int m = len(q)
+    cdef int score, best, j_end = 0, j
+    cdef dict peq = {}
+    if m == 0:
+        return 0, 0
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    for j, c in enumerate(q):
+        if c != 'N':
+            peq[c] = peq.get(c, 0) | (1 << j)
+    pv, mv = mask, 0
+    score = best = m
+    for j in range(len(t)):
+        eq = peq.get(t[j], 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        if score < best:
+            best = score
+            j_end = j + 1
+    return best, j_end
+
+cpdef tuple myers_semiglobal(str q, str t):
+    """
+    Bit-parallel (Myers/Hyyro) semi-global edit distance: q aligned end-to-end, free
+    start and end on t, in O(len(q)/64) uint64 block operations per text column.
+    Both strings must already be uppercase; 'N' in q never matches (as in the DP).
+    Returns (score, j_end): the minimum of the last DP row and its first column.
+    """
+    cdef Py_ssize_t m = len(q), n = len(t)
+    cdef Py_ssize_t nblocks, i, j, b, last_block
+    cdef int code, hin, hout, score, best, j_end = 0, last_bit
+    cdef uint64_t *peq
+    cdef uint64_t *pv
+    cdef uint64_t *mv
+    cdef uint64_t eq, xv, xh, ph, mh, neg, high = (<uint64_t>1) << 63
+    cdef int *tcodes
+
+    if m == 0:
+        return 0, 0
+
+    # only A/C/G/T/N fit the 5-row Peq table, anything else takes the generic path
+    for i in range(m):
+        if _nt_code(q[i]) < 0:
+            return _myers_semiglobal_py(q, t)
+    tcodes = <int *>malloc(max(n, 1) * sizeof(int))
+    for j in range(n):
+        tcodes[j] = _nt_code(t[j])
+        if tcodes[j] < 0:
+            free(tcodes)
+            return _myers_semiglobal_py(q, t)
+
+    nblocks = (m + 63) // 64
+    last_block = nblocks - 1
+    last_bit = <int>((m - 1) % 64)
+    peq = <uint64_t *>calloc(5 * nblocks, sizeof(uint64_t))
+    pv = <uint64_t *>malloc(nblocks * sizeof(uint64_t))
+    mv = <uint64_t *>malloc(nblocks * sizeof(uint64_t))
+    for i in range(m):
+        code = _nt_code(q[i])
+        if code < 4:
+            peq[code * nblocks + i // 64] |= (<uint64_t>1) << (i % 64)
+    for b in range(nblocks):
+        pv[b] = ~(<uint64_t>0)   # vertical deltas of column 0 are all +1 (D[i][0] = i)
+        mv[b] = 0
+
+    score = best = <int>m
+    for j in range(n):
+        code = tcodes[j]
+        hin = 0                  # row 0 is free on the reference
+        for b in range(nblocks):
+            eq = peq[code * nblocks + b]
+            xv = eq | mv[b]
+            neg = 1 if hin < 0 else 0
+            eq |= neg
+            xh = (((eq & pv[b]) + pv[b]) ^ pv[b]) | eq
+            ph = mv[b] | ~(xh | pv[b])
+            mh = pv[b] & xh
+            if b == last_block:
+                # rows past m in the last block never feed back into rows <= m
+                score += <int>((ph >> last_bit) & 1) - <int>((mh >> last_bit) & 1)
+            else:
+                hout = <int>((ph & high) != 0) - <int>((mh & high) != 0)
+            ph = (ph << 1) | (1 if hin > 0 else 0)
+            mh = (mh << 1) | neg
+            pv[b] = mh | ~(xv | ph)
+            mv[b] = ph & xv
+            hin = hout
+        if score < best:
+            best = score
+            j_end = <int>(j + 1)
+
+    free(peq)
+    free(pv)
+    free(mv)
+    free(tcodes)
+    return best, j_end
+
+cdef bint band_holds(int m, int n, object diag_est_local, object band, int score, int j_end):
+    """
+    True if every optimal alignment ending in column j_end stays inside the band used by
+    _banded_semiglobal. Such a path has cost == score, so with one diagonal step per
+    indel it lives on diagonals [d - score, d + score] around its end diagonal
+    d = j_end - m, never starts left of column 0 and never passes column j_end.
+    """
+    cdef int i, lo, hi, center, diag, bw
+    cdef int d_end = j_end - m
+    if diag_est_local is None or band is None:
+        return True
+    diag = diag_est_local
+    bw = band
+    for i in range(1, m + 1):
+        lo = max(0, i - score, i + d_end - score)
+        hi = min(j_end, i + d_end + score)
+        if lo > hi:
+            continue
+        center = max(0, min(n, i + diag))
+        if lo < center - bw or hi > center + bw:
+            return False
+    return True
+
+# q-gram codes: A C G T -> 0..3, anything else -> 4
+_QGRAM_CODE = np.full(256, 4, dtype=np.int64)
+_QGRAM_CODE[[ord(base) for base in "ACGT"]] = np.arange(4)
+
+def _qgram_counts(s: str, q: int) -> np.ndarray:
+    # occurrences of every q-gram of s, indexed by its base-5 code
+    codes = _QGRAM_CODE[np.frombuffer(s.upper().encode("ascii", "replace"), dtype=np.uint8)]
+    n = len(codes) - q + 1
+    grams = codes[:n].copy()
+    for i in range(1, q):
+        grams *= 5
+        grams += codes[i:i + n]
+    return np.bincount(grams, minlength=5 ** q)
+
+def qgram_lower_bound(p: str, t: str, q: int) -> int:
+    """
+    Alignment-free lower bound of the semi-global edit distance of p inside t
+    (q-gram lemma): an occurrence with e edits leaves at least len(p) - q + 1 - q*e
+    of p's q-grams intact, and each of them also occurs in t.
+    """
+    if len(p) < q:
+        return 0
+    shared = int(np.minimum(_qgram_counts(p, q), _qgram_counts(t, q)).sum()) if len(t) >= q else 0
+    return max(0, -(-(len(p) - q + 1 - shared) // q))
+
+def anchor_coverage(read_positions: Iterable[int], k: int) -> int:
+    """
+    Read bases covered by the k-mers of anchors at these read positions.
+    """
+    covered, end = 0, 0
+    for q in sorted(read_positions):
+        if q + k > end:
+            covered += q + k - max(q, end)
+            end = q + k
+    return covered
+
+def edit_lower_bound(read_positions: Iterable[int], read_len: int, k: int, w: int) -> int:
+    """
+    Edits an alignment of the read needs at least, given the read positions of every
+    anchor on its diagonals: an error-free stretch of w + k - 1 read bases holds a whole
+    minimizer window, whose minimizer would have been one of those anchors, so every
+    uncovered stretch of length g carries at least g // (w + k - 1) edits.
+    Assumes every shared minimizer was looked up (no occurrence cutoff or quality mask).
+    """
+    span = w + k - 1
+    bound, end = 0, 0
+    for q in sorted(read_positions):
+        if q > end:
+            bound += (q - end) // span
+        end = max(end, q + k)
+    return bound + max(0, read_len - end) // span
+
+def anchor_diagonals(anchors: Union[List[Tuple[int, int, bool]], AnchorArrays]
+                     ) -> Dict[bool, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Every anchor by strand: its diagonal (as in Chainer.chains), in ascending order,
+    and its read position.
+    """
+    if isinstance(anchors, tuple):
+        ref_pos, read_pos, same = (np.asarray(a) for a in anchors)
+    else:
+        table = np.array(anchors, dtype=np.int64).reshape(-1, 3)
+        ref_pos, read_pos, same = table[:, 0], table[:, 1], table[:, 2].astype(bool)
+    diagonals = {}
+    for strand in (True, False):
+        r, q = ref_pos[same == strand].astype(np.int64), read_pos[same == strand].astype(np.int64)
+        key = q - r if strand else q + r
+        order = np.argsort(key, kind="stable")
+        diagonals[strand] = (key[order], q[order])
+    return diagonals
+
+def locus_read_positions(diagonals: Dict[bool, Tuple[np.ndarray, np.ndarray]],
+                         chain: List[Tuple[int, int, bool]], band: int) -> np.ndarray:
+    """
+    Read positions of the anchors of the chain's locus: the alignments its window can
+    hold stay within `band` diagonals of the chain, so every anchor there counts,
+    including the anchors of a neighbouring chain split off by an indel.
+    """
+    same = chain[0][2]
+    keys = [q - r if same else q + r for r, q, _ in chain]
+    diagonal, read_pos = diagonals[same]
+    lo = np.searchsorted(diagonal, min(keys) - band, side="left")
+    hi = np.searchsorted(diagonal, max(keys) + band, side="right")
+    return read_pos[lo:hi]
+
+def locus_edit_lower_bound(diagonals: Dict[bool, Tuple[np.ndarray, np.ndarray]],
+                           chain: List[Tuple[int, int, bool]], read_len: int, k: int, w: int, band: int) -> int:
+    """
+    edit_lower_bound of the alignments the chain's window can hold (locus_read_positions).
+    """
+    return edit_lower_bound(locus_read_positions(diagonals, chain, band).tolist(), read_len, k, w)
+
+cdef bint _same_locus(tuple a, tuple b, int read_len):
+    # windows are (ref_lo, ref_hi, strand_plus); overlapping by more than half a read => same locus
+    return a[2] == b[2] and abs(<int>a[0] - <int>b[0]) < max(1, read_len // 2)
+
+cpdef int estimate_mapq(object best):
+    """
+    MAPQ from the edit-distance gap to the best secondary hit:
+    unique hits get 60, ties get 0, each extra edit on the runner-up adds MAPQ_PER_EDIT.
+    """
+    cdef int gap
+    if not best.secondary:
+        return MAPQ_UNIQUE
+    gap = best.secondary[0].edit_distance - best.edit_distance
+    return max(0, min(MAPQ_UNIQUE, MAPQ_PER_EDIT * gap))
+
 # Extender implementation
 class Extender:
     """
-    1) Chains anchors (ref_pos, read_pos, same_strand) to pick a best colinear seed.
-    2) Creates a small reference window around the chain.
-    3) Semi-global (global-on-read) banded edit-distance alignment within that window.
+    1) Chains anchors (ref_pos, read_pos, same_strand) into candidate colinear seeds, best first.
+    2) Creates a small reference window around each chain.
+    3) Chains spanning the read are first compared base by base on their diagonal;
+       reads within ungapped_max_rate mismatches get an all-M CIGAR without any DP.
+    4) Otherwise semi-global (global-on-read) banded edit-distance alignment within that window.
+       - the band follows the chain's diagonal spread and the read length, and is
+         doubled (with the window) up to max_band while the alignment escapes it
+    In long-read mode chains tolerate gaps (Chainer.gapped_chains) and only the gaps
+    between consecutive anchors and the read ends are aligned, then stitched together.
        - costs: match=0, mismatch=1, gap=1
-       - returns: Alignment with CIGAR and absolute coords.
+       - stops once no remaining chain can reach the best hit's edit distance
+         (locus_edit_lower_bound), unless seeds are incomplete (complete_seeds=False)
+       - optionally, chains with too few anchors or too little read coverage in their locus
+         (counting the chains an indel split off), or a q-gram lower bound above the
+         edit-rate limit are dropped before any alignment
+       - returns: Alignment with CIGAR, absolute coords, MAPQ and secondary hits.
     """
-    def __init__(self, max_edit_rate: float = 1.0):
+    def __init__(self,
+                 max_edit_rate: float = 0.40,
+                 max_chains: int = 5,
+                 k: int = KMERSIZE,
+                 w: int = WINDOWSIZE,
+                 ungapped_max_rate: float = 0.05,
+                 min_band: int = 8,
+                 band_rate: float = 0.05,
+                 max_band: int = 128,
+                 long_reads: bool = False,
+                 min_chain_anchors: int = 1,
+                 min_chain_coverage: float = 0.0,
+                 qgram_filter: bool = False,
+                 complete_seeds: bool = True,
+                 profile: bool = False):
         self.chainer = Chainer()
         self.max_edit_rate = max_edit_rate
+        self.max_chains = max_chains            # candidate chains considered per read
+        self.k = k                              # k-mer size of the anchors
+        self.w = w                              # minimizer window of the anchors
+        self.ungapped_max_rate = ungapped_max_rate  # mismatch rate accepted without DP
+        self.min_band = min_band                # narrowest DP band (and window padding)
+        self.band_rate = band_rate              # band grows with the read length at this rate
+        self.max_band = max_band                # widening stops here
+        self.long_reads = long_reads            # gap-tolerant chains aligned piecewise
+        self.min_chain_anchors = min_chain_anchors    # chains with fewer anchors in their locus are not aligned
+        self.min_chain_coverage = min_chain_coverage  # ... nor chains whose locus k-mers cover less of the read
+        # q-gram length of the lower-bound filter: the lemma can only prove an edit rate
+        # below 1/q, so take the longest (most selective) q that still reaches max_edit_rate;
+        # 2-grams are shared by any two DNA windows, below q=3 the filter is off
+        self.qgram_q = min(6, int(ceil(1 / max_edit_rate)) - 1) if qgram_filter and max_edit_rate > 0 else 0
+        if self.qgram_q < 3:
+            self.qgram_q = 0
+        # every minimizer shared with the reference is an anchor (no occurrence cutoff or
+        # quality mask): the early exit counts a missing anchor as edits and needs this
+        self.complete_seeds = complete_seeds
+        self.stats = MappingStats()
+        self.profile = profile                  # per-stage timers and counters, see MappingStats.profile_report
+        # DP scratch buffers, see _dp_buffers
+        self._dp_rows = np.zeros((2, 0), dtype=np.int32)
+        self._dp_trace = np.zeros(0, dtype=np.uint8)
+        self._dp_bounds = np.zeros(0, dtype=np.int32)
 
     # Public API
     def extend(self,
                readId: str,
                read: str,
                reference: str,
-               anchors: List[Tuple[int, int, bool]]) -> Alignment:
+               object anchors) -> Alignment:
         """
         :param read:      read sequence (A/C/G/T/N)
         :param reference: whole reference string
-        :param anchors:   list of (ref_pos, read_pos, same_strand)
-        :return: Alignment (mapped=False if chain fails or edit rate too high)
+        :param anchors:   list of (ref_pos, read_pos, same_strand), or the same as arrays (Minimizer.anchors_of)
+        :return: Alignment (mapped=False if no chain aligns within the edit rate)
         """
         cdef object invalidAlignment
-        cdef list chain
-        cdef int read_len, ref_len
-        cdef int min_pad
-        cdef int ref_lo, ref_hi
-        cdef bint strand_plus
-        cdef str t_seq, q_seq
-        cdef dict res
-        cdef double score, edit_rate
-        cdef int ref_start, ref_end
-        cdef list ops
+        cdef list chains, chain, hits, visited
+        cdef object hit, best = None
+        cdef object read_rc = None
+        cdef object diagonals = None    # anchor_diagonals, once the filters or early exit need them
+        cdef tuple window
+        cdef int read_len = len(read)
+        cdef int c, n_chains, n_kept = 0
+        cdef double startTime = perf_counter()
 
         invalidAlignment = Alignment(
             readId=readId,
@@ -149,34 +481,376 @@ class Extender:
             mapped=False
         )
 
-        chain = self.chainer.chain(anchors)
-        if not chain:
+        if self.long_reads:
+            chains = self.chainer.gapped_chains(anchors, self.k, self.max_chains)
+        else:
+            chains = self.chainer.chains(anchors, self.max_chains)
+        if self.profile:
+            self._profile_chains(chains, startTime)
+        if not chains:
             return invalidAlignment
 
-        read_len = len(read)
-        ref_len = len(reference)
-        min_pad = 10
+        n_chains = len(chains)
+        hits = []
+        visited = []    # windows already aligned
+
+        for c in range(n_chains):
+            chain = chains[c]
+            if self.min_chain_anchors > 1 or self.min_chain_coverage > 0:
+                if diagonals is None:
+                    diagonals = anchor_diagonals(anchors)
+                if self._reject_chain(locus_read_positions(diagonals, chain, self.max_band), read_len):
+                    continue
+            n_kept += 1
+            # Chains on a neighbouring diagonal (e.g. split by an indel) share the window
+            # of an earlier chain and would only rediscover the same hit
+            window = construct_extension_window(chain, read_len, 0, self.k)
+            if any(_same_locus(window, v, read_len) for v in visited):
+                continue
+            visited.append(window)
+
+            if not chain[0][2] and read_rc is None:
+                read_rc = rc(read)
+            if self.long_reads:
+                hit = self._align_chain_gapped(readId, read, read_rc, reference, chain)
+            else:
+                hit = self._align_chain(readId, read, read_rc, reference, chain)
+            if hit is not None:
+                hits.append(hit)
+                if best is None or hit.edit_distance < best.edit_distance:
+                    best = hit
+
+            # Early termination: done once every remaining chain needs more edits than
+            # our best hit, so none of them could beat or tie it
+            if self.complete_seeds and best is not None and c + 1 < n_chains:
+                if diagonals is None:
+                    diagonals = anchor_diagonals(anchors)
+                if all(best.edit_distance < locus_edit_lower_bound(diagonals, chains[j], read_len, self.k, self.w,
+                                                                   self.max_band)
+                       for j in range(c + 1, n_chains)):
+                    break
+
+        if n_kept == 0:
+            self.stats.count("filter_rejected_reads")
+        if best is None:
+            self.stats.time("extend", perf_counter() - startTime)
+            return invalidAlignment
+
+        best.secondary = sorted([h for h in hits if h is not best], key=lambda h: h.edit_distance)
+        best.mapq = estimate_mapq(best)
+        self.stats.time("extend", perf_counter() - startTime)
+        return best
+
+    def _profile_chains(self, chains, startTime):
+        # chaining time (extend starts by chaining) and chain sizes of one read
+        self.stats.time("chain", perf_counter() - startTime)
+        self.stats.count("chained_reads")
+        self.stats.count("chains", len(chains))
+        for chain in chains:
+            self.stats.count("chain_anchors", len(chain))
+            self.stats.peak("chain_anchors_max", len(chain))
+
+    def align_window(self, readId, str read, str reference, int ref_lo, int ref_hi, bint strand_plus):
+        """
+        Align the read anywhere inside reference[ref_lo:ref_hi] on the given strand
+        without seeds (unbanded), e.g. to rescue a mate next to its partner.
+        Returns None if the window is empty or the edit rate is too high.
+        """
+        cdef str q_seq = read if strand_plus else rc(read)
+        hit, _ = self._align_in_window(readId, q_seq, reference, ref_lo, ref_hi, strand_plus, None, None)
+        return hit
+
+    def _align_chain(self, readId, str read, object read_rc, str reference, list chain):
+        """
+        Align the read inside the window of a single chain.
+        Returns None if the window is empty, the DP fails, or the edit rate is too high.
+        """
+        cdef int read_len = len(read)
+        cdef int ref_lo, ref_hi, band, initial_band
+        cdef int max_band = self.max_band
+        cdef bint strand_plus = chain[0][2]
+        cdef bint escaped
+        cdef str q_seq
+        cdef object hit
+        cdef double startTime
+
+        # 1) Orient read
+        if strand_plus:
+            q_seq = read
+        else:
+            q_seq = read_rc
+
+        # 2) Most reads only carry mismatches: try the chain's diagonal as is
+        hit = self._align_ungapped(readId, q_seq, reference, chain)
+        if hit is not None:
+            return hit
+
+        # 3) Alignment-free lower bound over the widest window the band can grow to
+        if self.qgram_q and self._qgram_rejects(q_seq, reference, chain):
+            return None
+
+        # 4) Window around chain, padded by the band, widened while the alignment escapes it
+        startTime = perf_counter()
+        band = initial_band = self._chain_band(chain, read_len)
+        self.stats.count("dp_windows")
+        self.stats.count("band_initial", band)
+        while True:
+            ref_lo, ref_hi, strand_plus = construct_extension_window(chain, read_len, band, self.k)
+            hit, escaped = self._align_in_window(readId, q_seq, reference, ref_lo, ref_hi, strand_plus,
+                                                 band, band, band < max_band)
+            if not escaped:
+                break
+            band = min(max_band, 2 * band)
+            self.stats.count("band_widenings")
+        if band > initial_band:
+            self.stats.count("band_widened_windows")
+        self.stats.time("dp", perf_counter() - startTime)
+        return hit
 
-        # 1) Window around chain (then clamp to reference)
-        ref_lo, ref_hi, strand_plus = construct_extension_window(chain, read_len, min_pad)
+    def _reject_chain(self, object read_positions, int read_len):
+        # cheap pre-extension filters on the anchors of a chain's locus (locus_read_positions)
+        if len(read_positions) < self.min_chain_anchors:
+            self.stats.count("filter_anchors")
+            return True
+        if self.min_chain_coverage > 0 and anchor_coverage(read_positions.tolist(), self.k) < self.min_chain_coverage * read_len:
+            self.stats.count("filter_coverage")
+            return True
+        return False
+
+    def _qgram_rejects(self, str q_seq, str reference, list chain):
+        # True if no alignment inside any window this chain may widen to can pass max_edit_rate
+        ref_lo, ref_hi, _ = construct_extension_window(chain, len(q_seq), self.max_band, self.k)
+        startTime = perf_counter()
+        bound = qgram_lower_bound(q_seq, reference[max(0, ref_lo):max(0, ref_hi)], self.qgram_q)
+        self.stats.time("qgram", perf_counter() - startTime)
+        self.stats.count("qgram_checks")
+        if bound > self.max_edit_rate * len(q_seq):
+            self.stats.count("filter_qgram")
+            return True
+        return False
+
+    def _chain_band(self, list chain, int read_len):
+        # room for the chain's own diagonal spread plus indels in a few percent of the read
+        cdef int r, q, d, lo, hi, band
+        cdef bint same
+        lo = hi = 0
+        for idx, (r, q, same) in enumerate(chain):
+            d = r - q if same else r + q
+            if idx == 0 or d < lo:
+                lo = d
+            if idx == 0 or d > hi:
+                hi = d
+        return self._end_band(read_len, hi - lo)
+
+    def _end_band(self, int length, int spread=0):
+        cdef int band = spread + <int>ceil(self.band_rate * length)
+        return min(self.max_band, max(self.min_band, band))
+
+    def _align_chain_gapped(self, readId, str read, object read_rc, str reference, list chain):
+        """
+        Long reads: anchors are taken as matches, the gaps between consecutive anchors
+        are aligned globally and the read ends semi-globally, and the pieces are
+        stitched into one CIGAR. DP memory is bounded by the largest gap, not the read.
+        Returns None if a piece cannot be aligned or the edit rate is too high.
+        """
+        cdef double startTime = perf_counter()
+        cdef int read_len = len(read)
+        cdef int k = self.k
+        cdef bint strand_plus = chain[0][2]
+        cdef str q_seq, q_gap, t_gap
+        cdef list blocks, ops, block
+        cdef int r, q, y, by, br, bl, length, ny, nr, y0, r0, t_lo, pad, band, ye, re_
+        cdef int score = 0, ref_start, ref_end
+        cdef Py_ssize_t b, n_blocks
+        cdef dict res
+
+        q_seq = (read if strand_plus else read_rc).upper()
+
+        # 1) Anchors -> colinear matched blocks (y, r, length) on the oriented read;
+        #    overlapping anchors on one diagonal merge, conflicting ones are dropped
+        blocks = []
+        for r, q, _ in sorted(chain, key=lambda a: a[0]):
+            y = q if strand_plus else read_len - q - k
+            if blocks:
+                block = blocks[len(blocks) - 1]
+                by, br, bl = block
+                if y - r == by - br and y <= by + bl:
+                    block[2] = max(bl, y + k - by)
+                    continue
+                if y < by + bl or r < br + bl:
+                    continue
+            blocks.append([y, r, k])
+        n_blocks = len(blocks)
+
+        ops = []
+
+        # 2) Read start up to the first block, free start on the reference
+        y0, r0, _ = blocks[0]
+        pad = self._end_band(y0)
+        t_lo = max(0, r0 - y0 - pad)
+        res = self._align_piece(q_seq[:y0], reference[t_lo:r0].upper(), (r0 - t_lo) - y0, pad, True, False)
+        if res is None:
+            return None
+        ref_start = t_lo + res["t_start"] if res["ops"] else r0
+        ops += res["ops"]
+        score += res["score"]
+
+        for b in range(n_blocks):
+            y, r, length = blocks[b]
+            # 3) The anchored block itself (minimizer hits are exact barring collisions)
+            ops += ['M'] * length
+            score += ungapped_mismatches(q_seq[y:y + length], reference[r:r + length])
+            if b + 1 == n_blocks:
+                break
+            # 4) Global alignment of the gap to the next block
+            ny, nr, _ = blocks[b + 1]
+            q_gap = q_seq[y + length:ny]
+            t_gap = reference[r + length:nr].upper()
+            band = abs(len(t_gap) - len(q_gap)) + self.min_band
+            self.stats.count("long_gaps")
+            self.stats.peak("long_gap_cells", len(q_gap) * min(len(t_gap) + 1, 2 * band + 1))
+            res = self._align_piece(q_gap, t_gap, 0, band, False, False)
+            if res is None:
+                return None
+            ops += res["ops"]
+            score += res["score"]
+
+        # 5) Last block to the read end, free end on the reference
+        y, r, length = blocks[n_blocks - 1]
+        ye = y + length
+        re_ = r + length
+        pad = self._end_band(read_len - ye)
+        res = self._align_piece(q_seq[ye:], reference[re_:re_ + (read_len - ye) + pad].upper(), 0, pad, False, True)
+        if res is None:
+            return None
+        ref_end = re_ + res["t_end"] if res["ops"] else re_
+        ops += res["ops"]
+        score += res["score"]
+
+        self.stats.count("long_chains")
+        self.stats.time("long_align", perf_counter() - startTime)
+        if <double>score / max(1, read_len) > self.max_edit_rate:
+            return None
+        if not strand_plus:
+            ops = ops[::-1]   # express operations over the original (forward) read
+        return Alignment(
+            readId=readId,
+            ref_start=ref_start,
+            ref_end=ref_end,
+            strand_plus=strand_plus,
+            cigar=compress_cigar(ops),
+            mapped=True,
+            edit_distance=score
+        )
+
+    def _align_piece(self, str q, str t, int diag, int band, bint free_start, bint free_end):
+        # one stretch between anchors (or a read end); the band doubles if the traceback escapes
+        cdef int pinned
+        cdef object res
+        if not q:
+            # nothing left of the read: skipped reference bases only count between anchors
+            pinned = 0 if (free_start or free_end) else len(t)
+            return {"score": pinned, "ops": ['D'] * pinned, "t_start": 0, "t_end": pinned}
+        while True:
+            res = self._banded_semiglobal(q, t, diag, band, free_start, free_end)
+            if res is not None or band >= max(len(q), len(t)):
+                return res
+            band *= 2
+            self.stats.count("band_widenings")
+
+    def _align_ungapped(self, readId, str q_seq, str reference, list chain):
+        """
+        Place the oriented read on the chain's diagonal without gaps.
+        Only tried for chains whose anchors span at least half of the read.
+        Returns None if the chain is too short, the placement leaves the reference,
+        or there are more than ungapped_max_rate mismatches.
+        """
+        cdef int read_len = len(q_seq)
+        cdef int k = self.k
+        cdef int r0, q0, ref_start, ref_end, mismatches
+        cdef bint same
+        cdef double startTime
+
+        # anchors are sorted by read position
+        if chain[len(chain) - 1][1] + k - chain[0][1] < read_len // 2:
+            return None
+
+        r0, q0, same = chain[0]
+        # minus strand: the anchor's k-mer ends where the reverse-complemented read starts
+        if same:
+            ref_start = r0 - q0
+        else:
+            ref_start = r0 + q0 + k - read_len
+        ref_end = ref_start + read_len
+        if ref_start < 0 or ref_end > len(reference):
+            return None
+
+        startTime = perf_counter()
+        mismatches = ungapped_mismatches(q_seq, reference[ref_start:ref_end])
+        self.stats.time("ungapped", perf_counter() - startTime)
+        self.stats.count("ungapped_attempts")
+        if mismatches > self.ungapped_max_rate * read_len:
+            return None
+
+        self.stats.count("ungapped_hits")
+        return Alignment(
+            readId=readId,
+            ref_start=ref_start,
+            ref_end=ref_end,
+            strand_plus=same,
+            cigar=f"{read_len}M",
+            mapped=True,
+            edit_distance=mismatches
+        )
+
+    def _align_in_window(self, readId, str q_seq, str reference, int ref_lo, int ref_hi,
+                         bint strand_plus, object diag, object band, bint widen=False):
+        """
+        Align q_seq inside reference[ref_lo:ref_hi], banded around local diagonal diag.
+        Returns (alignment or None, escaped). With widen=True a window whose optimal
+        alignment may leave the band is not aligned but reported as escaped, so the
+        caller can retry with a wider band; otherwise the banded DP decides.
+        """
+        cdef int ref_len = len(reference)
+        cdef bint holds
+        cdef int read_len
+        cdef str t_seq
+        cdef dict res
+        cdef double score, edit_rate
+        cdef int ref_start, ref_end, lower, j_end
+        cdef list ops
+
+        # clamp the window to the reference, the diagonal moves with a clipped start
         if ref_lo < 0:
+            if diag is not None:
+                diag += ref_lo
             ref_lo = 0
         if ref_hi > ref_len:
             ref_hi = ref_len
         if ref_hi <= ref_lo:
-            return invalidAlignment
-
-        # 2) Orient read and take reference slice
+            return None, False
         t_seq = reference[ref_lo:ref_hi]
-        if strand_plus:
-            q_seq = read
-        else:
-            q_seq = rc(read)
 
-        # 3) Call DP
-        res = self._banded_semiglobal(q_seq, t_seq, diag_est_local=min_pad, band=15)
+        # 3) Bit-parallel score first: it is a lower bound of the banded score, so
+        #    windows failing the edit-rate filter never reach the traceback DP
+        q_seq = q_seq.upper()
+        t_seq = t_seq.upper()
+        lower, j_end = myers_semiglobal(q_seq, t_seq)
+        if self.profile:
+            self.stats.count("bitparallel_cells", len(q_seq) * len(t_seq))
+        read_len = len(q_seq)
+        if read_len <= 0:
+            read_len = 1
+        if <double>lower / read_len > self.max_edit_rate:
+            return None, False
+        holds = band_holds(len(q_seq), len(t_seq), diag, band, lower, j_end)
+        if not holds and widen:
+            return None, True
+        res = self._traceback(q_seq, t_seq, diag, band, lower, j_end, holds)
         if not res:
-            return invalidAlignment
+            # the traceback left the band at its widest
+            self.stats.count("band_lost")
+            return None, False
 
         score = float(res["score"])                    # total edit distance over the whole read
         read_len = len(q_seq)
@@ -184,7 +858,7 @@ class Extender:
             read_len = 1
         edit_rate = score / read_len
         if edit_rate > self.max_edit_rate:
-            return invalidAlignment
+            return None, False
 
         # 4) Map back to absolute coords and build CIGAR in forward-read order
         ref_start = ref_lo + res["t_start"]
@@ -201,83 +875,154 @@ class Extender:
             ref_end=ref_end,
             strand_plus=strand_plus,
             cigar=cigar,
-            mapped=True
-        )
+            mapped=True,
+            edit_distance=res["score"]
+        ), False
+
+    def _traceback(self, str q, str t, object diag_est_local, object band, int score, int j_end, bint holds):
+        """
+        Same result as _banded_semiglobal(q, t, diag_est_local, band), given the unbanded
+        score and end column from myers_semiglobal and band_holds(...) for them.
+        If every optimal alignment ending at j_end fits in the band, the banded optimum,
+        end column and traceback equal the unbanded ones, and only cells within +-score
+        diagonals of the end can lie on (or tie with) such a path, so the DP runs on that
+        thin slice of t only. Otherwise the full banded DP decides.
+        """
+        cdef int m = len(q)
+        cdef int j_lo
+        cdef dict res
+        if not holds:
+            return self._banded_semiglobal(q, t, diag_est_local=diag_est_local, band=band)
+
+        j_lo = max(0, j_end - m - score)
+        res = self._banded_semiglobal(q, t[j_lo:j_end], diag_est_local=j_end - j_lo - m, band=score)
+        if res and j_lo:
+            res["t_start"] += j_lo
+            res["t_end"] += j_lo
+            res["t_steps"] = [s + j_lo for s in res["t_steps"]]
+        return res
+
+    def _dp_buffers(self, int n, Py_ssize_t cells, int m):
+        """
+        Per-worker DP scratch space, grown on demand and reused by every window:
+        two int32 score rows of n entries, a uint8 traceback matrix of `cells`
+        entries and the [lo, hi] band bounds of m rows.
+        """
+        if self._dp_rows.shape[1] < n:
+            self._dp_rows = np.zeros((2, max(n, 2 * self._dp_rows.shape[1])), dtype=np.int32)
+        if self._dp_trace.shape[0] < cells:
+            self._dp_trace = np.zeros(max(cells, 2 * self._dp_trace.shape[0]), dtype=np.uint8)
+        if self._dp_bounds.shape[0] < 2 * m:
+            self._dp_bounds = np.zeros(max(2 * m, 2 * self._dp_bounds.shape[0]), dtype=np.int32)
+        return self._dp_rows, self._dp_trace, self._dp_bounds
+
     # Banded semi-global alignment
-    def _banded_semiglobal(self, q: str, t: str, diag_est_local: Optional[int], band: Optional[int]):
+    def _banded_semiglobal(self, str q, str t, object diag_est_local, object band,
+                           bint free_start=True, bint free_end=True):
         """
         Semi-global: global on read, local on reference.
         Edit distance costs: match 0, mismatch 1, gap 1.
         Banded around j ≈ i + diag_est_local.
+        free_start/free_end=False pin the alignment to the first/last reference base
+        (both False = global alignment, e.g. between two anchors).
+        q and t must already be uppercase.
         Returns dict with score, ops (list of 'M','I','D'), t_start/t_end, and t_steps for MD.
+        Scores and traceback live in the preallocated _dp_buffers; cells outside a
+        row's band read as INF.
         """
         cdef int m = len(q)
         cdef int n = len(t)
         cdef int INF = 10**9
-        cdef list dp_prev, dp_cur
-        cdef list parents
-        cdef int edge_slack = 0
+        cdef bint unbanded = diag_est_local is None or band is None
+        cdef int diag_local = 0, bw = 0
+        cdef int width
+        cdef int[:, ::1] rows
+        cdef unsigned char[::1] trace
+        cdef int[::1] bounds
+        cdef int prev = 0, cur = 1
+        cdef int p_lo, p_hi
         cdef int i, j, j_lo, j_hi, center
-        cdef list row_dir
+        cdef Py_ssize_t row
         cdef int ins, left, diag
-        cdef str qi, tj
+        cdef Py_UCS4 qi
         cdef int j_end, score
+        cdef unsigned char d
         cdef list ops_rev, t_steps_rev, ops, t_steps, t_used
         cdef int t_start, t_end
 
         if m == 0:
             return {"score": 0, "ops": [], "t_start": 0, "t_end": 0, "t_steps": []}
 
-        dp_prev = [0] * (n + 1)
-        parents = []
+        if unbanded:
+            width = n + 1
+        else:
+            diag_local = diag_est_local
+            bw = band
+            width = min(n + 1, 2 * bw + 1)
+        rows, trace, bounds = self._dp_buffers(n + 1, <Py_ssize_t>m * width, m)
+        if self.profile:
+            self.stats.count("dp_cells", <Py_ssize_t>m * width)
 
-        for i in range(1, m + 1):
-            dp_cur = [INF] * (n + 1)
+        # Row 0: free start anywhere on reference (or pay for skipped reference bases)
+        for j in range(n + 1):
+            rows[prev, j] = 0 if free_start else j
+        p_lo = 0
+        p_hi = n
 
-            if diag_est_local is None or band is None:
+        for i in range(1, m + 1):
+            if unbanded:
                 j_lo, j_hi = 0, n
             else:
-                center = i + diag_est_local
+                center = i + diag_local
                 if center < 0:
                     center = 0
                 elif center > n:
                     center = n
-                j_lo = center - (band + edge_slack)
+                j_lo = center - bw
                 if j_lo < 0:
                     j_lo = 0
-                j_hi = center + (band + edge_slack)
+                j_hi = center + bw
                 if j_hi > n:
                     j_hi = n
                 if j_lo > j_hi:
                     j_lo = j_hi = center
-
-            row_dir = [0] * (j_hi - j_lo + 1)
+            bounds[2 * i - 2] = j_lo
+            bounds[2 * i - 1] = j_hi
+            row = <Py_ssize_t>(i - 1) * width - j_lo
+            qi = q[i - 1]
 
             for j in range(j_lo, j_hi + 1):
-                ins = dp_prev[j] + 1
-                left = dp_cur[j - 1] + 1 if j > 0 else INF
+                ins = (rows[prev, j] if p_lo <= j <= p_hi else INF) + 1
                 if j > 0:
-                    qi = q[i - 1].upper()
-                    tj = t[j - 1].upper()
-                    diag = dp_prev[j - 1] + (0 if (qi == tj and qi != 'N') else 1)
+                    left = (rows[cur, j - 1] if j > j_lo else INF) + 1
+                    diag = (rows[prev, j - 1] if p_lo < j <= p_hi + 1 else INF) + (0 if (qi == t[j - 1] and qi != 78) else 1)
                 else:
+                    left = INF
                     diag = INF
 
                 if diag <= left and diag <= ins:
-                    dp_cur[j] = diag
-                    row_dir[j - j_lo] = 2  # 'M'
+                    rows[cur, j] = diag
+                    trace[row + j] = 2  # 'M'
                 elif left <= ins:
-                    dp_cur[j] = left
-                    row_dir[j - j_lo] = 1  # 'D'
+                    rows[cur, j] = left
+                    trace[row + j] = 1  # 'D'
                 else:
-                    dp_cur[j] = ins
-                    row_dir[j - j_lo] = 0  # 'I'
+                    rows[cur, j] = ins
+                    trace[row + j] = 0  # 'I'
 
-            parents.append((j_lo, j_hi, row_dir))
-            dp_prev = dp_cur
+            prev, cur = cur, prev
+            p_lo = j_lo
+            p_hi = j_hi
 
-        j_end = min(range(n + 1), key=lambda j: dp_prev[j])
-        score = dp_prev[j_end]
+        # end anywhere on reference (first minimum; columns outside the last band are INF)
+        j_end = 0
+        score = INF
+        for j in range(p_lo, p_hi + 1):
+            if rows[prev, j] < score and (free_end or j == n):
+                j_end = j
+                score = rows[prev, j]
+        if score >= INF:
+            return None
 
         i = m
         j = j_end
@@ -285,10 +1030,11 @@ class Extender:
         t_steps_rev = []
 
         while i > 0:
-            j_lo, j_hi, row_dir = parents[i - 1]
+            j_lo = bounds[2 * i - 2]
+            j_hi = bounds[2 * i - 1]
             if j < j_lo or j > j_hi:
                 return None
-            d = row_dir[j - j_lo]
+            d = trace[<Py_ssize_t>(i - 1) * width + j - j_lo]
 
             if d == 0:        # 'I'
                 ops_rev.append('I')
@@ -305,6 +1051,11 @@ class Extender:
                 j -= 1
             else:
                 return None
+        # pinned start: the reference bases before the first read base are deletions
+        while j > 0 and not free_start:
+            ops_rev.append('D')
+            t_steps_rev.append(j)
+            j -= 1
 
         ops = ops_rev[::-1]
         t_steps = t_steps_rev[::-1]
@@ -316,4 +1067,4 @@ class Extender:
         else:
             t_start = t_end = j_end
 
-        return {"score": score, "ops": ops, "t_start": t_start, "t_end": t_end, "t_steps": t_steps}
\ No newline at end of file
+        return {"score": score, "ops": ops, "t_start": t_start, "t_end": t_end, "t_steps": t_steps}
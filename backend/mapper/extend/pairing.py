@@ -0,0 +1,205 @@
+from typing import Callable, List, Optional, Tuple
+import math
+
+from .extender import Extender, Alignment, MAPQ_PER_EDIT, estimate_mapq
+
+
+class InsertSizeEstimator:
+    """
+    Online (Welford) estimate of the library insert size, learned from the first
+    confidently mapped pairs a worker sees and frozen after max_samples.
+    """
+    def __init__(self, min_samples: int = 20, max_samples: int = 1000, max_insert: int = 5000):
+        self.min_samples = min_samples  # pairs needed before the estimate is trusted
+        self.max_samples = max_samples  # stop learning after this many pairs
+        self.max_insert = max_insert    # ignore discordant outliers above this size
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.n >= self.min_samples
+
+    @property
+    def std(self) -> float:
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.n - 1))
+
+    def add(self, insert: int):
+        if self.n >= self.max_samples or insert <= 0 or insert > self.max_insert:
+            return
+        self.n += 1
+        delta = insert - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (insert - self.mean)
+
+    def bounds(self, n_std: float) -> Tuple[int, int]:
+        # a little slack keeps tight libraries (std ~ 0) from rejecting every pair
+        spread = n_std * self.std + 10
+        return max(0, int(self.mean - spread)), int(math.ceil(self.mean + spread))
+
+    def is_proper(self, insert: Optional[int], n_std: float) -> bool:
+        if insert is None or not self.ready:
+            return False
+        lo, hi = self.bounds(n_std)
+        return lo <= insert <= hi
+
+
+def insert_size(a: Alignment, b: Alignment) -> Optional[int]:
+    """
+    Fragment length of a forward-reverse pair, or None if the mates are unmapped,
+    on the same strand, or pointing away from each other.
+    """
+    if not (a.mapped and b.mapped) or a.strand_plus == b.strand_plus:
+        return None
+    plus, minus = (a, b) if a.strand_plus else (b, a)
+    if minus.ref_end < plus.ref_start:
+        return None
+    return minus.ref_end - plus.ref_start
+
+
+def mate_window(anchor: Alignment, mate_len: int, lo: int, hi: int) -> Tuple[int, int, bool]:
+    """
+    Reference window [ref_lo, ref_hi) and strand where the mate of a mapped read
+    must lie for the pair's insert size to fall inside [lo, hi].
+    """
+    if anchor.strand_plus:
+        # fragment starts at the anchor, mate is reverse and ends insert bases later
+        return anchor.ref_start + lo - mate_len, anchor.ref_start + hi, False
+    # fragment ends at the anchor, mate is forward and starts insert bases earlier
+    return anchor.ref_end - hi, anchor.ref_end - lo + mate_len, True
+
+
+def _promote(primary: Alignment, hit: Alignment) -> Alignment:
+    # make a secondary hit the primary one, keeping the rest as secondaries
+    if hit is primary:
+        return primary
+    others = [primary] + [h for h in primary.secondary if h is not hit]
+    for h in others:
+        h.secondary = []
+    hit.secondary = sorted(others, key=lambda h: h.edit_distance)
+    hit.mapq = estimate_mapq(hit)
+    return hit
+
+
+def rescue_mapq(hit: Alignment, anchor: Alignment, max_edits: int) -> int:
+    """
+    MAPQ of a mate found only by aligning inside its partner's window. Chance alone
+    aligns a read there at about the edit-rate limit, so that is its runner-up (as in
+    estimate_mapq); it is never more certain than the partner that placed the window.
+    """
+    return max(0, min(anchor.mapq, MAPQ_PER_EDIT * (max_edits - hit.edit_distance)))
+
+
+class PairedMapper:
+    """
+    Pair-aware mapping of one read pair:
+    1) Map the front read with the full seed -> chain -> extend pipeline.
+    2) If it maps confidently and the insert size is known, align the back read
+       directly inside the insert-size window (no seeding); fall back to the full
+       pipeline if that fails or needs more than max_rescue_rate edits, and keep
+       whichever of the two hits has fewer edits.
+    3) Pick the combination of candidate hits that forms a proper pair.
+    4) Rescue a mate that is unmapped or not consistent with a confident partner.
+    Confidently mapped full-search pairs keep training the insert-size estimate.
+    """
+    def __init__(self,
+                 extender: Extender,
+                 reference: str,
+                 full_search: Callable[[str, str, str, int], Alignment],
+                 estimator: InsertSizeEstimator = None,
+                 min_mapq: int = 20,
+                 n_std: float = 4.0,
+                 max_rescue_rate: float = 0.05):
+        self.extender = extender
+        self.reference = reference
+        self.full_search = full_search     # (readId, sequence, quality, seq_id) -> Alignment
+        self.estimator = estimator if estimator else InsertSizeEstimator()
+        self.min_mapq = min_mapq
+        self.n_std = n_std
+        # a mate found in its partner's window with more edits than this is checked by
+        # a full search too: max_edit_rate would let a poor local hit beat a perfect one elsewhere
+        self.max_rescue_rate = max_rescue_rate
+
+    def map_pair(self,
+                 front: Tuple[str, str, str],
+                 back: Tuple[str, str, str],
+                 i: int) -> Tuple[Alignment, Alignment]:
+        """
+        :param front: (readId, sequence, quality) of the first mate
+        :param back:  (readId, sequence, quality) of the second mate
+        :param i:     index of the pair in the input (used for seq ids)
+        """
+        frontAlignment = self.full_search(front[0], front[1], front[2], i)
+        rescue = self._rescue(back[0], back[1], frontAlignment) if self._confident(frontAlignment) else None
+        rescued = rescue is not None and rescue.edit_distance <= int(self.max_rescue_rate * len(back[1]))
+        if rescued:
+            backAlignment = rescue
+        else:
+            backAlignment = self.full_search(back[0], back[1], back[2], (i + 1) * 2)
+            # the better of the two, the full search's on a tie
+            if rescue is not None and \
+                    (not backAlignment.mapped or rescue.edit_distance < backAlignment.edit_distance):
+                backAlignment, rescued = rescue, True
+
+        if not rescued and self.estimator.ready:
+            frontAlignment, backAlignment = self._choose_pair(frontAlignment, backAlignment)
+            frontAlignment, backAlignment = self._rescue_weaker(front, back, frontAlignment, backAlignment)
+
+        if not rescued and self._confident(frontAlignment) and self._confident(backAlignment):
+            self.estimator.add(insert_size(frontAlignment, backAlignment))
+
+        return frontAlignment, backAlignment
+
+    def _confident(self, a: Alignment) -> bool:
+        return a.mapped and a.mapq >= self.min_mapq
+
+    def _rescue(self, readId: str, read: str, anchor: Alignment) -> Optional[Alignment]:
+        if not self.estimator.ready:
+            return None
+        lo, hi = self.estimator.bounds(self.n_std)
+        ref_lo, ref_hi, strand_plus = mate_window(anchor, len(read), lo, hi)
+        hit = self.extender.align_window(readId, read, self.reference, ref_lo, ref_hi, strand_plus)
+        if hit is not None:
+            hit.mapq = rescue_mapq(hit, anchor, int(self.extender.max_edit_rate * len(read)))
+        return hit
+
+    def _choose_pair(self, a: Alignment, b: Alignment) -> Tuple[Alignment, Alignment]:
+        """
+        Among the primary and secondary hits of both mates, prefer the proper pair
+        with the fewest edits (then the insert closest to the mean).
+        """
+        if not (a.mapped and b.mapped) or not (a.secondary or b.secondary):
+            return a, b
+        best = None
+        for x in [a] + a.secondary:
+            for y in [b] + b.secondary:
+                insert = insert_size(x, y)
+                if not self.estimator.is_proper(insert, self.n_std):
+                    continue
+                key = (x.edit_distance + y.edit_distance, abs(insert - self.estimator.mean))
+                if best is None or key < best[0]:
+                    best = (key, x, y)
+        if best is None:
+            return a, b
+        return _promote(a, best[1]), _promote(b, best[2])
+
+    def _rescue_weaker(self,
+                       front: Tuple[str, str, str],
+                       back: Tuple[str, str, str],
+                       a: Alignment,
+                       b: Alignment) -> Tuple[Alignment, Alignment]:
+        # nothing to do for proper pairs or pairs without a confident partner
+        if self.estimator.is_proper(insert_size(a, b), self.n_std):
+            return a, b
+        if self._confident(a) and not self._confident(b):
+            hit = self._rescue(back[0], back[1], a)
+            if hit is not None and (not b.mapped or hit.edit_distance <= b.edit_distance):
+                b = hit
+        elif self._confident(b) and not self._confident(a):
+            hit = self._rescue(front[0], front[1], b)
+            if hit is not None and (not a.mapped or hit.edit_distance <= a.edit_distance):
+                a = hit
+        return a, b
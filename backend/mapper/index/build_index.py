@@ -1,4 +1,5 @@
 from ..seed.minimizer import Minimizer
+from .sorted_index import SortedMinimizerIndex
 
 
 class ReferenceIndexBuilder:
@@ -29,4 +30,7 @@ class ReferenceIndexBuilder:
             ref_index[hash_val].append((pos, is_rev))
 
         return ref_index
-        
\ No newline at end of file
+
+    def build_sorted_index(self) -> SortedMinimizerIndex:
+        # Same minimizers as build_index, stored as sorted key / CSR position arrays
+        return SortedMinimizerIndex.from_minimizers(self.extractor.extract(self.ref_seq))
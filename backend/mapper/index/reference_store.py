@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import List, Tuple
+
+from .sorted_index import SortedMinimizerIndex
+
+
+class ReferenceStore:
+    """
+    Built references on local disk, one directory per reference id:
+      meta.json      - name, length, k, w
+      reference.txt  - the reference sequence
+      *.npy          - the SortedMinimizerIndex arrays
+    A reference is indexed once and every worker loads it from here, with the index
+    memory-mapped so all workers on the host share it. The store outlives the server;
+    with maxBytes > 0, storing a reference evicts the least recently used others until
+    the store fits (the reference just stored is always kept).
+    """
+
+    def __init__(self, root: str, maxBytes: int = 0):
+        self.root = root
+        self.maxBytes = maxBytes
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def reference_id(referenceString: str, k: int, w: int) -> str:
+        # content id: uploading the same sequence with the same k / w finds the built index
+        digest = hashlib.blake2b(f"{k}:{w}:".encode(), digest_size=16)
+        digest.update(referenceString.encode())
+        return digest.hexdigest()
+
+    def path(self, refId: str) -> str:
+        return os.path.join(self.root, refId)
+
+    def __contains__(self, refId: str) -> bool:
+        return os.path.exists(os.path.join(self.path(refId), "meta.json"))
+
+    def put(self, refId: str, name: str, referenceString: str, index: SortedMinimizerIndex, k: int, w: int):
+        # written next to the store and renamed into place, readers never see a partial reference
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            index.save(staging)
+            with open(os.path.join(staging, "reference.txt"), "w") as out:
+                out.write(referenceString)
+            # meta.json last: its presence marks a complete reference
+            with open(os.path.join(staging, "meta.json"), "w") as out:
+                json.dump({"name": name, "length": len(referenceString), "k": k, "w": w}, out)
+            os.rename(staging, self.path(refId))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if refId not in self:
+                raise
+            # stored concurrently by another request or server process
+        self.evict(keep=refId)
+
+    def meta(self, refId: str) -> dict:
+        with open(os.path.join(self.path(refId), "meta.json")) as metaFile:
+            meta = json.load(metaFile)
+        meta["id"] = refId
+        return meta
+
+    def touch(self, refId: str):
+        # last use, the eviction order, is the modification time of meta.json
+        os.utime(os.path.join(self.path(refId), "meta.json"))
+
+    def last_used(self, refId: str) -> float:
+        return os.path.getmtime(os.path.join(self.path(refId), "meta.json"))
+
+    def size(self, refId: str) -> int:
+        directory = self.path(refId)
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    def ids(self) -> List[str]:
+        # complete references, most recently used first
+        refIds = [name for name in os.listdir(self.root) if not name.startswith(".") and name in self]
+        return sorted(refIds, key=self.last_used, reverse=True)
+
+    def list(self) -> List[dict]:
+        references = []
+        for refId in self.ids():
+            meta = self.meta(refId)
+            meta["bytes"] = self.size(refId)
+            meta["lastUsed"] = self.last_used(refId)
+            references.append(meta)
+        return references
+
+    def remove(self, refId: str):
+        # meta.json first: the reference stops being listed before its files go
+        os.remove(os.path.join(self.path(refId), "meta.json"))
+        shutil.rmtree(self.path(refId), ignore_errors=True)
+
+    def evict(self, keep: str = None):
+        if self.maxBytes <= 0:
+            return
+        refIds = self.ids()
+        total = sum(self.size(refId) for refId in refIds)
+        # workers that already mapped an evicted reference keep their copy, the files go once unmapped
+        for refId in reversed(refIds):
+            if total <= self.maxBytes:
+                break
+            if refId != keep:
+                total -= self.size(refId)
+                self.remove(refId)
+
+    def load(self, refId: str) -> Tuple[SortedMinimizerIndex, str]:
+        directory = self.path(refId)
+        with open(os.path.join(directory, "reference.txt")) as referenceFile:
+            referenceString = referenceFile.read()
+        return SortedMinimizerIndex.load(directory), referenceString
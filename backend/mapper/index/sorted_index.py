@@ -0,0 +1,104 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class SortedMinimizerIndex:
+    """
+    Minimizer index stored as flat NumPy arrays instead of a dict of lists:
+      keys      - sorted unique minimizer hashes (uint64)
+      offsets   - CSR row pointers, hits of keys[i] are in [offsets[i], offsets[i+1])
+      positions - reference positions of every hit (int32, int64 for >2 Gbp), ascending within a key
+      reverse   - strand of every hit (bool, True = reverse)
+    A whole batch of hashes is resolved with one np.searchsorted and the arrays
+    pickle to workers much faster than the equivalent dict.
+    """
+    ARRAYS = ("keys", "offsets", "positions", "reverse")
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, positions: np.ndarray, reverse: np.ndarray):
+        self.keys = keys
+        self.offsets = offsets
+        self.positions = positions
+        self.reverse = reverse
+
+    @classmethod
+    def from_minimizers(cls, minimizers: List[Tuple[int, int, int, bool]]) -> "SortedMinimizerIndex":
+        """
+        Build from Minimizer.extract output: (hash, position, seq_id, is_reverse) tuples.
+        """
+        n = len(minimizers)
+        hashes = np.fromiter((m[0] for m in minimizers), dtype=np.uint64, count=n)
+        positions = np.fromiter((m[1] for m in minimizers), dtype=np.int64, count=n)
+        reverse = np.fromiter((m[3] for m in minimizers), dtype=bool, count=n)
+        return cls._from_arrays(hashes, positions, reverse)
+
+    @classmethod
+    def from_dict(cls, index: Dict[int, List[Tuple[int, bool]]]) -> "SortedMinimizerIndex":
+        """
+        Build from the dict index produced by ReferenceIndexBuilder.build_index.
+        """
+        flat = [(h, pos, 0, rev) for h, hits in index.items() for pos, rev in hits]
+        return cls.from_minimizers(flat)
+
+    @classmethod
+    def _from_arrays(cls, hashes: np.ndarray, positions: np.ndarray, reverse: np.ndarray) -> "SortedMinimizerIndex":
+        # stable sort keeps hits of one key in reference order
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        if len(positions) and positions.max() < 2**31:
+            positions = positions.astype(np.int32)
+        keys, counts = np.unique(hashes, return_counts=True)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(keys, offsets, positions[order], reverse[order])
+
+    def save(self, directory: str):
+        """
+        Write the four arrays as .npy files into directory (created if missing).
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "SortedMinimizerIndex":
+        """
+        Read an index written by save. With mmap the arrays are memory-mapped read-only,
+        so processes loading the same index share one copy in the page cache.
+        """
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode) for name in cls.ARRAYS))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, hash_val: int) -> bool:
+        i = int(np.searchsorted(self.keys, np.uint64(hash_val)))
+        return i < len(self.keys) and int(self.keys[i]) == hash_val
+
+    def __getitem__(self, hash_val: int) -> List[Tuple[int, bool]]:
+        """
+        Dict-compatible access: list of (position, is_reverse) for one hash.
+        """
+        i = int(np.searchsorted(self.keys, np.uint64(hash_val)))
+        if i >= len(self.keys) or int(self.keys[i]) != hash_val:
+            raise KeyError(hash_val)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.positions[lo:hi].tolist(), self.reverse[lo:hi].tolist()))
+
+    def lookup(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resolve an array of hashes at once.
+        Returns (start, end) CSR bounds per hash; missing hashes get start == end.
+        """
+        if len(self.keys) == 0:
+            empty = np.zeros(len(hashes), dtype=np.int64)
+            return empty, empty
+        idx = np.searchsorted(self.keys, hashes)
+        found = idx < len(self.keys)
+        found[found] = self.keys[idx[found]] == hashes[found]
+        idx = np.where(found, idx, 0)
+        start = self.offsets[idx]
+        end = np.where(found, self.offsets[idx + 1], start)
+        return start, end
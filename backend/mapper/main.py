@@ -4,25 +4,23 @@ Handles pipeline and CLI
 """
 
 import argparse
-from multiprocessing import Pool, cpu_count
-from parallelization.batch_reads import process_read_pair_batch, _init_worker
-from index.build_index import ReferenceIndexBuilder
-from constants.constants import KMERSIZE, WINDOWSIZE
-from mmm_parser.parser import Parser 
-from mmm_parser.readParser import ReadParser
-from models.read import Read
-from models.sam import SAM, SAMInput
+from .parallelization.executor import BACKENDS, BATCH_SECONDS, make_executor, worker_count
+from .index.build_index import ReferenceIndexBuilder
+from .index.sorted_index import SortedMinimizerIndex
+from .constants.constants import KMERSIZE, WINDOWSIZE
+from .mmm_parser.parser import Parser 
+from .mmm_parser.readParser import ReadParser
+from .models.read import Read
+from .models.sam import SAM, SAMInput
+from .models.options import MapperOptions
+from .models.stats import MappingStats
+from .parallelization.memory import MemorySampler
 from typing import IO, List
-from index.solutionIndex import SolutionIndexBuilder, MetricAccumulator, Metrics
+from .index.solutionIndex import SolutionIndexBuilder, MetricAccumulator, Metrics
 import time
-# import tracemalloc
-import psutil
+import json
 import os
-
-def get_memory_usage():
-    """Get current memory usage in bytes using psutil"""
-    process = psutil.Process(os.getpid())
-    return process.memory_info().rss
+from dataclasses import asdict
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Genome Read Mapper')
@@ -34,10 +32,30 @@ def parse_args():
     
     # Optional arguments
     parser.add_argument('-o', '--output', default='io/outputs/SAMOutputFile.SAM', help='Output SAM file')
+    parser.add_argument('--no-sam', action='store_true', help='Map without writing SAM output (benchmarking)')
     parser.add_argument('--truth', help='Ground truth file for metrics')
     parser.add_argument('-k', '--kmer', type=int, default=KMERSIZE, help='K-mer size')
     parser.add_argument('-w', '--window', type=int, default=WINDOWSIZE, help='Window size')
-    parser.add_argument('-m', '--memory', action='store_true', help='Track memory usage')
+    parser.add_argument('-m', '--memory', action='store_true', help='Sample RSS/USS/PSS of this process and its workers, peaks per phase')
+    parser.add_argument('--memory-interval', type=float, default=0.1, help='Seconds between memory samples')
+    parser.add_argument('--memory-csv', help='Also write every memory sample to this CSV file (implies --memory)')
+    parser.add_argument('--pair-aware', action='store_true', help='Learn the insert size and rescue mates inside its window')
+    parser.add_argument('--long-reads', action='store_true', help='Gap-tolerant chaining and piecewise alignment for multi-kb reads')
+    parser.add_argument('--max-occurrences', type=int, default=0, help='Do not seed minimizers with more reference hits (0 = off)')
+    parser.add_argument('--band', type=int, default=8, help='Narrowest DP band, widened as needed')
+    parser.add_argument('--seed-min-quality', type=int, default=0, help='Do not seed k-mers over bases below this Phred score (0 = off)')
+    parser.add_argument('--min-chain-anchors', type=int, default=1, help='Do not align chains with fewer anchors')
+    parser.add_argument('--min-chain-coverage', type=float, default=0.0, help='Do not align chains covering less of the read (0-1)')
+    parser.add_argument('--qgram-filter', action='store_true', help='Do not align chains whose q-gram lower bound exceeds the edit rate')
+    parser.add_argument('--read-cache-mb', type=float, default=64.0, help='Per-worker cache for duplicate reads in MB (0 = off)')
+    parser.add_argument('--backend', choices=BACKENDS, default='process',
+                        help='Worker processes (index copied into each), threads sharing one index, or OpenMP threads mapping one batch at a time (compiled build)')
+    parser.add_argument('-t', '--threads', type=int, default=0, help='Workers (0 = CPUs available to this process)')
+    parser.add_argument('--batch-seconds', type=float, default=BATCH_SECONDS,
+                        help='Worker time each batch is sized for, adapted from measured batch latency')
+    parser.add_argument('--profile', action='store_true', help='Time every mapping stage and print a per-stage table')
+    parser.add_argument('--profile-json', help='Also write the per-stage timers and counters to this JSON file (implies --profile)')
+    parser.add_argument('--results-json', help='Write reads, times, reads per minute, metrics, stage timers and memory peaks to this JSON file')
     
     return parser.parse_args()
 
@@ -47,18 +65,16 @@ def main():
     startTime = time.perf_counter()
     startCpuTime = time.process_time()
     
-    if args.memory:
-        # tracemalloc.start()
-        baseline_memory = get_memory_usage()
-        peak_memory = baseline_memory
+    # memory of the parent and every worker, sampled in the background
+    sampler : MemorySampler = None
+    if args.memory or args.memory_csv:
+        sampler = MemorySampler(args.memory_interval, args.memory_csv).start()
+        sampler.set_phase("reference load")
 
     # constants
     k = args.kmer  # k-mer size
     w = args.window  # window size
 
-    # if args.memory:
-    #     baseline_current_tm, baseline_peak_tm = tracemalloc.get_traced_memory()
-
     # open file... should need CLI handling
     readFrontFile : IO = open(args.reads1, "r")
     readBackFile : IO = open(args.reads2, "r")
@@ -67,7 +83,7 @@ def main():
     else:
         readSolutionFile = None
     referenceFile : IO = open(args.reference, "r")
-    outputFile: IO = open(args.output, "w")
+    outputFile: IO = open(os.devnull if args.no_sam else args.output, "w")
 
     referenceStringHeaderLine = referenceFile.readline().strip('\n') # Skip header
     referenceStringHeader = referenceStringHeaderLine.split()[0][1:]
@@ -76,6 +92,9 @@ def main():
     # create samOutput
     samWriter : SAM = SAM(referenceName=referenceStringHeader, referenceSize = len(referenceString), outputFile=outputFile)
 
+    if sampler:
+        sampler.set_phase("read load")
+
     # create parser
     parserFront : Parser = Parser(readFile=readFrontFile, referenceFile=None)
     parserBack : Parser = Parser(readFile=readBackFile, referenceFile=None)
@@ -91,23 +110,14 @@ def main():
     # referenceString : str = parserFront.getReferenceString()
     solutionMap : dict = solutionIndexBuilder.getSolutionMap(readSolutionFile)
     accumulator : MetricAccumulator = MetricAccumulator(solutionMap)
+    if sampler:
+        sampler.set_phase("index build")
     # Build minimizer index from reference
     builder : ReferenceIndexBuilder = ReferenceIndexBuilder(referenceString, k=k, w=w)
-    referenceIndex : dict = builder.build_index()
-
-    # Track Indexing Memory Usage
-    if args.memory:
-        indexing_memory = get_memory_usage()
-        indexing_memory_used = indexing_memory - baseline_memory
-        peak_memory = max(peak_memory, indexing_memory)
-        
-        # first_current_tm, first_peak_tm = tracemalloc.get_traced_memory()
-        # first_part_memory_tm = first_current_tm - baseline_current_tm
-        
-        print(f"\nMemory Usage After Indexing ")
-        print(f"Indexing (actual system memory): {indexing_memory_used / 10**6:.2f} MB")
-        # print(f"Indexing (tracemalloc Python only): {first_part_memory_tm / 10**6:.2f} MB")
-        print(f"Total memory used: {(indexing_memory - baseline_memory) / 10**6:.2f} MB")
+    referenceIndex : SortedMinimizerIndex = builder.build_sorted_index()
+
+    if sampler:
+        sampler.set_phase("mapping")
 
     # index time print("hello wrld grild")
     indexTime = time.perf_counter()
@@ -118,77 +128,84 @@ def main():
 
     # Prepare read pairs with their indices for batch processing
     indexed_read_pairs = list(enumerate(readPairs))
-    # Determine optimal batch size and number of processes
-    num_processes = 8  # Use all available CPU cores
-    # print(f"Total CPU cores: {num_processes}")
-    batch_size = max(1, len(indexed_read_pairs) // (num_processes * 3))
-    
-    # Split into batches
-    batches = []
-    for i in range(0, len(indexed_read_pairs), batch_size):
-        batch = indexed_read_pairs[i:i + batch_size]
-        batches.append((batch))
+    # Workers default to the CPUs this process may use; batch sizes adapt while mapping
+    num_processes = worker_count(args.threads, len(indexed_read_pairs))
 
     total_reads = 0
-    with Pool(
-        processes=num_processes,
-        initializer=_init_worker,
-        initargs=(referenceIndex, referenceString),
-        ) as pool:
-        batch_results = pool.map(process_read_pair_batch, batches)
+    stats : MappingStats = MappingStats()
+    profile = args.profile or bool(args.profile_json)
+    with make_executor(
+        args.backend,
+        num_processes,
+        referenceIndex,
+        referenceString,
+        MapperOptions(
+            k=k,
+            w=w,
+            pairAware=args.pair_aware,
+            longReads=args.long_reads,
+            seedMinQuality=args.seed_min_quality,
+            minChainAnchors=args.min_chain_anchors,
+            minChainCoverage=args.min_chain_coverage,
+            qgramFilter=args.qgram_filter,
+            readCacheMB=args.read_cache_mb,
+            maxOccurrences=args.max_occurrences,
+            minBand=args.band,
+            profile=profile,
+        ),
+        ) as executor:
+        batch_results = executor.imap(indexed_read_pairs, batch_seconds=args.batch_seconds)
         # Flatten the results
-        for batch_alignments in batch_results:
+        for batch_alignments, batch_stats in batch_results:
+            stats.merge(batch_stats)
             accumulator.update(batch_alignments=batch_alignments)
             total_reads += len(batch_alignments)
-            for a in batch_alignments:
-                    input : SAMInput
-                    if not a.mapped:
-                        input = SAMInput(
-                                QNAME = a.readId, 
-                                FLAG= a.flag,
-                                RNAME = referenceStringHeader,
-                                POS = -1,
-                                MAPQ = a.mapq,
-                                RNEXT= a.rnext,
-                                PNEXT=  a.pnext,
-                                CIGAR= "*",
-                                TLEN = -1,
-                                QUAL = a.qual,
-                            )
-                    else:
-                        input = SAMInput(
-                                QNAME = a.readId, 
-                                FLAG= a.flag,
-                                RNAME = referenceStringHeader,
-                                POS = a.ref_start,
-                                MAPQ = a.mapq,
-                                CIGAR= a.cigar,
-                                RNEXT= a.rnext, # Ref. name of the mate/next read
-                                PNEXT=  a.pnext,  # Position of the mate/next read
-                                TLEN = a.ref_end - a.ref_start,
-                                QUAL= a.qual,
-                            )
-                    samWriter.WriteReadToSam(input)
+            # the workers go on mapping while the parent writes a batch out
+            if sampler:
+                sampler.set_phase("writing")
+            samStart = time.perf_counter() if profile else 0.0
+            if not args.no_sam:
+                for a in batch_alignments:
+                        input : SAMInput
+                        if not a.mapped:
+                            input = SAMInput(
+                                    QNAME = a.readId, 
+                                    FLAG= a.flag,
+                                    RNAME = referenceStringHeader,
+                                    POS = -1,
+                                    MAPQ = a.mapq,
+                                    RNEXT= a.rnext,
+                                    PNEXT=  a.pnext,
+                                    CIGAR= "*",
+                                    TLEN = -1,
+                                    QUAL = a.qual,
+                                )
+                        else:
+                            input = SAMInput(
+                                    QNAME = a.readId, 
+                                    FLAG= a.flag,
+                                    RNAME = referenceStringHeader,
+                                    POS = a.ref_start,
+                                    MAPQ = a.mapq,
+                                    CIGAR= a.cigar,
+                                    RNEXT= a.rnext, # Ref. name of the mate/next read
+                                    PNEXT=  a.pnext,  # Position of the mate/next read
+                                    TLEN = a.ref_end - a.ref_start,
+                                    QUAL= a.qual,
+                                )
+                        samWriter.WriteReadToSam(input)
+            if profile:
+                stats.time("sam", time.perf_counter() - samStart)
+            if sampler:
+                sampler.set_phase("mapping")
 
     # finalize the metrics 
     metrics : Metrics =  accumulator.compute_final_metrics(total_reads_processed=total_reads)
-    # Mapping and Cumulative Usage
-    if args.memory:
-        mapping_memory = get_memory_usage()
-        mapping_memory_used = mapping_memory - indexing_memory
-        peak_memory = max(peak_memory, mapping_memory)
-        # latter_current_tm, latter_peak_tm = tracemalloc.get_traced_memory()
-        # latter_part_only_tm = latter_current_tm - first_current_tm
-        
-        print(f"\nMemory Usage After Mapping")
-        print(f"Mapping phase (actual system memory): {mapping_memory_used / 10**6:.2f} MB")
-        # print(f"Mapping phase (tracemalloc Python only): {latter_part_only_tm / 10**6:.2f} MB")
-        print(f"\nTotal Memory Usage")
-        print(f"Total cumulative (actual): {(mapping_memory - baseline_memory) / 10**6:.2f} MB")
-        # print(f"Total cumulative (tracemalloc): {latter_current_tm / 10**6:.2f} MB")
-        print(f"Peak memory (actual): {(peak_memory - baseline_memory) / 10**6:.2f} MB")
-        # print(f"Peak memory (tracemalloc): {latter_peak_tm / 10**6:.2f} MB")
+    if sampler:
+        sampler.set_phase("writing")
     outputFile.close()
+    if sampler:
+        sampler.stop()
     endTime = time.perf_counter()
     endCpuTime = time.process_time()
 
@@ -217,6 +234,33 @@ def main():
 
     reads_per_minute = (total_reads * 60) / elapsedTime
     print(f"\nPerformance: {reads_per_minute:.0f} reads per minute")
+    for line in stats.report():
+        print(line)
+    if profile:
+        print()
+        for line in stats.profile_report():
+            print(line)
+    if args.profile_json:
+        with open(args.profile_json, "w") as profileFile:
+            json.dump(stats.to_dict(), profileFile, indent=2)
+    if sampler:
+        print()
+        for line in sampler.report():
+            print(line)
+    if args.results_json:
+        with open(args.results_json, "w") as resultsFile:
+            json.dump({
+                "reads": total_reads,
+                "workers": num_processes,
+                "backend": args.backend,
+                "index_s": indexElapsedTime,
+                "mapping_s": mappingTime,
+                "total_s": elapsedTime,
+                "reads_per_minute": reads_per_minute,
+                "metrics": asdict(metrics),
+                "stats": stats.to_dict(),
+                "memory": sampler.to_dict() if sampler else None,
+            }, resultsFile, indent=2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+from typing import IO, Iterator, List
+import zlib
+from ..models.read import Read
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ChunkParser:
+    """
+    FASTQ reads straight from a binary stream (an upload, a file opened "rb"), read and
+    split in chunks of chunkBytes instead of line by line through a text wrapper. Gzip
+    input is recognised by its magic bytes and inflated on the fly, several concatenated
+    gzip members (bgzip) included. Memory stays at a few chunks whatever the size of the
+    stream: a chunk is parsed into reads only when the reader asks for them.
+    Drop-in for Parser in ReadParser.
+    """
+    CHUNK_BYTES = 1 << 20
+
+    def __init__(self, readFile: IO, chunkBytes: int = CHUNK_BYTES):
+        self.readFile = readFile
+        self.chunkBytes = chunkBytes
+        self._reads = self.reads()
+
+    def parseNextRead(self) -> Read:
+        return next(self._reads, None)
+
+    def reads(self) -> Iterator[Read]:
+        for chunk in self._records():
+            yield from chunk
+
+    def _data(self) -> Iterator[bytes]:
+        # decompressed bytes, at most chunkBytes at a time
+        # enough bytes to see the magic, even with tiny chunks
+        raw = self.readFile.read(max(self.chunkBytes, len(GZIP_MAGIC)))
+        if not raw.startswith(GZIP_MAGIC):
+            while raw:
+                yield raw
+                raw = self.readFile.read(self.chunkBytes)
+            return
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while raw:
+            data = inflater.decompress(raw, self.chunkBytes)
+            if data:
+                yield data
+            if inflater.eof:
+                # next gzip member, if any
+                raw = inflater.unused_data
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                raw = inflater.unconsumed_tail
+            if not raw:
+                raw = self.readFile.read(self.chunkBytes)
+
+    def _records(self) -> Iterator[List[Read]]:
+        # whole records of every chunk; an incomplete last record waits for the next chunk
+        tail = b""
+        for data in self._data():
+            lines = (tail + data).split(b"\n")
+            complete = (len(lines) - 1) // 4 * 4
+            tail = b"\n".join(lines[complete:])
+            yield self._parse(lines[:complete])
+        lines = tail.split(b"\n")
+        if len(lines) >= 4:
+            yield self._parse(lines[:len(lines) // 4 * 4])
+
+    @staticmethod
+    def _parse(lines: List[bytes]) -> List[Read]:
+        reads = []
+        for i in range(0, len(lines), 4):
+            header = lines[i].rstrip(b"\r").decode()
+            identifier = header[1:]
+            reads.append(Read(
+                identifier=identifier,
+                sequence=lines[i + 1].rstrip(b"\r").decode(),
+                qualityScore=lines[i + 3].rstrip(b"\r").decode(),
+                # the back read of a pair ends its identifier with 2
+                isFront=not identifier.endswith("2"),
+            ))
+        return reads
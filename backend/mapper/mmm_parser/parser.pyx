@@ -3,8 +3,8 @@
 
 cimport cython
 
-from constants.constants import KMERSIZE
-from models.read import Read  # treated as a Python class
+from ..constants.constants import KMERSIZE
+from ..models.read import Read  # treated as a Python class
 
 cdef class Parser:
     cdef object readFile
@@ -76,7 +76,8 @@ cdef class Parser:
                 if line:
                     identifier = line[1:]
                     # Determine front/back from the last char if it's '2'
-                    isFront = False if identifier and identifier[-1] == '2' else True
+                    # (endswith: negative indexing is off with wraparound=False)
+                    isFront = not identifier.endswith('2')
                 else:
                     identifier = ""
                     isFront = True
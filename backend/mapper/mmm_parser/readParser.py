@@ -1,7 +1,7 @@
 from ..mmm_parser.parser import Parser
 from ..models.read import FullRead
 from ..models.read import Read
-from typing import List
+from typing import Iterator, List
 
 
 class ReadParser:
@@ -48,3 +48,11 @@ class ReadParser:
             readPairs.append(readPair)
 
         return readPairs
+
+    def iterReadPairs(self) -> Iterator[List[Read]]:
+        # parseAllReadPairs one pair at a time, for inputs too large to hold
+        while True:
+            readPair: List[Read] = self.parseReadPair()
+            if not readPair:
+                break
+            yield readPair
@@ -3,7 +3,7 @@
 
 from typing import List
 # from mmm_parser.parser cimport Parser        # cimport for faster attribute access if compiled
-from models.read import FullRead, Read    # regular import, still Python-level
+from ..models.read import FullRead, Read    # regular import, still Python-level
 
 cdef class ReadParser:
     cdef object parserFront
@@ -52,4 +52,13 @@ cdef class ReadParser:
             if not readPair:
                 break
             readPairs.append(readPair)
-        return readPairs
\ No newline at end of file
+        return readPairs
+
+    def iterReadPairs(self):
+        """Yield [frontRead, backRead] pairs until EOF, one at a time."""
+        cdef list readPair
+        while True:
+            readPair = self.parseReadPair()
+            if not readPair:
+                break
+            yield readPair
@@ -0,0 +1,49 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import time
+
+from .readMapper import ReadMapperOutput
+from ..readMapper.streaming import SAMStream
+
+@dataclass
+class MappingJob:
+    # required fields
+    id: str
+    directory: str                  # uploads and output of this job
+    options: dict                   # extra ReadMapperInput fields
+
+    # optional fields
+    stream: SAMStream = None        # SAM output of a streamed job, None = written to the directory
+    inputs: dict = None             # uploads read in place, None = copied to the directory
+
+    # filled in while the job runs
+    status: str = "queued"          # queued, running, done or failed
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    readsTotal: int = None          # known once the input has been read
+    readsDone: int = 0
+    mappedReads: int = 0
+    error: str = None
+    output: ReadMapperOutput = None
+    future: Future = None
+
+    def progress(self, readsDone: int, readsTotal: int, mappedReads: int):
+        self.readsDone = readsDone
+        self.readsTotal = readsTotal
+        self.mappedReads = mappedReads
+
+    def summary(self) -> dict:
+        end = self.finished if self.finished else time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "queuedSeconds": (self.started if self.started else end) - self.submitted,
+            "elapsedSeconds": elapsed,
+            "readsTotal": self.readsTotal,
+            "readsDone": self.readsDone,
+            "mappedReads": self.mappedReads,
+            "readsPerSecond": self.readsDone / elapsed if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from ..constants.constants import KMERSIZE, WINDOWSIZE
+
+@dataclass
+class MapperOptions:
+    """
+    Per-run mapping options shipped to every worker through _init_worker.
+    """
+    # paired-end handling
+    pairAware: bool = False         # estimate the insert size and rescue mates inside its window
+    rescueMinMapq: int = 20         # a mate must map with at least this MAPQ to anchor a rescue
+    insertStdDevs: float = 4.0      # rescue window / proper-pair tolerance in standard deviations
+    # read length
+    longReads: bool = False         # gap-tolerant chaining + piecewise alignment (multi-kb reads), no mate rescue
+    # seeding, k and w must be those the reference index was built with
+    k: int = KMERSIZE               # k-mer size of the minimizers
+    w: int = WINDOWSIZE             # minimizer window
+    seedMinQuality: int = 0         # k-mers over bases below this Phred score are not seeded, 0 = off
+    maxOccurrences: int = 0         # minimizers with more reference hits are not seeded (repeats), 0 = off
+    # alignment
+    minBand: int = 8                # narrowest DP band and window padding, the band widens from here
+    # pre-extension filters
+    minChainAnchors: int = 1        # chains with fewer anchors are not aligned
+    minChainCoverage: float = 0.0   # chains whose k-mers cover less of the read are not aligned
+    qgramFilter: bool = False       # drop chains whose q-gram lower bound already exceeds the edit rate
+    # duplicate reads
+    readCacheMB: float = 64.0       # per-worker LRU cache of results for repeated sequences, 0 turns it off
+    # instrumentation
+    profile: bool = False           # per-stage timers and counters (MappingStats.profile_report), off = no extra timing calls
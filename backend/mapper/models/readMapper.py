@@ -1,23 +1,32 @@
 from dataclasses import dataclass
-from typing import IO
+from typing import IO, Callable
+from .stats import MappingStats
 
 @dataclass 
 class ReadMapperInput:
     # required fields
-    readsOne: IO 
+    readsOne: IO                # FASTQ opened in binary mode, plain or gzip
     readsTwo: IO 
-    referenceGenome: IO 
+    referenceGenome: IO         # FASTA, None when referenceId is given
 
-    outputLocation: str
+    outputLocation: str         # ignored when outputStream is given
 
     # optional fields 
     groundTruth: IO = None
+    referenceId: str = None     # map against a reference stored with ReadMapper.addReference
     kmerSize: int = 15 
     windowSize: int = 30
+    pairAware: bool = False
+    longReads: bool = False
+    backend: str = "process"    # "process", "thread" or "openmp", see parallelization.executor
+    threads: int = 0            # workers, 0 = CPUs available to the server process
+    outputStream: IO = None     # write the SAM here instead, left open for the caller
+    progress: Callable[[int, int, int], None] = None    # per batch: (reads done, reads total or None until read, mapped)
 
 @dataclass 
 class ReadMapperOutput:
     samOutput: IO
     numberOfMappedReads: int = -1
+    stats: MappingStats = None
 
 
@@ -0,0 +1,147 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# (timer, label, depth) of the profile table; nested timers are part of the one above
+PROFILE_STAGES = [
+    ("batch", "worker batches", 0),
+    ("seed", "minimizer extraction", 1),
+    ("lookup", "index lookup", 1),
+    ("extend", "extension", 1),
+    ("chain", "chaining", 2),
+    ("ungapped", "ungapped fast path", 2),
+    ("qgram", "q-gram filter", 2),
+    ("dp", "banded DP", 2),
+    ("long_align", "long-read alignment", 2),
+    ("nogil_map", "GIL-free core", 1),
+    ("sam", "SAM writing (parent)", 0),
+]
+
+
+@dataclass
+class MappingStats:
+    """
+    Counters and timers collected while mapping. Every worker batch returns one,
+    the parent merges them with merge() and prints report().
+    """
+    counts: Counter = field(default_factory=Counter)    # event name -> count
+    seconds: Counter = field(default_factory=Counter)   # timer name -> total seconds
+    peaks: Dict[str, int] = field(default_factory=dict) # gauge name -> largest value seen
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] += n
+
+    def time(self, name: str, elapsed: float):
+        self.seconds[name] += elapsed
+
+    def peak(self, name: str, value: int):
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+
+    def merge(self, other: "MappingStats") -> "MappingStats":
+        self.counts.update(other.counts)
+        self.seconds.update(other.seconds)
+        for name, value in other.peaks.items():
+            self.peak(name, value)
+        return self
+
+    def rate(self, name: str, total: str) -> float:
+        # fraction of `total` events that were `name` events
+        return self.counts[name] / self.counts[total] if self.counts[total] else 0.0
+
+    def mean(self, timer: str, total: str) -> float:
+        # average seconds of `timer` per `total` event
+        return self.seconds[timer] / self.counts[total] if self.counts[total] else 0.0
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {"counts": dict(self.counts), "seconds": dict(self.seconds), "peaks": dict(self.peaks)}
+
+    def profile_report(self) -> List[str]:
+        """
+        Table of the per-stage timers (summed over all workers) and the per-read counters
+        collected with MapperOptions.profile.
+        """
+        reads = self.counts["reads"]
+        workerSeconds = self.seconds["batch"]
+        lines = [f"{'stage':<28} {'seconds':>9} {'% worker':>9} {'us/read':>9}"]
+        for timer, label, depth in PROFILE_STAGES:
+            if timer not in self.seconds:
+                continue
+            seconds = self.seconds[timer]
+            share = f"{100 * seconds / workerSeconds:.1f}" if workerSeconds and timer != "sam" else "-"
+            perRead = f"{1e6 * seconds / reads:.1f}" if reads else "-"
+            lines.append(f"{'  ' * depth + label:<28} {seconds:>9.3f} {share:>9} {perRead:>9}")
+
+        def per(name: str, total: str) -> str:
+            return f"{self.counts[name] / self.counts[total]:.1f}" if self.counts[total] else "-"
+        lines.append(f"{'counter':<28} {'total':>12} {'mean':>9}")
+        for name, total, label in (
+            ("lookup_hashes", "seeded_reads", "minimizers per seeded read"),
+            ("seed_anchors", "seeded_reads", "anchors per seeded read"),
+            ("chains", "chained_reads", "chains per read"),
+            ("chain_anchors", "chains", "anchors per chain"),
+            ("dp_windows", "chained_reads", "DP windows per read"),
+            ("bitparallel_cells", "dp_windows", "bit-parallel cells/window"),
+            ("dp_cells", "dp_windows", "traceback DP cells/window"),
+            ("band_widenings", "dp_windows", "band retries per window"),
+        ):
+            if self.counts[name]:
+                lines.append(f"{label:<28} {self.counts[name]:>12} {per(name, total):>9}")
+        if self.peaks.get("chain_anchors_max"):
+            lines.append(f"{'largest chain (anchors)':<28} {self.peaks['chain_anchors_max']:>12}")
+        return lines
+
+    def report(self) -> List[str]:
+        lines = []
+        if self.counts["ungapped_attempts"]:
+            # speedup estimate: every fast-path hit would otherwise have cost one average DP window
+            fast_us = self.mean("ungapped", "ungapped_attempts") * 1e6
+            dp_us = self.mean("dp", "dp_windows") * 1e6
+            saved = self.counts["ungapped_hits"] * self.mean("dp", "dp_windows") - self.seconds["ungapped"]
+            extend = self.seconds["extend"]
+            line = (
+                f"Ungapped fast path: {self.counts['ungapped_hits']}/{self.counts['ungapped_attempts']} windows "
+                f"({100 * self.rate('ungapped_hits', 'ungapped_attempts'):.1f}%)"
+            )
+            # the GIL-free core counts but does not time
+            if self.seconds["ungapped"]:
+                line += f", {fast_us:.1f} us per check vs {dp_us:.1f} us per DP window"
+            lines.append(line)
+            if extend > 0:
+                lines.append(f"Ungapped fast path: estimated extension speedup {(extend + saved) / extend:.2f}x")
+        if self.counts["dp_windows"]:
+            lines.append(
+                f"Adaptive band: mean initial band {self.counts['band_initial'] / self.counts['dp_windows']:.1f}, "
+                f"{self.counts['band_widened_windows']}/{self.counts['dp_windows']} DP windows widened "
+                f"({self.counts['band_widenings']} retries), {self.counts['band_lost']} lost at the widest band"
+            )
+        if self.counts["long_chains"]:
+            lines.append(
+                f"Long-read mode: {self.counts['long_chains']} chains aligned piecewise over "
+                f"{self.counts['long_gaps']} gaps in {self.seconds['long_align']:.2f}s, "
+                f"largest gap DP {self.peaks.get('long_gap_cells', 0)} cells"
+            )
+        if self.counts["filter_anchors"] or self.counts["filter_coverage"] or self.counts["qgram_checks"]:
+            lines.append(
+                f"Pre-extension filters: {self.counts['filter_rejected_reads']} reads rejected outright; chains dropped: "
+                f"{self.counts['filter_anchors']} too few anchors, {self.counts['filter_coverage']} too little coverage, "
+                f"{self.counts['filter_qgram']}/{self.counts['qgram_checks']} by the q-gram bound "
+                f"({self.mean('qgram', 'qgram_checks') * 1e6:.1f} us per check)"
+            )
+        if self.counts["seeded_reads"]:
+            lines.append(
+                f"Seeding: {self.counts['seed_anchors'] / self.counts['seeded_reads']:.1f} anchors per seeded read, "
+                f"{self.counts['seed_masked_kmers']} k-mers masked (ambiguous or low-quality bases)"
+            )
+        if self.counts["lookup_hashes"]:
+            lines.append(
+                f"Index lookups: {self.counts['lookup_unique']} distinct of {self.counts['lookup_hashes']} minimizer hashes "
+                f"({100 * self.rate('lookup_unique', 'lookup_hashes'):.1f}%)"
+            )
+        if self.counts["cache_lookups"]:
+            lines.append(
+                f"Read cache: {self.counts['cache_hits']}/{self.counts['cache_lookups']} lookups hit "
+                f"({100 * self.rate('cache_hits', 'cache_lookups'):.1f}%), {self.counts['cache_evictions']} evictions, "
+                f"largest worker cache {self.peaks.get('cache_bytes', 0) / 2**20:.1f} MB"
+            )
+        return lines
@@ -1,17 +1,57 @@
 from ..extend.extender import Extender, Alignment
+from ..extend.pairing import PairedMapper, InsertSizeEstimator
 from ..seed.minimizer import Minimizer
+from ..index.sorted_index import SortedMinimizerIndex
 from ..models.read import Read
-from typing import Tuple, List
-from ..constants.constants import KMERSIZE, WINDOWSIZE
+from ..models.options import MapperOptions
+from ..models.stats import MappingStats
+from .read_cache import ReadCache, alignment_template, alignment_from_template
+from typing import Tuple, List, Optional
+import threading
+import time
 
-_REFERENCE_INDEX : dict
-_REFERENCE_STRING : str
+# per-worker state: one per process worker, one per thread of the thread backend. The
+# index, reference and options live here too, not in module globals, so thread-backend
+# executors of concurrent requests in one process each keep their own
+_WORKER = threading.local()
 
-def _init_worker(referenceIndex : dict, referenceString : str):
-    global _REFERENCE_INDEX,_REFERENCE_STRING 
+def _init_worker(referenceIndex : SortedMinimizerIndex, referenceString : str, options : MapperOptions = None):
+    if isinstance(referenceIndex, dict):
+        referenceIndex = SortedMinimizerIndex.from_dict(referenceIndex)
+    options = options if options else MapperOptions()
+    # read-only, shared with every other worker mapping against the same reference
+    _WORKER.reference_index = referenceIndex
+    _WORKER.reference_string = referenceString
+    _WORKER.options = options
+    # learned online from the first confident pairs this worker maps, kept across batches
+    _WORKER.insert_size = InsertSizeEstimator()
+    # results of sequences this worker has already mapped, kept across batches
+    _WORKER.read_cache = ReadCache(int(options.readCacheMB * 2**20)) if options.readCacheMB > 0 else None
+    # built once per worker: the extender's DP buffers grow to the longest read and are reused
+    _WORKER.minimizer = Minimizer(k=options.k, w=options.w, reference_index=referenceIndex,
+                                  min_quality=options.seedMinQuality, max_occurrences=options.maxOccurrences)
+    _WORKER.extender = Extender(
+        k=options.k,
+        w=options.w,
+        min_band=options.minBand,
+        long_reads=options.longReads,
+        min_chain_anchors=options.minChainAnchors,
+        min_chain_coverage=options.minChainCoverage,
+        qgram_filter=options.qgramFilter,
+        # the early exit counts a missing anchor as edits: off when anchors are dropped
+        complete_seeds=options.maxOccurrences == 0 and options.seedMinQuality == 0,
+        profile=options.profile,
+    )
 
-    _REFERENCE_INDEX= referenceIndex
-    _REFERENCE_STRING = referenceString
+def _worker_state():
+    """
+    What _init_worker set up in this worker, to switch back to with _use_worker_state
+    instead of setting it up again (the read cache and insert-size estimate included).
+    """
+    return dict(vars(_WORKER))
+
+def _use_worker_state(state):
+    vars(_WORKER).update(state)
 
 def compute_sam_flag(is_read1: bool, current: Alignment, mate: Alignment) -> int:
     """
@@ -59,35 +99,145 @@ def compute_sam_flag(is_read1: bool, current: Alignment, mate: Alignment) -> int
 
     return flag
 
+def set_mate_fields(frontReadAlignment: Alignment, backReadAlignment: Alignment):
+    """Sets RNEXT/PNEXT of each mate from the other one."""
+    for current, mate in ((frontReadAlignment, backReadAlignment), (backReadAlignment, frontReadAlignment)):
+        if mate.mapped:
+            current.rnext = "="         # Mate is on the same ref
+            current.pnext = mate.ref_start
+        else:
+            current.rnext = "*"         # Mate is unmapped
+            current.pnext = 0
+
 def process_read_pair_batch(args):
-    """Process a batch of read pairs in parallel"""
-    global _REFERENCE_INDEX,_REFERENCE_STRING
+    """
+    Process a batch of read pairs in parallel.
+    Returns (alignments, stats): two alignments per pair and the batch's MappingStats.
+    """
     batch = args
-    k = KMERSIZE
-    w = WINDOWSIZE
-    
-    # Create instances for this process
-    extractor = Minimizer(k=k, w=w, reference_index=_REFERENCE_INDEX)
-    extender = Extender()
+    options = _WORKER.options
+    referenceString = _WORKER.reference_string
+    profile = options.profile
+    batchStart = time.perf_counter() if profile else 0.0
+    # the worker's instances, with counters of this batch only
+    extractor = _WORKER.minimizer
+    extender = _WORKER.extender
+    stats = extender.stats = MappingStats()
+    extractor.masked_kmers = extractor.lookups = extractor.unique_lookups = 0
+    cache = _WORKER.read_cache
+    # low-quality bases are masked out of the seeds: results depend on the qualities too
+    masked = options.seedMinQuality > 0
     alignments = []
+
+    # long reads keep their minimizers in arrays rather than one tuple per minimizer
+    extract = extractor.extract_arrays if options.longReads else extractor.extract
+
+    def unit(sequence: str, quality: str) -> Tuple[str, Optional[str]]:
+        # what the seeds of a read depend on: duplicates of a unit are seeded once
+        return sequence, quality if masked else None
+
+    def seed(reads: List[Tuple[str, Optional[str]]]):
+        # minimizers of every read, resolved against the index with one searchsorted
+        startTime = time.perf_counter() if profile else 0.0
+        minimizers = [extract(seq, qual=qual) for seq, qual in reads]
+        if profile:
+            lookupTime = time.perf_counter()
+            stats.time("seed", lookupTime - startTime)
+        anchors = extractor.lookup_batch(minimizers, _WORKER.reference_index)
+        if profile:
+            stats.time("lookup", time.perf_counter() - lookupTime)
+        stats.count("seeded_reads", len(reads))
+        stats.count("seed_anchors", len(anchors[0]))
+        return anchors
+
+    def cached(key: bytes):
+        if cache is None:
+            return None
+        stats.count("cache_lookups")
+        hit = cache.get(key)
+        if hit is not None:
+            stats.count("cache_hits")
+        return hit
+
+    def remember(key: bytes, *mapped: Alignment):
+        if cache is not None:
+            stats.count("cache_evictions", cache.put(key, tuple(alignment_template(a) for a in mapped)))
+
+    if options.pairAware and not options.longReads:
+        # a rescued mate depends on its partner: cache whole pairs
+        keys = [ReadCache.reads_key(readPair, masked) if cache is not None else None for _, readPair in batch]
+        # back mates are seeded lazily, most of them get rescued next to their front mate
+        frontUnits = list(dict.fromkeys(
+            unit(readPair[0].getSequence(), readPair[0].getQualityScore())
+            for (_, readPair), key in zip(batch, keys) if cache is None or key not in cache
+        ))
+        frontAnchors = seed(frontUnits)
+        frontIndex = {readUnit: j for j, readUnit in enumerate(frontUnits)}
+
+        def full_search(readId: str, readSeq: str, quality: str, seq_id: int) -> Alignment:
+            readUnit = unit(readSeq, quality)
+            j = frontIndex.get(readUnit)
+            if j is not None:
+                anchors = Minimizer.anchors_of(frontAnchors, j)
+            else:
+                anchors = Minimizer.anchors_of(seed([readUnit]), 0)
+            return extender.extend(readId, readSeq, referenceString, anchors)
+
+        pairedMapper = PairedMapper(
+            extender=extender,
+            reference=referenceString,
+            full_search=full_search,
+            estimator=_WORKER.insert_size,
+            min_mapq=options.rescueMinMapq,
+            n_std=options.insertStdDevs,
+        )
+    else:
+        # one key per read: read 2t is the front of pair t, 2t+1 the back
+        readUnits = [unit(readPair[m].getSequence(), readPair[m].getQualityScore())
+                     for _, readPair in batch for m in (0, 1)]
+        keys = [ReadCache.reads_key((readPair[m],), masked) if cache is not None else None
+                for _, readPair in batch for m in (0, 1)]
+        # seed every distinct read the cache cannot answer once
+        seededUnits = list(dict.fromkeys(
+            readUnit for readUnit, key in zip(readUnits, keys) if cache is None or key not in cache
+        ))
+        batchAnchors = seed(seededUnits)
+        batchRows = {readUnit: j for j, readUnit in enumerate(seededUnits)}
+        pairedMapper = None
+
+        def map_read(readId: str, readUnit: Tuple[str, Optional[str]], key: bytes) -> Alignment:
+            hit = cached(key)
+            if hit is not None:
+                return alignment_from_template(readId, hit[0])
+            j = batchRows.get(readUnit)
+            if j is not None:
+                anchors = Minimizer.anchors_of(batchAnchors, j)
+            else:
+                # cached when the batch was seeded, evicted since
+                anchors = Minimizer.anchors_of(seed([readUnit]), 0)
+            alignment = extender.extend(readId, readUnit[0], referenceString, anchors)
+            remember(key, alignment)
+            return alignment
     
-    for i, readPair in batch:
+    for t, (i, readPair) in enumerate(batch):
         fReadSeq = readPair[0].getSequence()
         bReadSeq = readPair[1].getSequence()
-        frontReadMinimizers = extractor.extract(
-            fReadSeq, 
-            seq_id=i
-        )  
-        backReadMinimizers = extractor.extract(
-            bReadSeq, 
-            seq_id=(i+1)*2
-        )  
-
-        frontReadAnchors = extractor.filter_and_lookup(frontReadMinimizers, _REFERENCE_INDEX)
-        backReadAnchors = extractor.filter_and_lookup(backReadMinimizers, _REFERENCE_INDEX)
 
-        frontReadAlignment = extender.extend(readPair[0].getIdentifier(), fReadSeq, _REFERENCE_STRING, frontReadAnchors)
-        backReadAlignment = extender.extend(readPair[1].getIdentifier(), bReadSeq, _REFERENCE_STRING, backReadAnchors)
+        if pairedMapper:
+            hit = cached(keys[t])
+            if hit is not None:
+                frontReadAlignment = alignment_from_template(readPair[0].getIdentifier(), hit[0])
+                backReadAlignment = alignment_from_template(readPair[1].getIdentifier(), hit[1])
+            else:
+                frontReadAlignment, backReadAlignment = pairedMapper.map_pair(
+                    (readPair[0].getIdentifier(), fReadSeq, readPair[0].getQualityScore()),
+                    (readPair[1].getIdentifier(), bReadSeq, readPair[1].getQualityScore()),
+                    i
+                )
+                remember(keys[t], frontReadAlignment, backReadAlignment)
+        else:
+            frontReadAlignment = map_read(readPair[0].getIdentifier(), readUnits[2 * t], keys[2 * t])
+            backReadAlignment = map_read(readPair[1].getIdentifier(), readUnits[2 * t + 1], keys[2 * t + 1])
 
         frontReadAlignment.flag = compute_sam_flag(
                 is_read1=True, 
@@ -100,6 +250,7 @@ def process_read_pair_batch(args):
             current=backReadAlignment, 
             mate=frontReadAlignment
         )
+        set_mate_fields(frontReadAlignment, backReadAlignment)
 
         if not frontReadAlignment.mapped:
             frontReadAlignment.mapq = 0
@@ -111,4 +262,12 @@ def process_read_pair_batch(args):
         
         alignments.extend([frontReadAlignment, backReadAlignment])
     
-    return alignments
+    if cache is not None:
+        stats.peak("cache_bytes", cache.bytes)
+    stats.count("seed_masked_kmers", extractor.masked_kmers)
+    stats.count("lookup_hashes", extractor.lookups)
+    stats.count("lookup_unique", extractor.unique_lookups)
+    if profile:
+        stats.count("reads", len(alignments))
+        stats.time("batch", time.perf_counter() - batchStart)
+    return alignments, stats
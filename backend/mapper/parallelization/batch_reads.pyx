@@ -2,51 +2,208 @@
 # cython: boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
 
 from typing import List, Tuple  # ok to import; only used for hints
+import threading
+from time import perf_counter
 cimport cython
 
 # Import your existing Python classes/modules
-from extend.extender import Extender, Alignment
-from seed.minimizer import Minimizer
-from models.read import Read
-from constants.constants import KMERSIZE, WINDOWSIZE
+from ..extend.extender import Extender, Alignment
+from ..extend.pairing import PairedMapper, InsertSizeEstimator
+from ..seed.minimizer import Minimizer
+from ..index.sorted_index import SortedMinimizerIndex
+from ..models.read import Read
+from ..models.options import MapperOptions
+from ..models.stats import MappingStats
+from .read_cache import ReadCache, alignment_template, alignment_from_template
+from .nogil_core import NogilMapper
 
-# --- per-worker module globals (set once in initializer) ---
-cdef object _REFERENCE_INDEX  # dict-like; keep as generic object
-cdef unicode _REFERENCE_STRING
-cdef object _MINIMIZER
-cdef object _EXTENDER
+# --- per-process module globals ---
+cdef object _NOGIL_MAPPER = None # NogilMapper shared by all threads, built on the first GIL-free batch
+cdef tuple _NOGIL_FOR = None     # (index, reference, options) it was built for
+_NOGIL_LOCK = threading.Lock()
+
+# --- per-worker state: one per process worker, one per thread of the thread backend ---
+# the index, reference and options live here too, not in module globals, so thread-backend
+# executors of concurrent requests in one process each keep their own
+_WORKER = threading.local()
+
+cdef class _WorkerState:
+    cdef object referenceIndex   # SortedMinimizerIndex, read-only
+    cdef unicode referenceString
+    cdef object options
+    cdef object nogilMapper      # NogilMapper of this index, reference and options, or None
+    cdef object minimizer
+    cdef object extender
+    cdef object pairedMapper
+    cdef object readCache        # ReadCache or None, kept across batches
+    cdef dict frontIndex         # seeding unit of a front read -> row of frontAnchors (current batch)
+    cdef object frontAnchors
+
+    def full_search(self, readId, readSeq, quality, seq_id):
+        return _full_search(self, readId, readSeq, quality, seq_id)
+
+cdef inline tuple _unit(bint masked, str sequence, str quality):
+    # what the seeds of a read depend on: duplicates of a unit are seeded once
+    return (sequence, quality if masked else None)
+
+cdef object _seed(_WorkerState state, list reads):
+    # minimizers of every read, resolved against the index with one searchsorted;
+    # long reads keep their minimizers in arrays rather than one tuple per minimizer
+    minimizer = state.minimizer
+    extract = minimizer.extract_arrays if state.options.longReads else minimizer.extract
+    stats = state.extender.stats
+    cdef bint profile = state.options.profile
+    cdef double startTime = perf_counter() if profile else 0.0, lookupTime = 0.0
+    minimizers = [extract(seq, qual=qual) for seq, qual in reads]
+    if profile:
+        lookupTime = perf_counter()
+        stats.time("seed", lookupTime - startTime)
+    anchors = minimizer.lookup_batch(minimizers, state.referenceIndex)
+    if profile:
+        stats.time("lookup", perf_counter() - lookupTime)
+    stats.count("seeded_reads", len(reads))
+    stats.count("seed_anchors", len(anchors[0]))
+    return anchors
+
+cdef object _full_search(_WorkerState state, str readId, str readSeq, str quality, int seq_id):
+    cdef tuple readUnit = _unit(state.options.seedMinQuality > 0, readSeq, quality)
+    cdef object j = state.frontIndex.get(readUnit)
+    cdef object anchors
+    if j is not None:
+        anchors = Minimizer.anchors_of(state.frontAnchors, j)
+    else:
+        anchors = Minimizer.anchors_of(_seed(state, [readUnit]), 0)
+    return state.extender.extend(readId, readSeq, state.referenceString, anchors)
 
 @cython.profile(False)
-cpdef void _init_worker(object referenceIndex, unicode referenceString):
+cpdef void _init_worker(object referenceIndex, unicode referenceString, object options=None):
     """
     Called once per worker process via multiprocessing.Pool(initializer=...)
-    Builds and caches heavy, read-only objects in module globals.
+    Builds and caches heavy objects in this worker's _WorkerState.
     """
-    global _REFERENCE_INDEX, _REFERENCE_STRING, _MINIMIZER, _EXTENDER
-    _REFERENCE_INDEX  = referenceIndex
-    _REFERENCE_STRING = referenceString
-    _MINIMIZER = Minimizer(k=KMERSIZE, w=WINDOWSIZE, reference_index=_REFERENCE_INDEX)
-    _EXTENDER  = Extender()
+    cdef _WorkerState state = _WorkerState()
+    if isinstance(referenceIndex, dict):
+        referenceIndex = SortedMinimizerIndex.from_dict(referenceIndex)
+    options = options if options is not None else MapperOptions()
+    state.referenceIndex  = referenceIndex
+    state.referenceString = referenceString
+    state.options = options
+    state.nogilMapper = None
+    state.minimizer = Minimizer(k=options.k, w=options.w, reference_index=referenceIndex,
+                                min_quality=options.seedMinQuality, max_occurrences=options.maxOccurrences)
+    state.extender  = Extender(
+        k=options.k,
+        w=options.w,
+        min_band=options.minBand,
+        long_reads=options.longReads,
+        min_chain_anchors=options.minChainAnchors,
+        min_chain_coverage=options.minChainCoverage,
+        qgram_filter=options.qgramFilter,
+        # the early exit counts a missing anchor as edits: off when anchors are dropped
+        complete_seeds=options.maxOccurrences == 0 and options.seedMinQuality == 0,
+        profile=options.profile,
+    )
+    state.readCache = ReadCache(int(options.readCacheMB * 2**20)) if options.readCacheMB > 0 else None
+    state.frontIndex = {}
+    state.frontAnchors = None
+    state.pairedMapper = None
+    if options.pairAware and not options.longReads:
+        # the insert-size estimate lives as long as the worker and is learned online
+        state.pairedMapper = PairedMapper(
+            extender=state.extender,
+            reference=referenceString,
+            full_search=state.full_search,
+            estimator=InsertSizeEstimator(),
+            min_mapq=options.rescueMinMapq,
+            n_std=options.insertStdDevs,
+        )
+    _WORKER.state = state
     return
 
-cdef inline unsigned char _comp_base(unsigned char b) nogil:
-    if b == 65: return 84   #   A->T
-    elif b == 84: return 65 #   T->A
-    elif b == 67: return 71 #   C->G
-    elif b == 71: return 67 #   G->C
-    else: return 78         #   N->N
-
-cdef str rc(str seq):
+cpdef object _worker_state():
     """
-    Reverse complement, uppercase.
+    What _init_worker set up in this worker, to switch back to with _use_worker_state
+    instead of setting it up again (the read cache and insert-size estimate included).
     """
-    cdef bytes up = seq.upper().encode("ascii")
-    cdef Py_ssize_t L = len(up)
-    cdef bytearray out = bytearray(L)
-    cdef Py_ssize_t i
-    for i in range(L):
-        out[i] = _comp_base(up[L - 1 - i])
-    return out.decode("ascii")
+    return _WORKER.state
+
+cpdef void _use_worker_state(object state):
+    _WORKER.state = state
+
+
+cdef object _cached(object cache, object stats, bytes key):
+    cdef object hit
+    if cache is None:
+        return None
+    stats.count("cache_lookups")
+    hit = cache.get(key)
+    if hit is not None:
+        stats.count("cache_hits")
+    return hit
+
+cdef void _remember(object cache, object stats, bytes key, tuple mapped):
+    if cache is not None:
+        stats.count("cache_evictions", cache.put(key, tuple([alignment_template(a) for a in mapped])))
+
+cdef object _map_read(_WorkerState state, object cache, object stats, unicode refStr,
+                      object batchAnchors, dict batchRows, str readId, tuple readUnit, bytes key):
+    cdef object hit = _cached(cache, stats, key)
+    cdef object j, anchors, alignment
+    if hit is not None:
+        return alignment_from_template(readId, hit[0])
+    j = batchRows.get(readUnit)
+    if j is not None:
+        anchors = Minimizer.anchors_of(batchAnchors, j)
+    else:
+        # cached when the batch was seeded, evicted since
+        anchors = Minimizer.anchors_of(_seed(state, [readUnit]), 0)
+    alignment = state.extender.extend(readId, readUnit[0], refStr, anchors)
+    _remember(cache, stats, key, (alignment,))
+    return alignment
+
+
+cdef void _finish_pair(object fRead, object bRead, object frontReadAlignment, object backReadAlignment):
+    # SAM fields that depend on the mate, plus SEQ and QUAL
+    frontReadAlignment.flag = compute_sam_flag(
+        is_read1=True, 
+        current=frontReadAlignment, 
+        mate=backReadAlignment
+    )
+
+    backReadAlignment.flag = compute_sam_flag(
+        is_read1=False, 
+        current=backReadAlignment, 
+        mate=frontReadAlignment
+    )
+
+    # Setting RNEXT and PNEXT fields
+    # Update FRONT Read (Look at Back Read)
+    if backReadAlignment.mapped:
+        frontReadAlignment.rnext = "="                  # Mate is on the same ref
+        frontReadAlignment.pnext = backReadAlignment.ref_start
+    else:
+        frontReadAlignment.rnext = "*"                  # Mate is unmapped
+        frontReadAlignment.pnext = 0
+
+    # Update BACK Read (Look at Front Read)
+    if frontReadAlignment.mapped:
+        backReadAlignment.rnext = "="                   # Mate is on the same ref
+        backReadAlignment.pnext = frontReadAlignment.ref_start
+    else:
+        backReadAlignment.rnext = "*"                   # Mate is unmapped
+        backReadAlignment.pnext = 0
+    
+    if not frontReadAlignment.mapped:
+        frontReadAlignment.mapq = 0
+    if not backReadAlignment.mapped:
+        backReadAlignment.mapq = 0
+
+    # set the SEQ fields
+    frontReadAlignment.seq = fRead.getSequence()
+    backReadAlignment.seq = bRead.getSequence()
+
+    frontReadAlignment.qual = fRead.getQualityScore()
+    backReadAlignment.qual = bRead.getQualityScore()
 
 
 cpdef int compute_sam_flag(bint is_read1, object current, object mate):
@@ -91,27 +248,68 @@ cpdef int compute_sam_flag(bint is_read1, object current, object mate):
     return flag
 
 @cython.profile(False)
-cpdef list process_read_pair_batch(object batch):
+cpdef tuple process_read_pair_batch(object batch):
     """
     batch: list of (i, readPair) where readPair is (Read, Read).
-    Uses per-worker globals set by _init_worker.
+    Uses the per-worker state set by _init_worker.
+    Returns (alignments, stats) with the MappingStats of this batch only.
     """
     cdef Py_ssize_t n = len(batch)
     cdef list alignments = [None] * (2 * n)  # preallocate
     cdef Py_ssize_t t, idx = 0
 
     # bind globals to locals for faster attribute resolution
-    cdef object extractor = _MINIMIZER
-    cdef object extender  = _EXTENDER
-    cdef object refIndex  = _REFERENCE_INDEX
-    cdef unicode refStr   = _REFERENCE_STRING
+    cdef _WorkerState state = _WORKER.state
+    cdef object extender  = state.extender
+    cdef object minimizer = state.minimizer
+    cdef unicode refStr   = state.referenceString
+    cdef object options   = state.options
+    cdef object pairedMapper = state.pairedMapper
+    cdef object batchAnchors = None
+    cdef object stats = MappingStats()
+    cdef object cache = state.readCache
+    cdef list frontUnits, readUnits, seededUnits, keys
+    cdef dict batchRows = None
+    cdef object hit
 
     cdef int i
     cdef object readPair, fRead, bRead
     cdef unicode fReadSeq, bReadSeq
-    cdef object frontReadMinimizers, backReadMinimizers
-    cdef object frontReadAnchors,  backReadAnchors
     cdef object frontReadAlignment, backReadAlignment
+    cdef bint profile = options.profile
+    cdef double batchStart = perf_counter() if profile else 0.0
+    # low-quality bases are masked out of the seeds: results depend on the qualities too
+    cdef bint masked = options.seedMinQuality > 0
+
+    extender.stats = stats     # the extender lives as long as the worker, its stats per batch
+    minimizer.masked_kmers = minimizer.lookups = minimizer.unique_lookups = 0
+    if pairedMapper is not None:
+        # a rescued mate depends on its partner: cache whole pairs
+        if cache is not None:
+            keys = [ReadCache.reads_key(readPair, masked) for _, readPair in batch]
+        else:
+            keys = [None] * n
+        # back mates are seeded lazily, most of them get rescued next to their front mate
+        frontUnits = list(dict.fromkeys([
+            _unit(masked, batch[t][1][0].getSequence(), batch[t][1][0].getQualityScore())
+            for t in range(n) if cache is None or keys[t] not in cache
+        ]))
+        state.frontAnchors = _seed(state, frontUnits)
+        state.frontIndex = {readUnit: j for j, readUnit in enumerate(frontUnits)}
+    else:
+        # one key per read: read 2t is the front of pair t, 2t+1 the back
+        readUnits = [_unit(masked, readPair[m].getSequence(), readPair[m].getQualityScore())
+                     for _, readPair in batch for m in (0, 1)]
+        if cache is not None:
+            keys = [ReadCache.reads_key((readPair[m],), masked) for _, readPair in batch for m in (0, 1)]
+        else:
+            keys = [None] * (2 * n)
+        # seed every distinct read the cache cannot answer once
+        seededUnits = list(dict.fromkeys([
+            readUnits[t] for t in range(2 * n) if cache is None or keys[t] not in cache
+        ]))
+        batchAnchors = _seed(state, seededUnits)
+        batchRows = {readUnit: j for j, readUnit in enumerate(seededUnits)}
 
     for t in range(n):
         i, readPair = batch[t]
@@ -124,55 +322,132 @@ cpdef list process_read_pair_batch(object batch):
         fReadSeq = fRead.getSequence()
         bReadSeq = bRead.getSequence()
 
-        # seed --> lookup
-        frontReadMinimizers = extractor.extract(fReadSeq, seq_id=i)
-        backReadMinimizers  = extractor.extract(bReadSeq, seq_id=(i + 1) * 2)
+        if pairedMapper is not None:
+            hit = _cached(cache, stats, keys[t])
+            if hit is not None:
+                frontReadAlignment = alignment_from_template(fRead.getIdentifier(), hit[0])
+                backReadAlignment  = alignment_from_template(bRead.getIdentifier(), hit[1])
+            else:
+                # pair-aware: rescue / pick mates inside the learned insert-size window
+                frontReadAlignment, backReadAlignment = pairedMapper.map_pair(
+                    (fRead.getIdentifier(), fReadSeq, fRead.getQualityScore()),
+                    (bRead.getIdentifier(), bReadSeq, bRead.getQualityScore()),
+                    i
+                )
+                _remember(cache, stats, keys[t], (frontReadAlignment, backReadAlignment))
+        else:
+            # cache first, then anchors resolved for the whole batch above
+            frontReadAlignment = _map_read(state, cache, stats, refStr, batchAnchors, batchRows,
+                                           fRead.getIdentifier(), readUnits[2 * t], keys[2 * t])
+            backReadAlignment  = _map_read(state, cache, stats, refStr, batchAnchors, batchRows,
+                                           bRead.getIdentifier(), readUnits[2 * t + 1], keys[2 * t + 1])
+
+        _finish_pair(fRead, bRead, frontReadAlignment, backReadAlignment)
+
+        # write into preallocated list
+        alignments[idx] = frontReadAlignment; idx += 1
+        alignments[idx] = backReadAlignment;  idx += 1
 
-        frontReadAnchors = extractor.filter_and_lookup(frontReadMinimizers, refIndex)
-        backReadAnchors  = extractor.filter_and_lookup(backReadMinimizers,  refIndex)
+    if cache is not None:
+        stats.peak("cache_bytes", cache.bytes)
+    stats.count("seed_masked_kmers", minimizer.masked_kmers)
+    stats.count("lookup_hashes", minimizer.lookups)
+    stats.count("lookup_unique", minimizer.unique_lookups)
+    if profile:
+        stats.count("reads", 2 * n)
+        stats.time("batch", perf_counter() - batchStart)
+    return alignments, stats
 
-        # extend
-        frontReadAlignment = extender.extend(fRead.getIdentifier(), fReadSeq, refStr, frontReadAnchors)
-        backReadAlignment  = extender.extend(bRead.getIdentifier(), bReadSeq, refStr, backReadAnchors)
 
-        frontReadAlignment.flag = compute_sam_flag(
-                is_read1=True, 
-                current=frontReadAlignment, 
-                mate=backReadAlignment
+cdef object _nogil_mapper(_WorkerState state):
+    # one NogilMapper per process: threads of the thread backend share its index arrays.
+    # Each worker keeps the one it got, a concurrent request building another one for
+    # its own reference does not take it away
+    global _NOGIL_MAPPER, _NOGIL_FOR
+    if state.nogilMapper is not None:
+        return state.nogilMapper
+    cdef object options = state.options
+    with _NOGIL_LOCK:
+        if _NOGIL_FOR is None or _NOGIL_FOR[0] is not state.referenceIndex or \
+                _NOGIL_FOR[1] is not state.referenceString or _NOGIL_FOR[2] is not options:
+            _NOGIL_MAPPER = NogilMapper(
+                state.referenceIndex, state.referenceString, k=options.k, w=options.w,
+                min_band=options.minBand, max_occurrences=options.maxOccurrences,
+                min_chain_anchors=options.minChainAnchors,
+                min_chain_coverage=options.minChainCoverage,
             )
+            _NOGIL_FOR = (state.referenceIndex, state.referenceString, options)
+        state.nogilMapper = _NOGIL_MAPPER
+    return state.nogilMapper
 
-        backReadAlignment.flag = compute_sam_flag(
-            is_read1=False, 
-            current=backReadAlignment, 
-            mate=frontReadAlignment
-        )
 
-        # Setting RNEXT and PNEXT fields
-        # Update FRONT Read (Look at Back Read)
-        if backReadAlignment.mapped:
-            frontReadAlignment.rnext = "="                  # Mate is on the same ref
-            frontReadAlignment.pnext = backReadAlignment.ref_start
-        else:
-            frontReadAlignment.rnext = "*"                  # Mate is unmapped
-            frontReadAlignment.pnext = 0
+@cython.profile(False)
+cpdef tuple process_read_pair_batch_nogil(object batch, int n_threads=0):
+    """
+    process_read_pair_batch on the GIL-free core (parallelization.nogil_core): every
+    distinct read the cache cannot answer is mapped in one call on n_threads OpenMP
+    threads (0 = one per CPU). Single-end short-read mapping only, pair-aware and
+    long-read options go through process_read_pair_batch.
+    """
+    cdef _WorkerState state = _WORKER.state
+    cdef object options = state.options
+    if state.pairedMapper is not None or options.longReads:
+        return process_read_pair_batch(batch)
+    cdef object mapper = _nogil_mapper(state)
+    cdef bint masked = options.seedMinQuality > 0
 
-        # Update BACK Read (Look at Front Read)
-        if frontReadAlignment.mapped:
-            backReadAlignment.rnext = "="                   # Mate is on the same ref
-            backReadAlignment.pnext = frontReadAlignment.ref_start
-        else:
-            backReadAlignment.rnext = "*"                   # Mate is unmapped
-            backReadAlignment.pnext = 0
-        
-        # set the SEQ fields
-        frontReadAlignment.seq = fReadSeq
-        backReadAlignment.seq = bReadSeq
+    cdef Py_ssize_t n = len(batch)
+    cdef list alignments = [None] * (2 * n)
+    cdef object stats = MappingStats()
+    cdef object cache = state.readCache
+    cdef list reads = [readPair[m] for _, readPair in batch for m in (0, 1)]
+    cdef list readUnits = [_unit(masked, read.getSequence(), read.getQualityScore()) for read in reads]
+    cdef list keys, seededUnits, templates
+    cdef dict rows, counts
+    cdef Py_ssize_t t
+    cdef object hit, template, quals
+    cdef bint profile = options.profile
+    cdef double batchStart = perf_counter() if profile else 0.0, mapStart = 0.0
 
-        frontReadAlignment.qual = fRead.getQualityScore()
-        backReadAlignment.qual = bRead.getQualityScore()
+    if cache is not None:
+        keys = [ReadCache.reads_key((read,), masked) for read in reads]
+    else:
+        keys = [None] * (2 * n)
+    # every distinct read the cache cannot answer, mapped once
+    seededUnits = list(dict.fromkeys([
+        readUnits[t] for t in range(2 * n) if cache is None or keys[t] not in cache
+    ]))
+    rows = {readUnit: j for j, readUnit in enumerate(seededUnits)}
+    quals = [qual for _, qual in seededUnits] if masked else None
+    if profile:
+        mapStart = perf_counter()
+    templates, counts = mapper.map_reads([seq for seq, _ in seededUnits], quals, options.seedMinQuality, n_threads)
+    if profile:
+        # seeding, chaining and alignment in one GIL-free call, timed as a whole
+        stats.time("nogil_map", perf_counter() - mapStart)
+    for name, value in counts.items():
+        stats.count(name, value)
 
-        # write into preallocated list
-        alignments[idx] = frontReadAlignment; idx += 1
-        alignments[idx] = backReadAlignment;  idx += 1
+    for t in range(2 * n):
+        hit = _cached(cache, stats, keys[t])
+        if hit is not None:
+            template = hit[0]
+        else:
+            if readUnits[t] in rows:
+                template = templates[rows[readUnits[t]]]
+            else:
+                # cached when the batch was seeded, evicted since
+                template = mapper.map_reads([readUnits[t][0]], [reads[t].getQualityScore()],
+                                                   options.seedMinQuality, 1)[0][0]
+            if cache is not None:
+                stats.count("cache_evictions", cache.put(keys[t], (template,)))
+        alignments[t] = alignment_from_template(reads[t].getIdentifier(), template)
+    for t in range(n):
+        _finish_pair(reads[2 * t], reads[2 * t + 1], alignments[2 * t], alignments[2 * t + 1])
 
-    return alignments
+    if cache is not None:
+        stats.peak("cache_bytes", cache.bytes)
+    if profile:
+        stats.count("reads", 2 * n)
+        stats.time("batch", perf_counter() - batchStart)
+    return alignments, stats
@@ -0,0 +1,276 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from typing import Callable, Iterable, Iterator, Sized, Tuple
+import math
+import os
+import sys
+import time
+
+from . import batch_reads
+from .batch_reads import process_read_pair_batch, _init_worker, _worker_state, _use_worker_state
+from ..index.reference_store import ReferenceStore
+
+BACKENDS = ("process", "thread", "openmp")
+BATCH_SECONDS = 0.5         # worker time a batch is sized for
+IN_FLIGHT_PER_WORKER = 2    # batches queued per worker, so none idles between batches
+RESIDENT_REFERENCES = 4     # references a ResidentPool worker keeps loaded
+RESIDENT_OPTION_SETS = 2    # ... and option sets per reference it keeps set up, each with its own read cache
+MAX_TASKS_PER_CHILD = 1000  # batches a ResidentPool worker maps before it is replaced
+
+
+def gil_enabled() -> bool:
+    # False only on a free-threaded build (3.13t) running with the GIL off
+    is_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_enabled is None else is_enabled()
+
+
+def available_cpus() -> int:
+    # CPUs this process may run on (cgroup / taskset / Slurm affinity), not all CPUs of the node
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count(requested: int, n_pairs: int, min_batch: int = None) -> int:
+    """
+    Workers worth starting: `requested` (0 = available_cpus()), but no more than there
+    are minimum-size batches of work.
+    """
+    workers = requested if requested > 0 else available_cpus()
+    return max(1, min(workers, math.ceil(n_pairs / (min_batch or BatchSizer.MIN_PAIRS))))
+
+
+class BatchSizer:
+    """
+    Batch size in read pairs, adapted from measured batch latency: every batch aims at
+    target_seconds of worker time, an exponential average of seconds per pair tracks the
+    data. Batches stay large enough to amortize dispatch and pickling and small enough to
+    keep latency and per-batch memory flat from thousands to billions of reads; the last
+    batches shrink so the tail is shared by all workers.
+    """
+    MIN_PAIRS = 16
+    MAX_PAIRS = 1 << 16
+    INITIAL_PAIRS = 256
+
+    def __init__(self, workers: int, target_seconds: float = BATCH_SECONDS, smoothing: float = 0.3):
+        self.workers = workers
+        self.target_seconds = target_seconds
+        self.smoothing = smoothing
+        self.seconds_per_pair = None
+
+    def next_size(self, remaining: int = None) -> int:
+        if self.seconds_per_pair is None:
+            size = self.INITIAL_PAIRS
+        else:
+            size = int(self.target_seconds / max(self.seconds_per_pair, 1e-9))
+        if remaining is not None:
+            size = min(size, math.ceil(remaining / self.workers))
+        return max(self.MIN_PAIRS, min(self.MAX_PAIRS, size))
+
+    def observe(self, pairs: int, seconds: float):
+        if pairs <= 0:
+            return
+        rate = seconds / pairs
+        if self.seconds_per_pair is None:
+            self.seconds_per_pair = rate
+        else:
+            self.seconds_per_pair += self.smoothing * (rate - self.seconds_per_pair)
+
+
+def _timed_call(fn: Callable, batch: list):
+    # runs in the worker: the latency the sizer sees excludes queueing and result transfer
+    startTime = time.perf_counter()
+    result = fn(batch)
+    return result, time.perf_counter() - startTime
+
+
+class BatchExecutor(ABC):
+    """
+    Runs process_read_pair_batch over read pairs on `workers` workers, each set up once
+    by _init_worker. imap() cuts the (index, readPair) pairs into adaptively sized batches
+    and yields the (alignments, stats) of every batch in input order, while later
+    batches are still mapping. Use as a context manager, or call close().
+    """
+    def __init__(self, workers: int, referenceIndex, referenceString: str, options=None):
+        self.workers = workers
+        self.initargs = (referenceIndex, referenceString, options)
+
+    @abstractmethod
+    def _submit(self, batch: list) -> Callable[[], Tuple[Tuple[list, object], float]]:
+        # start mapping batch, return a function waiting for (result, worker seconds)
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def imap(self, indexedPairs: Iterable, batch_seconds: float = BATCH_SECONDS) -> Iterator[Tuple[list, object]]:
+        # a list sizes the tail batches; any other iterable is consumed lazily, only as far
+        # as the batches in flight reach, so it can be parsed while earlier batches map
+        sizer = BatchSizer(self.workers, target_seconds=batch_seconds)
+        total = len(indexedPairs) if isinstance(indexedPairs, Sized) else None
+        source = iter(indexedPairs)
+        pending = deque()
+        start = 0
+        exhausted = False
+        while not exhausted or pending:
+            while not exhausted and len(pending) < IN_FLIGHT_PER_WORKER * self.workers:
+                batch = list(islice(source, sizer.next_size(None if total is None else total - start)))
+                if not batch:
+                    exhausted = True
+                    break
+                start += len(batch)
+                pending.append((len(batch), self._submit(batch)))
+            if not pending:
+                break
+            pairs, wait = pending.popleft()
+            result, seconds = wait()
+            sizer.observe(pairs, seconds)
+            yield result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProcessBatchExecutor(BatchExecutor):
+    """
+    multiprocessing.Pool: every worker process receives its own pickled copy of the
+    index and reference, batches and results are pickled across.
+    """
+    def __init__(self, workers: int, referenceIndex, referenceString: str, options=None):
+        super().__init__(workers, referenceIndex, referenceString, options)
+        self._pool = Pool(processes=workers, initializer=_init_worker, initargs=self.initargs)
+
+    def _submit(self, batch: list):
+        return self._pool.apply_async(_timed_call, (process_read_pair_batch, batch)).get
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class ThreadBatchExecutor(BatchExecutor):
+    """
+    ThreadPoolExecutor in this process: all threads share the one index and reference,
+    nothing is copied or pickled. Each thread gets its own extender, minimizer, read
+    cache and insert-size estimate from _init_worker. Threads run in parallel on
+    free-threaded CPython; in the compiled build short-read batches also run through
+    the GIL-free core, which releases the GIL on any interpreter.
+    """
+    def __init__(self, workers: int, referenceIndex, referenceString: str, options=None):
+        super().__init__(workers, referenceIndex, referenceString, options)
+        self._pool = ThreadPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=self.initargs)
+        self._batch_fn = self._select_batch_fn()
+
+    @staticmethod
+    def _select_batch_fn() -> Callable:
+        nogil_batch = getattr(batch_reads, "process_read_pair_batch_nogil", None)
+        if nogil_batch is None:
+            return process_read_pair_batch
+        # the pool already supplies the parallelism: one OpenMP thread per batch
+        return partial(nogil_batch, n_threads=1)
+
+    def _submit(self, batch: list):
+        return self._pool.submit(_timed_call, self._batch_fn, batch).result
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+class OpenMPBatchExecutor(ThreadBatchExecutor):
+    """
+    One batch at a time on the GIL-free core, its reads spread over `workers` OpenMP
+    threads: the index is shared as in the thread backend, but no Python thread maps, so
+    nothing contends for the GIL. Compiled build only. Pair-aware and long-read batches
+    do not run on the GIL-free core and so map on one thread.
+    """
+    def __init__(self, workers: int, referenceIndex, referenceString: str, options=None):
+        nogil_batch = getattr(batch_reads, "process_read_pair_batch_nogil", None)
+        if nogil_batch is None:
+            raise ValueError("the openmp backend needs the compiled build (python setup.py build_ext --inplace)")
+        # a single batch in flight at a time, as large as the sizer finds worth it
+        super().__init__(1, referenceIndex, referenceString, options)
+        self._batch_fn = partial(nogil_batch, n_threads=workers)
+
+
+# worker side of ResidentPool, one of each per worker process
+_RESIDENT = OrderedDict()   # reference id -> ((index, reference string), [(options, worker state)]), least recently used first
+_ACTIVE = None              # (reference id, options) of the worker state in use
+
+
+def _map_resident(storeRoot: str, refId: str, options, batch: list):
+    global _ACTIVE
+    if _ACTIVE != (refId, options):
+        resident = _RESIDENT.pop(refId, None)
+        if resident is None:
+            resident = (ReferenceStore(storeRoot).load(refId), [])
+        _RESIDENT[refId] = resident
+        while len(_RESIDENT) > RESIDENT_REFERENCES:
+            _RESIDENT.popitem(last=False)
+        # read cache and insert-size estimate belong to one reference and option set:
+        # requests interleaving their batches on this worker switch between their own
+        reference, states = resident
+        found = next((i for i, (stateOptions, _) in enumerate(states) if stateOptions == options), None)
+        if found is None:
+            _init_worker(*reference, options)
+            states.append((options, _worker_state()))
+            if len(states) > RESIDENT_OPTION_SETS:
+                del states[0]
+        else:
+            states.append(states.pop(found))
+            _use_worker_state(states[-1][1])
+        _ACTIVE = (refId, options)
+    return process_read_pair_batch(batch)
+
+
+class ResidentPool:
+    """
+    Long-lived worker processes for a server, started once and shared by all requests.
+    Workers know no reference up front: each batch names a reference id in `store`, a
+    worker loads it on first use (the index memory-mapped) and keeps the last
+    RESIDENT_REFERENCES resident, so a request against a known reference starts mapping
+    at once. Workers are replaced after max_tasks batches, which bounds the memory a
+    long-running worker can accumulate.
+    """
+    def __init__(self, workers: int, store: ReferenceStore, max_tasks: int = MAX_TASKS_PER_CHILD):
+        self.workers = workers
+        self.store = store
+        self._pool = Pool(processes=workers, maxtasksperchild=max_tasks or None)
+
+    def executor(self, refId: str, options=None) -> BatchExecutor:
+        return _ResidentExecutor(self, refId, options)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class _ResidentExecutor(BatchExecutor):
+    # imap of one request over a ResidentPool, closing it leaves the pool running
+    def __init__(self, pool: ResidentPool, refId: str, options=None):
+        self.workers = pool.workers
+        self._pool = pool._pool
+        self._map = partial(_map_resident, pool.store.root, refId, options)
+
+    def _submit(self, batch: list):
+        return self._pool.apply_async(_timed_call, (self._map, batch)).get
+
+    def close(self):
+        pass
+
+
+def make_executor(backend: str, workers: int, referenceIndex, referenceString: str, options=None) -> BatchExecutor:
+    if backend == "process":
+        return ProcessBatchExecutor(workers, referenceIndex, referenceString, options)
+    if backend == "thread":
+        return ThreadBatchExecutor(workers, referenceIndex, referenceString, options)
+    if backend == "openmp":
+        return OpenMPBatchExecutor(workers, referenceIndex, referenceString, options)
+    raise ValueError(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,142 @@
+import csv
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import psutil
+
+MB = 2**20
+
+
+@dataclass
+class PhasePeak:
+    seconds: float = 0.0
+    rss: int = 0
+    uss: int = 0
+    pss: int = 0
+    processes: int = 0
+
+
+class MemorySampler:
+    """
+    Samples the memory of this process and all of its descendants (pool workers) every
+    `interval` seconds on a background thread, so transient peaks between phases are
+    seen too. Three totals are kept:
+      rss - resident pages summed per process; pages shared between processes (the
+            index mapped by every worker, copy-on-write pages after fork) count once per process
+      uss - pages private to each process, what killing the processes would free
+      pss - shared pages split between the processes sharing them, the honest total
+    USS and PSS come from /proc/<pid>/smaps (Linux); elsewhere they read as 0.
+    Samples are attributed to the phase set with phase(), report() gives the peak of
+    each phase, and csvPath receives every sample for capacity planning.
+    """
+
+    def __init__(self, interval: float = 0.1, csvPath: str = None):
+        self.interval = interval
+        self.csvPath = csvPath
+        self.process = psutil.Process(os.getpid())
+        self.peaks: Dict[str, PhasePeak] = {}
+        self.samples: List[Tuple[float, str, int, int, int, int]] = []   # (seconds, phase, processes, rss, uss, pss)
+        self._phase : str = None   # no samples are kept outside a phase
+        self._phaseStart = self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()   # a phase started: sample now rather than at the next tick
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def start(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.set_phase(None)
+        if self.csvPath:
+            self.write_csv(self.csvPath)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def set_phase(self, name: str):
+        # label and timestamp only: sampling reads /proc/<pid>/smaps of every process and is
+        # left to the background thread, woken so that a short phase gets its sample too
+        with self._lock:
+            now = time.perf_counter()
+            if self._phase is not None:
+                self.peaks.setdefault(self._phase, PhasePeak()).seconds += now - self._phaseStart
+            self._phase, self._phaseStart = name, now
+        self._wake.set()
+
+    @contextmanager
+    def phase(self, name: str):
+        previous = self._phase
+        self.set_phase(name)
+        try:
+            yield self
+        finally:
+            self.set_phase(previous)
+
+    def sample(self):
+        rss = uss = pss = 0
+        processes = [self.process] + self.process.children(recursive=True)
+        for process in processes:
+            try:
+                info = process.memory_full_info()
+            except psutil.AccessDenied:
+                info = process.memory_info()
+            except psutil.NoSuchProcess:
+                continue
+            rss += info.rss
+            uss += getattr(info, "uss", 0)
+            pss += getattr(info, "pss", 0)
+        with self._lock:
+            if self._phase is None:
+                return
+            peak = self.peaks.setdefault(self._phase, PhasePeak())
+            peak.rss = max(peak.rss, rss)
+            peak.uss = max(peak.uss, uss)
+            peak.pss = max(peak.pss, pss)
+            peak.processes = max(peak.processes, len(processes))
+            self.samples.append((time.perf_counter() - self._start, self._phase, len(processes), rss, uss, pss))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.sample()
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="") as out:
+            writer = csv.writer(out)
+            writer.writerow(["seconds", "phase", "processes", "rss_mb", "uss_mb", "pss_mb"])
+            for seconds, phase, processes, rss, uss, pss in self.samples:
+                writer.writerow([f"{seconds:.3f}", phase, processes, f"{rss / MB:.1f}", f"{uss / MB:.1f}", f"{pss / MB:.1f}"])
+
+    def peak(self) -> PhasePeak:
+        overall = PhasePeak()
+        for peak in self.peaks.values():
+            overall.seconds += peak.seconds
+            overall.rss, overall.uss, overall.pss = max(overall.rss, peak.rss), max(overall.uss, peak.uss), max(overall.pss, peak.pss)
+            overall.processes = max(overall.processes, peak.processes)
+        return overall
+
+    def to_dict(self) -> Dict[str, dict]:
+        phases = dict(self.peaks, peak=self.peak())
+        return {name: {"seconds": peak.seconds, "processes": peak.processes, "rss_mb": peak.rss / MB,
+                       "uss_mb": peak.uss / MB, "pss_mb": peak.pss / MB} for name, peak in phases.items()}
+
+    def report(self) -> List[str]:
+        lines = [f"{'phase':<16} {'seconds':>8} {'procs':>6} {'peak RSS MB':>12} {'peak USS MB':>12} {'peak PSS MB':>12}"]
+        for name, peak in list(self.peaks.items()) + [("peak", self.peak())]:
+            lines.append(f"{name:<16} {peak.seconds:>8.2f} {peak.processes:>6} {peak.rss / MB:>12.1f} "
+                         f"{peak.uss / MB:>12.1f} {peak.pss / MB:>12.1f}")
+        return lines
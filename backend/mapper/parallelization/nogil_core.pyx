@@ -0,0 +1,815 @@
+# cython: language_level=3
+# cython: boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+
+"""
+GIL-free short-read mapping core. Seeding (minimizers), index lookup, exact-diagonal
+chaining, the ungapped fast path and the banded semi-global DP all run on 2-bit coded
+reads and reference in plain C, so a batch is mapped with prange across OpenMP
+threads of one process, all sharing a single copy of the index and the reference.
+Same scoring and selection as Minimizer / Chainer / Extender; pair-aware and
+long-read mapping stay on the Python path.
+"""
+
+import os
+import numpy as np
+
+cimport cython
+from cython.parallel cimport prange
+from libc.stdlib cimport malloc, realloc, free, qsort
+from libc.string cimport memset
+from libc.stdint cimport uint8_t, int32_t, int64_t, uint64_t
+from libc.math cimport ceil
+
+from ..constants.constants import KMERSIZE, WINDOWSIZE
+
+# Hash codes (base 4: A0 T1 G2 C3, the complement is code ^ 1), 4 = ambiguous base
+_CODE = np.full(256, 4, dtype=np.uint8)
+for _i, _base in enumerate("ATGC"):
+    _CODE[ord(_base)] = _i
+    _CODE[ord(_base.lower())] = _i
+
+DEF AMBIGUOUS = 4
+DEF INF = 1000000000
+DEF MAPQ_UNIQUE = 60        # as in extend.extender
+DEF MAPQ_PER_EDIT = 10
+DEF OP_I = 0
+DEF OP_D = 1
+DEF OP_M = 2
+
+# per-read event counters, summed into MappingStats names by map_reads
+DEF EV_UNGAPPED_ATTEMPTS = 0
+DEF EV_UNGAPPED_HITS = 1
+DEF EV_DP_WINDOWS = 2
+DEF EV_BAND_WIDENINGS = 3
+DEF EV_BAND_INITIAL = 4
+DEF EV_BAND_WIDENED_WINDOWS = 5
+DEF EV_BAND_LOST = 6
+DEF EV_FILTER_ANCHORS = 7
+DEF EV_FILTER_COVERAGE = 8
+DEF EV_FILTER_REJECTED_READS = 9
+DEF EV_SEEDED_READS = 10
+DEF EV_ANCHORS = 11
+DEF EV_MASKED_KMERS = 12
+DEF N_EVENTS = 13
+_EVENT_NAMES = ("ungapped_attempts", "ungapped_hits", "dp_windows", "band_widenings", "band_initial",
+                "band_widened_windows", "band_lost", "filter_anchors", "filter_coverage", "filter_rejected_reads",
+                "seeded_reads", "seed_anchors", "seed_masked_kmers")
+
+cdef uint64_t MASKED = 0xFFFFFFFFFFFFFFFF
+
+
+cdef struct Params:
+    const uint64_t* keys
+    const int64_t* offsets
+    const int64_t* positions
+    const uint8_t* reverse
+    int64_t n_keys
+    const uint8_t* ref
+    int64_t ref_len
+    int k, w, max_chains, min_band, max_band, min_chain_anchors, max_occurrences
+    double max_edit_rate, ungapped_max_rate, band_rate, min_chain_coverage
+    bint complete_seeds     # no occurrence cutoff or quality mask: the early exit is sound
+
+cdef struct Anchor:
+    int64_t r
+    int32_t q
+    int32_t order       # rank in (q, r) order
+    int64_t key         # diagonal: q - r on the same strand, q + r on the other
+    uint8_t same
+
+cdef struct Group:
+    int32_t start       # first member in the grouped anchor array
+    int32_t count
+    int32_t first       # (q, r) rank of its first anchor, ties between equal counts
+
+cdef struct Hit:
+    int64_t ref_start
+    int64_t ref_end
+    int32_t edit
+    int32_t n_ops
+    uint8_t strand_plus
+
+
+cdef int _cmp_qr(const void* a, const void* b) noexcept nogil:
+    cdef const Anchor* x = <const Anchor*>a
+    cdef const Anchor* y = <const Anchor*>b
+    if x.q != y.q:
+        return -1 if x.q < y.q else 1
+    if x.r != y.r:
+        return -1 if x.r < y.r else 1
+    return 0
+
+cdef int _cmp_diagonal(const void* a, const void* b) noexcept nogil:
+    cdef const Anchor* x = <const Anchor*>a
+    cdef const Anchor* y = <const Anchor*>b
+    if x.same != y.same:
+        return -1 if x.same < y.same else 1
+    if x.key != y.key:
+        return -1 if x.key < y.key else 1
+    return x.order - y.order
+
+cdef int _cmp_groups(const void* a, const void* b) noexcept nogil:
+    cdef const Group* x = <const Group*>a
+    cdef const Group* y = <const Group*>b
+    if x.count != y.count:
+        return -1 if x.count > y.count else 1
+    return x.first - y.first
+
+
+cdef int _minimizers(const uint8_t* s, int L, int k, int w,
+                     uint64_t* kmer_hash, uint8_t* kmer_rev,
+                     uint64_t* out_hash, int32_t* out_pos, uint8_t* out_rev) noexcept nogil:
+    """
+    Minimizer.extract on codes: canonical k-mer hashes, leftmost minimum of every window
+    of w k-mers reported once, k-mers over ambiguous bases never chosen.
+    """
+    cdef int n_kmers = L - k + 1
+    cdef int i, j, start, last_bad = -1, n = 0, last_pos = -1, best_pos
+    cdef uint64_t fwd = 0, rev = 0, best
+    cdef uint64_t kmask = MASKED if k >= 32 else ((<uint64_t>1) << (2 * k)) - 1
+    cdef int shift = 2 * (k - 1)
+    cdef uint8_t c
+    if L < k + w - 1:
+        return 0
+    for i in range(L):
+        c = s[i]
+        if c == AMBIGUOUS:
+            last_bad = i
+            c = 0
+        fwd = ((fwd << 2) | c) & kmask
+        rev = (rev >> 2) | ((<uint64_t>(c ^ 1)) << shift)
+        start = i - k + 1
+        if start < 0:
+            continue
+        if last_bad >= start:
+            kmer_hash[start] = MASKED
+            kmer_rev[start] = 0
+        elif rev < fwd:
+            kmer_hash[start] = rev
+            kmer_rev[start] = 1
+        else:
+            kmer_hash[start] = fwd
+            kmer_rev[start] = 0
+    for i in range(n_kmers - w + 1):
+        best = kmer_hash[i]
+        best_pos = i
+        for j in range(i + 1, i + w):
+            if kmer_hash[j] < best:
+                best = kmer_hash[j]
+                best_pos = j
+        if best_pos != last_pos and best != MASKED:
+            out_hash[n] = best
+            out_pos[n] = best_pos
+            out_rev[n] = kmer_rev[best_pos]
+            n += 1
+            last_pos = best_pos
+    return n
+
+
+cdef int64_t _find(const Params* p, uint64_t h) noexcept nogil:
+    # index of h in the sorted keys, -1 if absent or above the occurrence cutoff
+    cdef int64_t lo = 0, hi = p.n_keys, mid
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if p.keys[mid] < h:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < p.n_keys and p.keys[lo] == h:
+        if p.max_occurrences > 0 and p.offsets[lo + 1] - p.offsets[lo] > p.max_occurrences:
+            return -1
+        return lo
+    return -1
+
+
+cdef bint _grow(void** buf, size_t* cap, size_t need) noexcept nogil:
+    # scratch buffers are reused by every window of a read and only ever grow
+    cdef void* p
+    if need <= cap[0]:
+        return True
+    p = realloc(buf[0], max(need, 2 * cap[0]))
+    if p == NULL:
+        return False
+    buf[0] = p
+    cap[0] = max(need, 2 * cap[0])
+    return True
+
+
+cdef struct Scratch:
+    int32_t* rows           # two DP score rows
+    int32_t* bounds         # [lo, hi] band of every row
+    uint8_t* ops            # traceback of the current window, read order
+    uint8_t* best_ops       # ... and of the best hit so far
+    uint8_t* trace
+    size_t trace_cap
+    uint64_t* peq           # Myers match masks, 64-bit blocks per code
+    uint64_t* pv
+    uint64_t* mv
+
+
+cdef int _myers(const uint8_t* q, int m, const uint8_t* t, int n, Scratch* s, int* j_end) noexcept nogil:
+    """
+    myers_semiglobal on codes, with the read split into 64-bit blocks (Hyyro's carry
+    between blocks). Returns the minimum of the last DP row, j_end its first column.
+    """
+    cdef int blocks = (m + 63) >> 6, b, i, j, hout, hin, score = m, best = m
+    cdef uint64_t high = (<uint64_t>1) << ((m - 1) & 63)
+    cdef uint64_t eq, xv, xh, ph, mh, pv, mv, top
+    j_end[0] = 0
+    for b in range(5 * blocks):
+        s.peq[b] = 0
+    for i in range(m):
+        if q[i] != AMBIGUOUS:
+            s.peq[q[i] * blocks + (i >> 6)] |= (<uint64_t>1) << (i & 63)
+    for b in range(blocks):
+        s.pv[b] = MASKED
+        s.mv[b] = 0
+    for j in range(n):
+        hin = 0                                 # row 0 is free on the reference
+        for b in range(blocks):
+            eq = s.peq[t[j] * blocks + b]
+            pv = s.pv[b]
+            mv = s.mv[b]
+            top = high if b == blocks - 1 else (<uint64_t>1) << 63
+            xv = eq | mv
+            if hin < 0:
+                eq |= 1
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            hout = 1 if ph & top else (-1 if mh & top else 0)
+            ph <<= 1
+            mh <<= 1
+            if hin < 0:
+                mh |= 1
+            elif hin > 0:
+                ph |= 1
+            s.pv[b] = mh | ~(xv | ph)
+            s.mv[b] = ph & xv
+            hin = hout
+        score += hin
+        if score < best:
+            best = score
+            j_end[0] = j + 1
+    return best
+
+
+cdef bint _band_holds(int m, int n, int diag, int band, int score, int j_end) noexcept nogil:
+    # band_holds: every optimal alignment ending in j_end lies inside the band
+    cdef int d_end = j_end - m, i, lo, hi, center
+    for i in range(1, m + 1):
+        lo = max(0, max(i - score, i + d_end - score))
+        hi = min(j_end, i + d_end + score)
+        if lo > hi:
+            continue
+        center = max(0, min(n, i + diag))
+        if lo < center - band or hi > center + band:
+            return False
+    return True
+
+
+cdef int _banded(const uint8_t* q, int m, const uint8_t* t, int n, int diag, int bw,
+                 Scratch* s, Hit* hit) noexcept nogil:
+    """
+    Extender._banded_semiglobal with free start and end on t: edit distance of q against
+    a substring of t, banded around j = i + diag. Fills hit (coordinates local to t) and
+    s.ops in read order. Returns the score, or -1 if the band holds no complete path.
+    """
+    cdef int width = min(n + 1, 2 * bw + 1)
+    cdef int32_t* prev = s.rows
+    cdef int32_t* cur = s.rows + (n + 1)
+    cdef int32_t* tmp
+    cdef int i, j, j_lo, j_hi, center, p_lo = 0, p_hi = n
+    cdef int ins, left, dg, score, j_end, n_ops = 0, t_first = -1, t_last = -1
+    cdef int64_t row
+    cdef uint8_t qi, d
+    if not _grow(<void**>&s.trace, &s.trace_cap, <size_t>m * width):
+        return -1
+    for j in range(n + 1):
+        prev[j] = 0
+    for i in range(1, m + 1):
+        center = max(0, min(n, i + diag))
+        j_lo = max(0, center - bw)
+        j_hi = min(n, center + bw)
+        s.bounds[2 * i - 2] = j_lo
+        s.bounds[2 * i - 1] = j_hi
+        row = <int64_t>(i - 1) * width - j_lo
+        qi = q[i - 1]
+        for j in range(j_lo, j_hi + 1):
+            ins = (prev[j] if p_lo <= j <= p_hi else INF) + 1
+            if j > 0:
+                left = (cur[j - 1] if j > j_lo else INF) + 1
+                dg = (prev[j - 1] if p_lo < j <= p_hi + 1 else INF) + (0 if (qi == t[j - 1] and qi != AMBIGUOUS) else 1)
+            else:
+                left = INF
+                dg = INF
+            if dg <= left and dg <= ins:
+                cur[j] = dg
+                s.trace[row + j] = OP_M
+            elif left <= ins:
+                cur[j] = left
+                s.trace[row + j] = OP_D
+            else:
+                cur[j] = ins
+                s.trace[row + j] = OP_I
+        tmp = prev
+        prev = cur
+        cur = tmp
+        p_lo = j_lo
+        p_hi = j_hi
+
+    j_end = 0
+    score = INF
+    for j in range(p_lo, p_hi + 1):
+        if prev[j] < score:
+            j_end = j
+            score = prev[j]
+    if score >= INF:
+        return -1
+
+    # traceback, collected backwards and reversed in place
+    i = m
+    j = j_end
+    while i > 0:
+        j_lo = s.bounds[2 * i - 2]
+        j_hi = s.bounds[2 * i - 1]
+        if j < j_lo or j > j_hi:
+            return -1
+        d = s.trace[<int64_t>(i - 1) * width + j - j_lo]
+        s.ops[n_ops] = d
+        n_ops += 1
+        if d != OP_I:
+            if t_last < 0:
+                t_last = j
+            t_first = j - 1
+            j -= 1
+        if d != OP_D:
+            i -= 1
+    for i in range(n_ops // 2):
+        d = s.ops[i]
+        s.ops[i] = s.ops[n_ops - 1 - i]
+        s.ops[n_ops - 1 - i] = d
+    if t_last < 0:
+        t_first = t_last = j_end
+    hit.ref_start = max(0, t_first)
+    hit.ref_end = t_last
+    hit.edit = score
+    hit.n_ops = n_ops
+    return score
+
+
+cdef int _align_window(const Params* p, const uint8_t* q, int m, int64_t ref_lo, int64_t ref_hi,
+                       int diag, int band, bint widen, Scratch* s, Hit* hit, int32_t* events) noexcept nogil:
+    """
+    Extender._align_in_window: Myers lower bound first, then the traceback on the thin
+    slice around the unbanded optimum when the band provably holds it, else the banded DP.
+    Returns 1 for a hit, 0 for none, 2 if the alignment may escape and widen is set.
+    """
+    cdef int n, lower, j_end, j_lo, score
+    cdef bint holds
+    if ref_lo < 0:
+        diag += <int>ref_lo
+        ref_lo = 0
+    if ref_hi > p.ref_len:
+        ref_hi = p.ref_len
+    if ref_hi <= ref_lo:
+        return 0
+    n = <int>(ref_hi - ref_lo)
+    lower = _myers(q, m, p.ref + ref_lo, n, s, &j_end)
+    if lower > p.max_edit_rate * m:
+        return 0
+    holds = _band_holds(m, n, diag, band, lower, j_end)
+    if not holds and widen:
+        return 2
+    if holds:
+        j_lo = max(0, j_end - m - lower)
+        score = _banded(q, m, p.ref + ref_lo + j_lo, j_end - j_lo, j_end - j_lo - m, lower, s, hit)
+        ref_lo += j_lo
+    else:
+        score = _banded(q, m, p.ref + ref_lo, n, diag, band, s, hit)
+    if score < 0:
+        events[EV_BAND_LOST] += 1
+        return 0
+    if score > p.max_edit_rate * m:
+        return 0
+    hit.ref_start += ref_lo
+    hit.ref_end += ref_lo
+    return 1
+
+
+cdef bint _align_chain(const Params* p, const uint8_t* q_seq, int L, Anchor* chain, int n_chain,
+                       Scratch* s, Hit* hit, int32_t* events) noexcept nogil:
+    """
+    Extender._align_chain: ungapped placement on the chain's diagonal for chains spanning
+    half the read, else the banded DP in the chain's window, widened while the alignment
+    may leave the band. q_seq is the read in the chain's orientation.
+    """
+    cdef bint same = chain[0].same
+    cdef int64_t r0 = chain[0].r, c, ref_start
+    cdef int q0 = chain[0].q, k = p.k
+    cdef int i, mismatches, band, initial_band, status
+    cdef uint8_t a
+    hit.strand_plus = same
+    c = r0 - q0 if same else r0 + q0 + k - L
+
+    # 1) ungapped fast path
+    if chain[n_chain - 1].q + k - q0 >= L // 2 and c >= 0 and c + L <= p.ref_len:
+        events[EV_UNGAPPED_ATTEMPTS] += 1
+        mismatches = 0
+        for i in range(L):
+            a = q_seq[i]
+            if a != p.ref[c + i] or a == AMBIGUOUS:
+                mismatches += 1
+        if mismatches <= p.ungapped_max_rate * L:
+            events[EV_UNGAPPED_HITS] += 1
+            hit.ref_start = c
+            hit.ref_end = c + L
+            hit.edit = mismatches
+            hit.n_ops = L
+            for i in range(L):
+                s.ops[i] = OP_M
+            return True
+
+    # 2) banded DP; exact-diagonal chains have no diagonal spread of their own
+    band = initial_band = min(p.max_band, max(p.min_band, <int>ceil(p.band_rate * L)))
+    events[EV_DP_WINDOWS] += 1
+    events[EV_BAND_INITIAL] += band
+    while True:
+        status = _align_window(p, q_seq, L, c - band, c + L + band, band, band, band < p.max_band, s, hit, events)
+        if status != 2:
+            break
+        band = min(p.max_band, 2 * band)
+        events[EV_BAND_WIDENINGS] += 1
+    if band > initial_band:
+        events[EV_BAND_WIDENED_WINDOWS] += 1
+    return status == 1
+
+
+cdef struct Work:
+    uint64_t* kmer_hash
+    uint8_t* kmer_rev
+    uint64_t* mh            # minimizers: hash, read position, reverse flag
+    int32_t* mp
+    uint8_t* mr
+    uint8_t* read_rc
+    int64_t* visited        # window start and strand of every chain aligned so far
+    uint8_t* visited_strand
+    int32_t* hit_edits
+    Anchor* anchors
+    Group* groups
+    int n_anchors
+    uint8_t* covered        # read bases covered by the anchors of a locus, _locus_anchors
+    Scratch s
+
+
+cdef int _locus_anchors(const Params* p, Work* wk, const Group* g, int L) noexcept nogil:
+    # extender.locus_read_positions: the anchors within max_band diagonals of the chain;
+    # marks the read bases their k-mers cover in wk.covered and returns how many there are
+    cdef int i, lo = g.start, hi = g.start + g.count
+    cdef int64_t key = wk.anchors[g.start].key
+    cdef uint8_t same = wk.anchors[g.start].same
+    # anchors are in (strand, diagonal) order: the neighbourhood is one range around the chain
+    while lo > 0 and wk.anchors[lo - 1].same == same and wk.anchors[lo - 1].key >= key - p.max_band:
+        lo -= 1
+    while hi < wk.n_anchors and wk.anchors[hi].same == same and wk.anchors[hi].key <= key + p.max_band:
+        hi += 1
+    memset(wk.covered, 0, L)
+    for i in range(lo, hi):
+        memset(wk.covered + wk.anchors[i].q, 1, min(p.k, L - wk.anchors[i].q))
+    return hi - lo
+
+
+cdef int _locus_edit_bound(const Params* p, Work* wk, const Group* g, int L) noexcept nogil:
+    # extender.locus_edit_lower_bound: an uncovered stretch of g bases of the locus
+    # needs g // (w + k - 1) edits
+    cdef int i, bound = 0, run = 0, span = p.w + p.k - 1
+    _locus_anchors(p, wk, g, L)
+    for i in range(L):
+        if wk.covered[i]:
+            bound += run // span
+            run = 0
+        else:
+            run += 1
+    return bound + run // span
+
+
+cdef bint _alloc_work(Work* wk, int L, const Params* p) noexcept nogil:
+    cdef int blocks = (L + 63) >> 6
+    cdef int n_t = L + 2 * p.max_band + 1     # widest window the DP can see
+    wk.kmer_hash = <uint64_t*>malloc(L * sizeof(uint64_t))
+    wk.kmer_rev = <uint8_t*>malloc(L)
+    wk.mh = <uint64_t*>malloc(L * sizeof(uint64_t))
+    wk.mp = <int32_t*>malloc(L * sizeof(int32_t))
+    wk.mr = <uint8_t*>malloc(L)
+    wk.read_rc = <uint8_t*>malloc(L)
+    wk.covered = <uint8_t*>malloc(L)
+    wk.visited = <int64_t*>malloc(p.max_chains * sizeof(int64_t))
+    wk.visited_strand = <uint8_t*>malloc(p.max_chains)
+    wk.hit_edits = <int32_t*>malloc(p.max_chains * sizeof(int32_t))
+    wk.anchors = NULL
+    wk.groups = NULL
+    wk.n_anchors = 0
+    wk.s.rows = <int32_t*>malloc(2 * (n_t + 1) * sizeof(int32_t))
+    wk.s.bounds = <int32_t*>malloc(2 * L * sizeof(int32_t))
+    wk.s.ops = <uint8_t*>malloc(L + n_t + 1)
+    wk.s.best_ops = <uint8_t*>malloc(L + n_t + 1)
+    wk.s.trace = NULL
+    wk.s.trace_cap = 0
+    wk.s.peq = <uint64_t*>malloc(5 * blocks * sizeof(uint64_t))
+    wk.s.pv = <uint64_t*>malloc(blocks * sizeof(uint64_t))
+    wk.s.mv = <uint64_t*>malloc(blocks * sizeof(uint64_t))
+    return not (wk.kmer_hash == NULL or wk.kmer_rev == NULL or wk.mh == NULL or wk.mp == NULL
+                or wk.mr == NULL or wk.read_rc == NULL or wk.covered == NULL or wk.visited == NULL or wk.visited_strand == NULL
+                or wk.hit_edits == NULL or wk.s.rows == NULL or wk.s.bounds == NULL or wk.s.ops == NULL
+                or wk.s.best_ops == NULL or wk.s.peq == NULL or wk.s.pv == NULL or wk.s.mv == NULL)
+
+
+cdef void _free_work(Work* wk) noexcept nogil:
+    free(wk.kmer_hash); free(wk.kmer_rev); free(wk.mh); free(wk.mp); free(wk.mr); free(wk.read_rc)
+    free(wk.covered)
+    free(wk.visited); free(wk.visited_strand); free(wk.hit_edits); free(wk.anchors); free(wk.groups)
+    free(wk.s.rows); free(wk.s.bounds); free(wk.s.ops); free(wk.s.best_ops); free(wk.s.trace)
+    free(wk.s.peq); free(wk.s.pv); free(wk.s.mv)
+
+
+cdef int _chains(const Params* p, Work* wk, const uint8_t* seed, int L, int32_t* events) noexcept nogil:
+    """
+    Minimizer.extract, the index lookup and Chainer.chains: exact-diagonal chains in
+    wk.groups, ranked by anchor count, ties by first appearance in (q, r) order.
+    Returns the number of chains kept (at most max_chains), -1 if out of memory.
+    """
+    cdef int n_min, i, n_groups, n_anchors = 0
+    cdef int64_t idx, h
+    n_min = _minimizers(seed, L, p.k, p.w, wk.kmer_hash, wk.kmer_rev, wk.mh, wk.mp, wk.mr)
+    for i in range(L - p.k + 1):
+        if wk.kmer_hash[i] == MASKED:
+            events[EV_MASKED_KMERS] += 1
+    for i in range(n_min):
+        idx = _find(p, wk.mh[i])
+        if idx >= 0:
+            n_anchors += <int>(p.offsets[idx + 1] - p.offsets[idx])
+    events[EV_ANCHORS] += n_anchors
+    if n_anchors == 0:
+        return 0
+    wk.anchors = <Anchor*>malloc(n_anchors * sizeof(Anchor))
+    wk.groups = <Group*>malloc(n_anchors * sizeof(Group))
+    if wk.anchors == NULL or wk.groups == NULL:
+        return -1
+    n_anchors = 0
+    for i in range(n_min):
+        idx = _find(p, wk.mh[i])
+        if idx < 0:
+            continue
+        for h in range(p.offsets[idx], p.offsets[idx + 1]):
+            wk.anchors[n_anchors].r = p.positions[h]
+            wk.anchors[n_anchors].q = wk.mp[i]
+            wk.anchors[n_anchors].same = (p.reverse[h] != 0) == (wk.mr[i] != 0)
+            n_anchors += 1
+
+    qsort(wk.anchors, n_anchors, sizeof(Anchor), _cmp_qr)
+    for i in range(n_anchors):
+        wk.anchors[i].order = i
+        wk.anchors[i].key = (wk.anchors[i].q - wk.anchors[i].r) if wk.anchors[i].same else (wk.anchors[i].q + wk.anchors[i].r)
+    qsort(wk.anchors, n_anchors, sizeof(Anchor), _cmp_diagonal)
+    wk.n_anchors = n_anchors
+    n_groups = 0
+    for i in range(n_anchors):
+        if i == 0 or wk.anchors[i].same != wk.anchors[i - 1].same or wk.anchors[i].key != wk.anchors[i - 1].key:
+            wk.groups[n_groups].start = i
+            wk.groups[n_groups].count = 0
+            wk.groups[n_groups].first = wk.anchors[i].order
+            n_groups += 1
+        wk.groups[n_groups - 1].count += 1
+    qsort(wk.groups, n_groups, sizeof(Group), _cmp_groups)
+    return min(n_groups, p.max_chains)
+
+
+cdef void _map_one(const Params* p, const uint8_t* read, const uint8_t* seed, int L,
+                   int64_t* ref_start, int64_t* ref_end, uint8_t* strand, int32_t* edit, int32_t* mapq,
+                   uint8_t* run_op, int32_t* run_len, int32_t* n_runs, int32_t* events) noexcept nogil:
+    """
+    Extender.extend for one read: up to max_chains chains, best (lowest edit) hit wins,
+    MAPQ from the edit gap to the runner-up. edit stays -1 when unmapped.
+    """
+    cdef Work wk
+    cdef Hit best
+    best.edit = -1
+    n_runs[0] = 0
+    if L >= p.k + p.w - 1:
+        events[EV_SEEDED_READS] += 1
+        if _alloc_work(&wk, L, p):
+            _extend(p, &wk, read, seed, L, &best, mapq, run_op, run_len, n_runs, events)
+        _free_work(&wk)
+    edit[0] = best.edit
+    if best.edit >= 0:
+        ref_start[0] = best.ref_start
+        ref_end[0] = best.ref_end
+        strand[0] = best.strand_plus
+
+
+cdef void _extend(const Params* p, Work* wk, const uint8_t* read, const uint8_t* seed, int L,
+                  Hit* best_out, int32_t* mapq_out, uint8_t* run_op, int32_t* run_len,
+                  int32_t* n_runs, int32_t* events) noexcept nogil:
+    cdef int k = p.k, i, j, g, n_groups, n_kept = 0, n_visited = 0, n_hits = 0, best_i = -1
+    cdef int second, n_locus, covered
+    cdef int64_t lo_v
+    cdef uint8_t* swap
+    cdef Hit hit, best
+    cdef Anchor* chain
+    cdef const uint8_t* q_seq
+    cdef bint skip, done
+    cdef uint8_t op
+
+    n_groups = _chains(p, wk, seed, L, events)
+    if n_groups <= 0:
+        return
+    for i in range(L):
+        wk.read_rc[i] = read[L - 1 - i] if read[L - 1 - i] == AMBIGUOUS else read[L - 1 - i] ^ 1
+
+    for g in range(n_groups):
+        chain = wk.anchors + wk.groups[g].start
+        # filters on the anchors of the chain's locus, as Extender._reject_chain
+        if p.min_chain_anchors > 1 or p.min_chain_coverage > 0:
+            n_locus = _locus_anchors(p, wk, &wk.groups[g], L)
+            if n_locus < p.min_chain_anchors:
+                events[EV_FILTER_ANCHORS] += 1
+                continue
+            if p.min_chain_coverage > 0:
+                covered = 0
+                for i in range(L):
+                    covered += wk.covered[i]
+                if covered < p.min_chain_coverage * L:
+                    events[EV_FILTER_COVERAGE] += 1
+                    continue
+        n_kept += 1
+        # chains sharing the window of an earlier chain would only rediscover its hit
+        lo_v = chain[0].r - chain[0].q if chain[0].same else chain[0].r + chain[0].q + k - L
+        skip = False
+        for j in range(n_visited):
+            if wk.visited_strand[j] == chain[0].same and \
+                    (lo_v - wk.visited[j] if lo_v > wk.visited[j] else wk.visited[j] - lo_v) < max(1, L // 2):
+                skip = True
+                break
+        if skip:
+            continue
+        wk.visited[n_visited] = lo_v
+        wk.visited_strand[n_visited] = chain[0].same
+        n_visited += 1
+
+        q_seq = read if chain[0].same else wk.read_rc
+        if _align_chain(p, q_seq, L, chain, wk.groups[g].count, &wk.s, &hit, events):
+            wk.hit_edits[n_hits] = hit.edit
+            if best_i < 0 or hit.edit < best.edit:
+                best = hit
+                best_i = n_hits
+                swap = wk.s.best_ops
+                wk.s.best_ops = wk.s.ops
+                wk.s.ops = swap
+            n_hits += 1
+        # done once every remaining chain needs more edits than the best hit
+        if p.complete_seeds and best_i >= 0 and g + 1 < n_groups:
+            done = True
+            for j in range(g + 1, n_groups):
+                if _locus_edit_bound(p, wk, &wk.groups[j], L) <= best.edit:
+                    done = False
+                    break
+            if done:
+                break
+
+    if n_kept == 0:
+        events[EV_FILTER_REJECTED_READS] += 1
+    if best_i < 0:
+        return
+    second = INF
+    for i in range(n_hits):
+        if i != best_i and wk.hit_edits[i] < second:
+            second = wk.hit_edits[i]
+    mapq_out[0] = MAPQ_UNIQUE if second == INF else max(0, min(MAPQ_UNIQUE, MAPQ_PER_EDIT * (second - best.edit)))
+    best_out[0] = best
+
+    # CIGAR runs over the forward read
+    for i in range(best.n_ops):
+        op = wk.s.best_ops[i] if best.strand_plus else wk.s.best_ops[best.n_ops - 1 - i]
+        if n_runs[0] and run_op[n_runs[0] - 1] == op:
+            run_len[n_runs[0] - 1] += 1
+        else:
+            run_op[n_runs[0]] = op
+            run_len[n_runs[0]] = 1
+            n_runs[0] += 1
+
+
+def encode(seqs) -> tuple:
+    """
+    Concatenated hash codes of seqs (A0 T1 G2 C3, other 4) and their CSR offsets.
+    """
+    lengths = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    # one padding byte keeps &codes[offset] valid for an empty last read
+    raw = np.frombuffer(("".join(seqs) + "N").encode("ascii", "replace"), dtype=np.uint8)
+    return _CODE[raw], offsets
+
+
+cdef class NogilMapper:
+    """
+    Holds the index, the coded reference and the mapping parameters once per process;
+    map_reads maps a list of reads on n_threads OpenMP threads.
+    """
+    cdef object _keys, _offsets, _positions, _reverse, _reference
+    cdef Params params
+
+    def __init__(self, index, str reference, int k=KMERSIZE, int w=WINDOWSIZE,
+                 double max_edit_rate=0.40, int max_chains=5,
+                 double ungapped_max_rate=0.05, int min_band=8, double band_rate=0.05, int max_band=128,
+                 int min_chain_anchors=1, double min_chain_coverage=0.0, int max_occurrences=0):
+        cdef const uint64_t[::1] keys
+        cdef const int64_t[::1] offsets, positions
+        cdef const uint8_t[::1] reverse, ref
+        # one padding entry each keeps the pointers valid for an empty index
+        self._keys = np.ascontiguousarray(np.append(index.keys, 0), dtype=np.uint64)
+        self._offsets = np.ascontiguousarray(index.offsets, dtype=np.int64)
+        self._positions = np.ascontiguousarray(np.append(index.positions, 0), dtype=np.int64)
+        self._reverse = np.ascontiguousarray(np.append(index.reverse, False), dtype=np.uint8)
+        self._reference = encode([reference])[0]
+        keys, offsets, positions = self._keys, self._offsets, self._positions
+        reverse, ref = self._reverse, self._reference
+        self.params.keys = &keys[0]
+        self.params.offsets = &offsets[0]
+        self.params.positions = &positions[0]
+        self.params.reverse = &reverse[0]
+        self.params.n_keys = len(index.keys)
+        self.params.ref = &ref[0]
+        self.params.ref_len = len(reference)
+        self.params.k = k
+        self.params.w = w
+        self.params.max_chains = max_chains
+        self.params.max_edit_rate = max_edit_rate
+        self.params.ungapped_max_rate = ungapped_max_rate
+        self.params.min_band = min_band
+        self.params.band_rate = band_rate
+        self.params.max_band = max_band
+        self.params.min_chain_anchors = min_chain_anchors
+        self.params.min_chain_coverage = min_chain_coverage
+        self.params.max_occurrences = max_occurrences
+
+    def map_reads(self, list seqs, list quals=None, int min_quality=0, int n_threads=0):
+        """
+        Map seqs without the GIL on n_threads threads (0 = one per CPU).
+        With min_quality, bases of quals below it are not seeded (alignment still sees them).
+        Returns (templates, counts): one read_cache.AlignmentTemplate per read and the
+        summed event counters by MappingStats name.
+        """
+        cdef Py_ssize_t n = len(seqs), i
+        cdef int threads = n_threads if n_threads > 0 else (os.cpu_count() or 1)
+        codes_np, offsets_np = encode(seqs)
+        seed_np = codes_np
+        if min_quality > 0 and quals is not None:
+            phred = np.frombuffer(("".join(quals) + "~").encode("ascii", "replace"), dtype=np.uint8).astype(np.int16) - 33
+            if len(phred) == len(codes_np):
+                seed_np = np.where(phred < min_quality, AMBIGUOUS, codes_np).astype(np.uint8)
+        run_offsets_np = 2 * offsets_np + np.arange(n + 1, dtype=np.int64)  # <= 2L+1 runs per read
+        ref_start_np = np.zeros(n, dtype=np.int64)
+        ref_end_np = np.zeros(n, dtype=np.int64)
+        edit_np = np.zeros(n, dtype=np.int32)
+        strand_np = np.zeros(n, dtype=np.uint8)
+        mapq_np = np.zeros(n, dtype=np.int32)
+        n_runs_np = np.zeros(n, dtype=np.int32)
+        run_op_np = np.zeros(int(run_offsets_np[n]) + 1, dtype=np.uint8)
+        run_len_np = np.zeros(int(run_offsets_np[n]) + 1, dtype=np.int32)
+        events_np = np.zeros((max(n, 1), N_EVENTS), dtype=np.int32)
+
+        cdef const uint8_t[::1] codes = codes_np
+        cdef const uint8_t[::1] seed = seed_np
+        cdef const int64_t[::1] offsets = offsets_np
+        cdef const int64_t[::1] run_offsets = run_offsets_np
+        cdef int64_t[::1] ref_start = ref_start_np
+        cdef int64_t[::1] ref_end = ref_end_np
+        cdef int32_t[::1] edit = edit_np
+        cdef uint8_t[::1] strand = strand_np
+        cdef int32_t[::1] mapq = mapq_np
+        cdef int32_t[::1] n_runs = n_runs_np
+        cdef uint8_t[::1] run_op = run_op_np
+        cdef int32_t[::1] run_len = run_len_np
+        cdef int32_t[:, ::1] events = events_np
+        cdef Params params = self.params
+        cdef const Params* p = &params
+        # the early exit counts a missing anchor as edits: off when anchors are dropped
+        params.complete_seeds = self.params.max_occurrences == 0 and seed_np is codes_np
+
+        for i in prange(n, nogil=True, schedule="dynamic", chunksize=16, num_threads=threads):
+            _map_one(p, &codes[offsets[i]], &seed[offsets[i]], <int>(offsets[i + 1] - offsets[i]),
+                     &ref_start[i], &ref_end[i], &strand[i], &edit[i], &mapq[i],
+                     &run_op[run_offsets[i]], &run_len[run_offsets[i]], &n_runs[i], &events[i, 0])
+
+        templates = []
+        ops, lengths = run_op_np.tolist(), run_len_np.tolist()
+        for i, (lo, runs, e) in enumerate(zip(run_offsets_np.tolist(), n_runs_np.tolist(), edit_np.tolist())):
+            if e < 0:
+                templates.append((-1, -1, False, "", False, 60, -1))
+                continue
+            cigar = "".join(f"{lengths[j]}{'IDM'[ops[j]]}" for j in range(lo, lo + runs))
+            templates.append((int(ref_start_np[i]), int(ref_end_np[i]), bool(strand_np[i]), cigar, True,
+                              int(mapq_np[i]), e))
+        totals = events_np[:n].sum(axis=0)
+        counts = {name: int(totals[e]) for e, name in enumerate(_EVENT_NAMES)}
+        return templates, counts
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import hashlib
+import sys
+
+from ..extend.extender import Alignment
+
+# Read-independent part of an Alignment: (ref_start, ref_end, strand_plus, cigar, mapped, mapq, edit_distance)
+AlignmentTemplate = Tuple[int, int, bool, str, bool, int, int]
+
+_ENTRY_OVERHEAD = 100   # OrderedDict node and bookkeeping per entry, roughly
+
+
+def alignment_template(a: Alignment) -> AlignmentTemplate:
+    return (a.ref_start, a.ref_end, a.strand_plus, a.cigar, a.mapped, a.mapq, a.edit_distance)
+
+
+def alignment_from_template(readId: str, template: AlignmentTemplate) -> Alignment:
+    ref_start, ref_end, strand_plus, cigar, mapped, mapq, edit_distance = template
+    return Alignment(
+        readId=readId,
+        ref_start=ref_start,
+        ref_end=ref_end,
+        strand_plus=strand_plus,
+        cigar=cigar,
+        mapped=mapped,
+        mapq=mapq,
+        edit_distance=edit_distance
+    )
+
+
+class ReadCache:
+    """
+    Per-worker LRU cache of mapping results for duplicate reads (amplicon / PCR-heavy
+    libraries). Keys are 128-bit BLAKE2b digests of the read sequence(s), see reads_key,
+    values are tuples of AlignmentTemplates without the read name, qualities or flags.
+    Bounded by an estimate of its own memory use, least recently used entries go first.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[bytes, Tuple[Tuple[AlignmentTemplate, ...], int]]" = OrderedDict()
+
+    @staticmethod
+    def key(*seqs: str) -> bytes:
+        return hashlib.blake2b("\0".join(seqs).encode("ascii", "replace"), digest_size=16).digest()
+
+    @staticmethod
+    def reads_key(reads, qualities: bool) -> bytes:
+        """
+        Key of one read or a pair. With qualities, e.g. when low-quality bases are
+        masked out of the seeds, the result depends on them and they are part of the key.
+        """
+        if qualities:
+            return ReadCache.key(*(part for read in reads for part in (read.getSequence(), read.getQualityScore())))
+        return ReadCache.key(*(read.getSequence() for read in reads))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: bytes) -> bool:
+        # membership only, does not refresh the entry
+        return key in self._entries
+
+    def get(self, key: bytes) -> Optional[Tuple[AlignmentTemplate, ...]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: bytes, value: Tuple[AlignmentTemplate, ...]) -> int:
+        """
+        Store value under key. Returns the number of entries evicted to make room.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return 0
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return 0
+        self._entries[key] = (value, size)
+        self.bytes += size
+        evicted = 0
+        while self.bytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.bytes -= old_size
+            evicted += 1
+        return evicted
+
+
+def _entry_size(key: bytes, value: Tuple[AlignmentTemplate, ...]) -> int:
+    size = _ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+    for template in value:
+        size += sys.getsizeof(template) + sys.getsizeof(template[3])   # the CIGAR string
+    return size
@@ -0,0 +1,131 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from ..models.job import MappingJob
+from ..models.readMapper import ReadMapperInput
+from .readMapper import AReadMapper
+from .streaming import SAMStream, StreamCancelled
+
+UPLOADS = ("readsOne", "readsTwo", "referenceGenome")
+
+
+class QueueFull(Exception):
+    """
+    Raised by JobQueue.submit when every running and queued slot is taken.
+    """
+
+
+class JobQueue:
+    """
+    Mapping jobs run in the background: submit() copies the uploads into a directory of
+    the job and returns at once, `runners` threads take jobs in submission order and
+    drive readMapper (whose batches run on its worker processes). At most `maxQueued`
+    jobs wait behind the running ones; beyond that submit raises QueueFull, so a load
+    spike is turned away instead of overcommitting the machine. Finished jobs stay
+    queryable until `keepFinished` newer ones have finished, then their files are removed.
+    A job submitted with stream=True writes no output file: its SAM goes to job.stream.
+    Jobs against a stored reference pass referenceGenome=None and referenceId=... .
+    With copy=False the job reads the uploads in place, overlapping reading with mapping;
+    the caller keeps them open until job.future is done.
+    """
+    def __init__(self, readMapper: AReadMapper, workDir: str = None, runners: int = 1,
+                 maxQueued: int = 8, keepFinished: int = 64):
+        self.readMapper = readMapper
+        self.workDir = workDir or tempfile.mkdtemp(prefix="mapper-jobs-")
+        os.makedirs(self.workDir, exist_ok=True)
+        self.capacity = runners + maxQueued
+        self.keepFinished = keepFinished
+        self.jobs = OrderedDict()   # id -> MappingJob, in submission order
+        self._finished = deque()    # ids of finished jobs, oldest first
+        self._active = 0            # queued + running
+        self._lock = threading.Lock()
+        self._runners = ThreadPoolExecutor(max_workers=runners, thread_name_prefix="mapping-job")
+
+    def submit(self, readsOne: IO, readsTwo: IO, referenceGenome: IO, stream: bool = False, copy: bool = True,
+               **options) -> MappingJob:
+        with self._lock:
+            if self._active >= self.capacity:
+                raise QueueFull(f"{self._active} jobs queued or running, limit {self.capacity}")
+            self._active += 1
+            jobId = uuid.uuid4().hex
+            job = MappingJob(id=jobId, directory=os.path.join(self.workDir, jobId), options=options,
+                             stream=SAMStream() if stream else None)
+        try:
+            os.makedirs(job.directory)
+            uploads = dict(zip(UPLOADS, (readsOne, readsTwo, referenceGenome)))
+            if not copy:
+                job.inputs = uploads
+            for name, upload in uploads.items():
+                if upload is None or not copy:
+                    continue
+                with open(os.path.join(job.directory, name), "wb") as out:
+                    shutil.copyfileobj(upload, out)
+        except BaseException:
+            shutil.rmtree(job.directory, ignore_errors=True)
+            with self._lock:
+                self._active -= 1
+            raise
+        with self._lock:
+            self.jobs[job.id] = job
+            job.future = self._runners.submit(self._run, job)
+        return job
+
+    def get(self, jobId: str) -> MappingJob:
+        return self.jobs.get(jobId)
+
+    def position(self, job: MappingJob) -> int:
+        # jobs queued ahead of this one
+        with self._lock:
+            return sum(1 for other in self.jobs.values() if other.status == "queued" and other.submitted < job.submitted)
+
+    def _run(self, job: MappingJob):
+        job.status = "running"
+        job.started = time.time()
+        error = None
+        try:
+            inputs = job.inputs
+            if inputs is None:
+                paths = {name: os.path.join(job.directory, name) for name in UPLOADS}
+                inputs = {name: open(path, "rb") if os.path.exists(path) else None for name, path in paths.items()}
+            inputData = ReadMapperInput(
+                **inputs,
+                outputLocation=os.path.join(job.directory, "output.sam"),
+                outputStream=job.stream,
+                progress=job.progress,
+                **job.options,
+            )
+            job.output = self.readMapper.mapReads(inputData)
+            job.status = "done"
+        except Exception as e:
+            error = e
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            if job.stream is not None:
+                try:
+                    job.stream.close(error)
+                except StreamCancelled:
+                    pass
+            self._retire(job)
+        return job
+
+    def _retire(self, job: MappingJob):
+        with self._lock:
+            self._active -= 1
+            self._finished.append(job.id)
+            while len(self._finished) > self.keepFinished:
+                old = self.jobs.pop(self._finished.popleft(), None)
+                if old is not None:
+                    shutil.rmtree(old.directory, ignore_errors=True)
+
+    def close(self):
+        # queued jobs are dropped, running ones finish
+        self._runners.shutdown(wait=True, cancel_futures=True)
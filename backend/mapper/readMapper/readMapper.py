@@ -1,15 +1,21 @@
 from abc import ABC, abstractmethod
 from ..models.readMapper import ReadMapperInput, ReadMapperOutput
-from typing import IO, List
+from itertools import chain, islice
+from typing import IO, Iterator, List
 import io
+import tempfile
 from ..index.solutionIndex import SolutionIndexBuilder, MetricAccumulator, Metrics
-from ..mmm_parser.parser import Parser 
+from ..mmm_parser.chunkParser import ChunkParser
 from ..mmm_parser.readParser import ReadParser
 from ..models.read import Read
 from ..models.sam import SAM, SAMInput
+from ..models.options import MapperOptions
+from ..models.stats import MappingStats
 from ..index.build_index import ReferenceIndexBuilder
-from multiprocessing import Pool
-from ..parallelization.batch_reads import process_read_pair_batch, _init_worker
+from ..index.sorted_index import SortedMinimizerIndex
+from ..index.reference_store import ReferenceStore
+from ..parallelization.executor import (MAX_TASKS_PER_CHILD, BatchSizer, ResidentPool, available_cpus,
+                                        make_executor, worker_count)
 
 
 class AReadMapper(ABC):
@@ -19,34 +25,91 @@ class AReadMapper(ABC):
 
 class ReadMapper(AReadMapper):
     def __init__(self):
-        pass
+        self.pool : ResidentPool = None
+
+    def start(self, workers: int = 0, storeDir: str = None, maxTasksPerChild: int = MAX_TASKS_PER_CHILD,
+              storeMaxMB: float = 0):
+        """
+        Start the long-lived worker pool (workers 0 = available CPUs) and the reference
+        store it loads from (a temporary directory unless storeDir is given, least
+        recently used references evicted beyond storeMaxMB, 0 = no limit). Until close(),
+        process-backend requests run on this pool instead of a pool of their own, each
+        reference is indexed once rather than once per request, and stored references can
+        be mapped against by id.
+        """
+        if self.pool is None:
+            store = ReferenceStore(storeDir or tempfile.mkdtemp(prefix="mapper-references-"), int(storeMaxMB * 2**20))
+            self.pool = ResidentPool(workers if workers > 0 else available_cpus(), store, maxTasksPerChild)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    @property
+    def references(self) -> ReferenceStore:
+        if self.pool is None:
+            raise RuntimeError("stored references need the worker pool, call start() first")
+        return self.pool.store
+
+    def addReference(self, referenceGenome: IO, k: int = 15, w: int = 30) -> dict:
+        """
+        Index a FASTA reference into the store, unless it is already there; returns its
+        entry (id, name, length, k, w). Mapping requests can then name it by id.
+        """
+        name, referenceString = self._readReference(referenceGenome)
+        return self.references.meta(self._stored_reference(name, referenceString, k, w))
+
+    @staticmethod
+    def _readReference(referenceGenome: IO):
+        # reference file handling
+        referenceFile : IO = io.TextIOWrapper(referenceGenome, encoding='utf-8')
+
+        referenceStringHeaderLine = referenceFile.readline().strip('\n') # Skip header
+        referenceStringHeader = referenceStringHeaderLine.split()[0][1:]
+        referenceString = "".join(line.strip() for line in referenceFile)
+        referenceFile.close()
+        referenceGenome.close()
+        return referenceStringHeader, referenceString
+
+    def _stored_reference(self, name: str, referenceString: str, k: int, w: int) -> str:
+        # id of the reference in the pool's store, indexing it only if it is not there yet
+        store : ReferenceStore = self.references
+        refId = ReferenceStore.reference_id(referenceString, k, w)
+        if refId not in store:
+            referenceIndex = ReferenceIndexBuilder(referenceString, k=k, w=w).build_sorted_index()
+            store.put(refId, name, referenceString, referenceIndex, k, w)
+        store.touch(refId)
+        return refId
 
     def mapReads(self, inputData: ReadMapperInput) -> ReadMapperOutput:
         # constants
         k = inputData.kmerSize  # k-mer size
         w = inputData.windowSize  # window size
 
-        # Assume the files need to be opened here 
-        outputFile: IO = open(inputData.outputLocation, "w")
-
-        # reference file handling
-        referenceFile : IO = io.TextIOWrapper(inputData.referenceGenome, encoding='utf-8')
+        refId : str = inputData.referenceId
+        if refId:
+            # a stored reference: no upload to read and nothing to index
+            if refId not in self.references:
+                raise KeyError(f"unknown reference {refId}")
+            self.references.touch(refId)
+            referenceMeta : dict = self.references.meta(refId)
+            referenceStringHeader, referenceSize = referenceMeta["name"], referenceMeta["length"]
+            k, w = referenceMeta["k"], referenceMeta["w"]
+            referenceString = None
+        else:
+            referenceStringHeader, referenceString = self._readReference(inputData.referenceGenome)
+            referenceSize = len(referenceString)
 
-        referenceStringHeaderLine = referenceFile.readline().strip('\n') # Skip header
-        referenceStringHeader = referenceStringHeaderLine.split()[0][1:]
-        referenceString = "".join(line.strip() for line in referenceFile)
-        referenceFile.close()
-        inputData.referenceGenome.close()
+        # Assume the files need to be opened here 
+        outputFile: IO = inputData.outputStream if inputData.outputStream else open(inputData.outputLocation, "w")
 
         samWriter : SAM = SAM(  # create samOutput
             referenceName=referenceStringHeader, 
-            referenceSize = len(referenceString), 
+            referenceSize = referenceSize, 
             outputFile=outputFile)
 
 
-        readFrontFile : IO = io.TextIOWrapper(inputData.readsOne, encoding='utf-8')
-        readBackFile : IO = io.TextIOWrapper(inputData.readsTwo, encoding='utf-8')
-
         # create reference solution map and accumulator for metrics if ground truth is provided
         solutionIndexBuilder : SolutionIndexBuilder = SolutionIndexBuilder()
         if inputData.groundTruth:
@@ -58,38 +121,45 @@ class ReadMapper(AReadMapper):
             accumulator = None
 
        
-        # create parser
-        parserFront : Parser = Parser(readFile=readFrontFile, referenceFile=None)
-        parserBack : Parser = Parser(readFile=readBackFile, referenceFile=None)
+        # create parser: reads come from the binary (or gzipped) uploads in chunks and are
+        # parsed only as far as the batches in flight need, while earlier batches map
+        parserFront : ChunkParser = ChunkParser(inputData.readsOne)
+        parserBack : ChunkParser = ChunkParser(inputData.readsTwo)
 
         readParser : ReadParser = ReadParser(parserFront, parserBack)
-        readPairs : List[List[Read]] = readParser.parseAllReadPairs()
-
-        # Build minimizer index from reference
-        builder : ReferenceIndexBuilder = ReferenceIndexBuilder(referenceString, k=k, w=w)
-        referenceIndex : dict = builder.build_index()
 
         # Prepare read pairs with their indices for batch processing
-        indexed_read_pairs = list(enumerate(readPairs))
-        num_processes = 8 
-        batch_size = max(1, len(indexed_read_pairs) // (num_processes * 3))
-        
-        # Split into batches
-        batches = []
-        for i in range(0, len(indexed_read_pairs), batch_size):
-            batch = indexed_read_pairs[i:i + batch_size]
-            batches.append((batch))
-        
+        indexed_read_pairs : Iterator = enumerate(readParser.iterReadPairs())
+        # the workers seed with the k and w the index was built with
+        options : MapperOptions = MapperOptions(k=k, w=w, pairAware=inputData.pairAware, longReads=inputData.longReads)
+
+        if self.pool is not None and not refId:
+            refId = self._stored_reference(referenceStringHeader, referenceString, k, w)
+
+        if self.pool is not None and inputData.backend == "process":
+            # the resident workers load the stored reference themselves
+            executor = self.pool.executor(refId, options)
+        else:
+            if self.pool is None:
+                # Build minimizer index from reference
+                builder : ReferenceIndexBuilder = ReferenceIndexBuilder(referenceString, k=k, w=w)
+                referenceIndex : SortedMinimizerIndex = builder.build_sorted_index()
+            else:
+                referenceIndex, referenceString = self.references.load(refId)
+            # no more workers than the first pairs can keep busy
+            lookahead = list(islice(indexed_read_pairs, BatchSizer.MIN_PAIRS * max(inputData.threads, available_cpus())))
+            num_processes = worker_count(inputData.threads, len(lookahead))
+            indexed_read_pairs = chain(lookahead, indexed_read_pairs)
+            executor = make_executor(inputData.backend, num_processes, referenceIndex, referenceString, options)
+
         totalReads = 0
         mappedReads = 0
-        with Pool(
-            processes=num_processes,
-            initializer=_init_worker,
-            initargs=(referenceIndex, referenceString),
-            ) as pool:
-            batch_results = pool.map(process_read_pair_batch, batches)
+        stats : MappingStats = MappingStats()
+        with executor:
+            batch_results = executor.imap(indexed_read_pairs)
             # Flatten the results
-            for batch_alignments in batch_results:
+            for batch_alignments, batch_stats in batch_results:
+                stats.merge(batch_stats)
                 if accumulator:
                     accumulator.update(batch_alignments=batch_alignments)
                 totalReads += len(batch_alignments)
@@ -123,14 +193,22 @@ class ReadMapper(AReadMapper):
                                     QUAL= a.qual,
                                 )
                         samWriter.WriteReadToSam(input)
+                # streamed output goes out batch by batch
+                outputFile.flush()
+                if inputData.progress:
+                    inputData.progress(totalReads, None, mappedReads)
+        if inputData.progress:
+            inputData.progress(totalReads, totalReads, mappedReads)
         
         output : ReadMapperOutput = ReadMapperOutput(
             samOutput=outputFile,
-            numberOfMappedReads= mappedReads
+            numberOfMappedReads= mappedReads,
+            stats=stats
         )
 
-        outputFile.close()
-        readFrontFile.close()
-        readBackFile.close()
+        if not inputData.outputStream:
+            outputFile.close()
+        inputData.readsOne.close()
+        inputData.readsTwo.close()
 
         return output
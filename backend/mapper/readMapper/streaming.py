@@ -0,0 +1,79 @@
+from typing import Iterator
+import queue
+import threading
+
+_END = object()
+
+
+class StreamCancelled(Exception):
+    """
+    Raised in the writer of a SAMStream whose reader has gone away.
+    """
+
+
+class SAMStream:
+    """
+    Writable text stream that hands SAM output to a reader thread in chunks, entirely in
+    memory: writes are buffered into chunks of about CHUNK_BYTES, flush() (called by
+    mapReads after every batch) passes on whatever is buffered. At most maxChunks chunks
+    wait for the reader, so a slow client slows the writer down instead of growing
+    memory, and nothing touches the disk whatever the size of the input.
+    """
+    CHUNK_BYTES = 1 << 16
+
+    def __init__(self, maxChunks: int = 16):
+        self._queue = queue.Queue(maxsize=maxChunks)
+        self._buffer = []
+        self._size = 0
+        self._cancelled = threading.Event()
+
+    def write(self, text: str) -> int:
+        if self._cancelled.is_set():
+            raise StreamCancelled("the reader of the SAM stream went away")
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.CHUNK_BYTES:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            chunk = "".join(self._buffer).encode()
+            self._buffer = []
+            self._size = 0
+            self._put(chunk)
+
+    def close(self, error: BaseException = None):
+        # end of the stream; an error is raised in the reader after the chunks before it
+        if self._cancelled.is_set():
+            return
+        if error is None:
+            self.flush()
+        self._put(error if error is not None else _END)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _put(self, item):
+        # blocks while the reader is behind, gives up once it is gone
+        while True:
+            if self._cancelled.is_set():
+                raise StreamCancelled("the reader of the SAM stream went away")
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def chunks(self) -> Iterator[bytes]:
+        # reader side; closing the generator early cancels the writer
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
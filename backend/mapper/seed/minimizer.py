@@ -1,24 +1,51 @@
 from collections import deque
-from typing import Dict, List, Tuple
+import itertools
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
 from ..hashing.hash import Hash
+from ..index.sorted_index import SortedMinimizerIndex
+
+# Flat anchors of a batch of reads: (ref_pos, read_pos, same_strand, read_offsets),
+# anchors of read j are the slice [read_offsets[j], read_offsets[j+1])
+AnchorBatch = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+# Minimizers of one read as arrays: (hash, position, is_reverse), see Minimizer.extract_arrays
+MinimizerArrays = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Minimizer.extract tuples as one NumPy record, so a batch is flattened in a single pass
+_MINIMIZER_RECORD = np.dtype([("hash", np.uint64), ("pos", np.int64), ("seq_id", np.int64), ("rev", np.bool_)])
+# 2-bit codes of Hash (base 4), used by the vectorized extract_arrays
+_NT_CODE = {'A': 0, 'T': 1, 'G': 2, 'C': 3}
+_NT_COMP = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G'}
+# True for the bases a k-mer may contain, anything else (N, IUPAC codes, '.') is ambiguous
+_UNAMBIGUOUS = np.zeros(256, dtype=bool)
+_UNAMBIGUOUS[[ord(base) for base in "ACGT"]] = True
+# hash given to masked k-mers: above any real hash (k <= 31), so it only wins a window
+# whose k-mers are all masked, and such windows yield no minimizer
+_MASKED = 2**64 - 1
 
 
 class Minimizer:
-    def __init__(self, k: int, w: int, reference_index: Dict[int, List[Tuple[int, bool]]] = None):
+    def __init__(self, k: int, w: int, reference_index: Dict[int, List[Tuple[int, bool]]] = None, min_quality: int = 0,
+                 max_occurrences: int = 0):
         self.k = k
         self.w = w
         self.hash = Hash(k)       
         self.reference_index = reference_index if reference_index else {}
+        self.min_quality = min_quality  # Phred score below which a base masks its k-mers, 0 = off
+        self.max_occurrences = max_occurrences  # minimizers with more reference hits give no anchors, 0 = off
+        self.masked_kmers = 0           # k-mers skipped so far for ambiguous / low-quality bases
+        self.lookups = 0                # minimizer hashes resolved by lookup_batch so far
+        self.unique_lookups = 0         # ... of which distinct within their batch
 
 
     def extract(
             self, 
             seq: str, 
             # seq_id: str = "temp",
-            seq_id: int = 0
+            seq_id: int = 0,
+            qual: str = None
             ) -> List[Tuple[int, int, int, bool]]:
         """
         Extract minimizers from sequence
@@ -27,13 +54,17 @@ class Minimizer:
         Args:
         seq: DNA sequence (handles both uppercase and lowercase)
         seq_id: ID to track which read this is from 
+        qual: Phred+33 qualities of seq, only used when min_quality is set
         """
         # Convert to uppercase to handle mixed case input
         seq = seq.upper()
         
         if len(seq) < self.k + self.w - 1:
             return []
-    
+
+        # k-mers over ambiguous or low-quality bases never become minimizers
+        masked = self._kmer_mask(seq, qual)
+        masked = masked.tolist() if masked is not None else None
 
         minimizers = []
         window = deque()
@@ -53,19 +84,23 @@ class Minimizer:
             rev_comp = self._reverse_complement(kmer)
             rev_hash = self.hash.hash_sequence(rev_comp)
             
-            if rev_hash < current_hash:
+            if masked and masked[i]:
+                window.append((_MASKED, i, False))
+            elif rev_hash < current_hash:
                 window.append((rev_hash, i, True))  # True = reverse strand
             else:
                 window.append((current_hash, i, False))  # False = forward strand
         
         # Get first minimizer
         # Window contains exactly w k-mers from positions 0 to w-1
+        last_min_pos = -1
         if window:
             min_hash, min_pos, is_rev = min(window) # Find the k-mer with the min hash value in this first window
-            minimizers.append((min_hash, min_pos, seq_id, is_rev)) # Add this as our first minimizer to the results
-            # Remember this position to avoid duplicates later
-            # since same k-mer might be minimum in multiple consecutive windows
-            last_min_pos = min_pos
+            if min_hash != _MASKED:
+                minimizers.append((min_hash, min_pos, seq_id, is_rev)) # Add this as our first minimizer to the results
+                # Remember this position to avoid duplicates later
+                # since same k-mer might be minimum in multiple consecutive windows
+                last_min_pos = min_pos
         
         # Reset current has to window slide postion
         current_hash = self.hash.hash_sequence(seq[self.w-1:self.w-1+self.k])
@@ -84,6 +119,8 @@ class Minimizer:
             # This ensures we match k-mers regardless of strand
             canonical_hash = min(current_hash, rev_hash)
             is_reverse = (rev_hash < current_hash)
+            if masked and masked[i]:
+                canonical_hash, is_reverse = _MASKED, False
             
             # Update slifeing window
             window.popleft()
@@ -93,12 +130,69 @@ class Minimizer:
             min_hash, min_pos, is_rev = min(window)
             
             # Check if new postion
-            if min_pos != last_min_pos:
+            if min_pos != last_min_pos and min_hash != _MASKED:
                 minimizers.append((min_hash, min_pos, seq_id, is_rev))
                 last_min_pos = min_pos
         
         return minimizers
     
+    def extract_arrays(self, seq: str, qual: str = None) -> MinimizerArrays:
+        """
+        Vectorized extract() for long reads: the same minimizers, returned as
+        (hash uint64, position int64, is_reverse bool) arrays instead of one Python
+        tuple per minimizer, so memory stays a few bytes per read base.
+        """
+        seq = seq.upper()
+        k, w = self.k, self.w
+        if len(seq) < k + w - 1:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+
+        # 2-bit codes as in Hash.encode (unknown bases hash like 'A'), and the codes of the
+        # complement as in _reverse_complement (N complements to 'A')
+        raw = np.frombuffer(seq.encode("ascii", "replace"), dtype=np.uint8)
+        fwd_code = np.zeros(256, dtype=np.uint64)
+        rev_code = np.zeros(256, dtype=np.uint64)
+        for base, code in _NT_CODE.items():
+            fwd_code[ord(base)] = code
+            rev_code[ord(base)] = _NT_CODE[_NT_COMP[base]]
+
+        # forward k-mers read left to right, their reverse complements right to left
+        windows = np.lib.stride_tricks.sliding_window_view
+        weights = np.uint64(4) ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+        fwd = windows(fwd_code[raw], k) @ weights
+        rev = windows(rev_code[raw], k) @ weights[::-1]
+        is_rev = rev < fwd
+        canonical = np.where(is_rev, rev, fwd)
+        masked = self._kmer_mask(seq, qual)
+        if masked is not None:
+            canonical[masked] = np.uint64(_MASKED)
+
+        # leftmost minimum of every window of w k-mers, reported once per position
+        pos = np.arange(len(canonical) - w + 1) + windows(canonical, w).argmin(axis=1)
+        keep = np.ones(len(pos), dtype=bool)
+        keep[1:] = pos[1:] != pos[:-1]
+        pos = pos[keep]
+        if masked is not None:
+            pos = pos[~masked[pos]]
+        return canonical[pos], pos, is_rev[pos]
+
+    def _kmer_mask(self, seq: str, qual: Optional[str]) -> Optional[np.ndarray]:
+        """
+        One flag per k-mer start of the uppercase seq: True where the k-mer covers an
+        ambiguous base or, with min_quality set, a base below it. None when nothing is masked.
+        """
+        bad = ~_UNAMBIGUOUS[np.frombuffer(seq.encode("ascii", "replace"), dtype=np.uint8)]
+        if self.min_quality > 0 and qual is not None and len(qual) == len(seq):
+            phred = np.frombuffer(qual.encode("ascii", "replace"), dtype=np.uint8).astype(np.int16) - 33
+            bad |= phred < self.min_quality
+        if not bad.any():
+            return None
+        bad_before = np.zeros(len(seq) + 1, dtype=np.int64)
+        np.cumsum(bad, out=bad_before[1:])
+        masked = bad_before[self.k:] > bad_before[:-self.k]
+        self.masked_kmers += int(masked.sum())
+        return masked
+
     def filter_and_lookup(self, kmers: List[Tuple[int, int, int, bool]],
                          reference_index: Dict[int, List[Tuple[int, bool]]] = None) -> List[Tuple[int, int, bool]]:
         """
@@ -121,8 +215,11 @@ class Minimizer:
         for hash_val, read_pos, _, read_is_rev in kmers:
             # Filter: only process if hash exists in reference
             if hash_val in index:
+                hits = index[hash_val]
+                if self.max_occurrences and len(hits) > self.max_occurrences:
+                    continue
                 # Lookup get all reference positions for this hash
-                for ref_pos, ref_is_rev in index[hash_val]:
+                for ref_pos, ref_is_rev in hits:
                     # CHekc strand consistency
                     same_strand = (read_is_rev == ref_is_rev)
                     candidates.append((
@@ -133,6 +230,67 @@ class Minimizer:
         
         return candidates
     
+    def lookup_batch(self,
+                     kmers_per_read: Sequence[Union[List[Tuple[int, int, int, bool]], MinimizerArrays]],
+                     sorted_index: SortedMinimizerIndex) -> AnchorBatch:
+        """
+        Vectorized filter_and_lookup over a whole batch of reads: the distinct minimizer
+        hashes of the batch are resolved with a single np.searchsorted against the sorted
+        index, reads sharing a hash share its result.
+
+        Args:
+        kmers_per_read: one Minimizer.extract (or extract_arrays) result per read
+        sorted_index: SortedMinimizerIndex of the reference
+        Returns:
+        (ref_pos, read_pos, same_strand, read_offsets) flat arrays; anchors of read j
+        are [read_offsets[j], read_offsets[j+1]) in the same order filter_and_lookup yields
+        """
+        n_reads = len(kmers_per_read)
+        if n_reads and isinstance(kmers_per_read[0], tuple):
+            counts = np.fromiter((len(k[0]) for k in kmers_per_read), dtype=np.int64, count=n_reads)
+            total = int(counts.sum())
+            hashes = np.concatenate([k[0] for k in kmers_per_read]).astype(np.uint64, copy=False)
+            read_pos = np.concatenate([k[1] for k in kmers_per_read]).astype(np.int64, copy=False)
+            read_rev = np.concatenate([k[2] for k in kmers_per_read]).astype(bool, copy=False)
+        else:
+            counts = np.fromiter((len(k) for k in kmers_per_read), dtype=np.int64, count=n_reads)
+            total = int(counts.sum())
+            records = np.fromiter(itertools.chain.from_iterable(kmers_per_read), dtype=_MINIMIZER_RECORD, count=total)
+            hashes, read_pos, read_rev = records["hash"], records["pos"], records["rev"]
+        read_of = np.repeat(np.arange(n_reads, dtype=np.int64), counts)
+
+        # CSR bounds of every distinct hash (sorted queries also walk the index in order),
+        # then expand each minimizer into its reference hits
+        unique_hashes, inverse = np.unique(hashes, return_inverse=True)
+        start, end = sorted_index.lookup(unique_hashes)
+        if self.max_occurrences:
+            # repetitive minimizers resolve to nothing, as if absent from the reference
+            end = np.where(end - start > self.max_occurrences, start, end)
+        start, end = start[inverse], end[inverse]
+        self.lookups += total
+        self.unique_lookups += len(unique_hashes)
+        n_hits = end - start
+        src = np.repeat(np.arange(total, dtype=np.int64), n_hits)
+        first = np.repeat(np.cumsum(n_hits) - n_hits, n_hits)
+        hit = np.repeat(start, n_hits) + (np.arange(len(src), dtype=np.int64) - first)
+
+        anchor_ref = sorted_index.positions[hit]
+        anchor_read = read_pos[src]
+        anchor_same = sorted_index.reverse[hit] == read_rev[src]
+
+        read_offsets = np.zeros(n_reads + 1, dtype=np.int64)
+        np.cumsum(np.bincount(read_of[src], minlength=n_reads), out=read_offsets[1:])
+        return anchor_ref, anchor_read, anchor_same, read_offsets
+
+    @staticmethod
+    def anchors_of(batch: AnchorBatch, j: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (ref_pos, read_pos, same_strand) array views of read j of a lookup_batch result.
+        """
+        ref_pos, read_pos, same, offsets = batch
+        lo, hi = offsets[j], offsets[j + 1]
+        return ref_pos[lo:hi], read_pos[lo:hi], same[lo:hi]
+
     def _reverse_complement(self, seq: str) -> str:
         """
         Get reverse complement of DNA sequence
@@ -145,7 +303,8 @@ class Minimizer:
         Reverse complement string
         """
         complement = {
-            'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G', 'N': 'A',
-            'a': 'T', 't': 'A', 'g': 'C', 'c': 'G', 'n': 'A'
+            'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G', 'N': 'N',
+            'a': 'T', 't': 'A', 'g': 'C', 'c': 'G', 'n': 'N'
         }
-        return ''.join(complement[c] for c in seq[::-1])
\ No newline at end of file
+        # ambiguous bases stay ambiguous, their k-mers are masked anyway
+        return ''.join(complement.get(c, 'N') for c in seq[::-1])
\ No newline at end of file
@@ -2,36 +2,47 @@
 from Cython.Build import cythonize
 from setuptools import setup, Extension
 import numpy as np
+import sys
+
+# Apple clang ships without OpenMP: there the nogil core builds and runs single-threaded
+openmp = [] if sys.platform == "darwin" else ["-fopenmp"]
 
 
 extensions = [
     Extension(
-        name="extend.extender",         # full dotted module path
+        name="mapper.extend.extender",         # full dotted module path
         sources=["extend/extender.pyx"],# where the .pyx lives
         include_dirs=[np.get_include()],                # add numpy.get_include() later if you cimport numpy
     ),
     Extension(
-        name="extend.chainer",         # full dotted module path
+        name="mapper.extend.chainer",         # full dotted module path
         sources=["extend/chainer.pyx"],# where the .pyx lives
         include_dirs=[np.get_include()],                # add numpy.get_include() later if you cimport numpy
     ),
     Extension(
-        name="hashing.hash",         # full dotted module path
+        name="mapper.hashing.hash",         # full dotted module path
         sources=["hashing/hash.pyx"],# where the .pyx lives
         include_dirs=[np.get_include()],                # add numpy.get_include() later if you cimport numpy
     ),
     Extension(
-        name ="parallelization.batch_reads",
+        name="mapper.parallelization.batch_reads",
         sources=["parallelization/batch_reads.pyx"],
         include_dirs=[np.get_include()], 
     ),
     Extension(
-        name ="mmm_parser.parser",
+        name="mapper.parallelization.nogil_core",
+        sources=["parallelization/nogil_core.pyx"],
+        include_dirs=[np.get_include()],
+        extra_compile_args=openmp,
+        extra_link_args=openmp,
+    ),
+    Extension(
+        name="mapper.mmm_parser.parser",
         sources=["mmm_parser/parser.pyx"],
         include_dirs=[np.get_include()], 
     ),
     Extension(
-        name ="mmm_parser.readParser",
+        name="mapper.mmm_parser.readParser",
         sources=["mmm_parser/readParser.pyx"],
         include_dirs=[np.get_include()], 
     )
@@ -39,6 +50,8 @@ extensions = [
 
 setup(
     name="mmm",
+    # the mapper is a package of backend/: modules are named mapper.*, built next to their sources
+    package_dir={"mapper": "."},
     ext_modules=cythonize(
         extensions,
         compiler_directives={"language_level": "3"},
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# the mapper is a package of backend/, imported as mapper.* (as the API does)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def run_module():
+    """
+    Run `python -m <module> <args>` from backend/, as the Makefile does; fails the test
+    with the module's output if it exits non-zero.
+    """
+    def run(module: str, *args: str) -> subprocess.CompletedProcess:
+        completed = subprocess.run([sys.executable, "-m", module, *args], cwd=BACKEND_DIR,
+                                   capture_output=True, text=True, timeout=600)
+        assert completed.returncode == 0, f"{module} exited with {completed.returncode}:\n{completed.stderr}"
+        return completed
+    return run
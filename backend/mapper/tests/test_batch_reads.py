@@ -0,0 +1,125 @@
+"""
+The pure-Python worker, parallelization/batch_reads.py.
+"""
+
+import io
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from mapper.parallelization import batch_reads
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    from mapper.benchmark.simulate import ReadProfile, simulate_pairs, simulate_reference
+    from mapper.index.build_index import ReferenceIndexBuilder
+    from mapper.models.read import Read
+
+    rng = np.random.default_rng(5)
+    reference = simulate_reference(20000, rng)
+    readsOne, readsTwo, truth = io.StringIO(), io.StringIO(), io.StringIO()
+    # indels, so that the reads go through the DP rather than the ungapped fast path
+    simulate_pairs(reference, 40, ReadProfile(substitution=0.01, insertion=0.005, deletion=0.005), rng,
+                   readsOne, readsTwo, truth)
+
+    def reads(fastq: io.StringIO, isFront: bool):
+        lines = fastq.getvalue().split("\n")
+        return [Read(lines[i][1:], lines[i + 1], lines[i + 3], isFront) for i in range(0, len(lines) - 1, 4)]
+    batch = list(enumerate(zip(reads(readsOne, True), reads(readsTwo, False))))
+    # the reference span each read was simulated from
+    spans = {name: (int(start), int(end)) for name, start, end in
+             (line.split("\t") for line in truth.getvalue().splitlines())}
+    return ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index(), reference, batch, spans
+
+
+@pytest.fixture
+def pure():
+    if batch_reads.__file__.endswith((".so", ".pyd")):
+        pytest.skip("the compiled worker is built, batch_reads.py is not the one imported")
+
+
+def test_warm_extender_does_not_allocate_dp_buffers(dataset, pure):
+    from mapper.extend.extender import Extender
+
+    _, reference, batch, spans = dataset
+    # every read on both strands, in a window around its true span
+    windows = [(read.sequence, spans[read.identifier][0] - 20, spans[read.identifier][1] + 20, strand)
+               for _, pair in batch for read in pair for strand in (True, False)]
+
+    def align(extender: Extender, window) -> None:
+        sequence, lo, hi, strand = window
+        extender.align_window("r", sequence, reference, lo, hi, strand)
+
+    def peak(extender: Extender, window) -> int:
+        # bytes allocated at the peak of one alignment on top of what was live before it
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        align(extender, window)
+        return tracemalloc.get_traced_memory()[1] - before
+
+    warm, counter = Extender(), Extender(profile=True)
+    for window in windows:
+        align(warm, window)
+    tracemalloc.start()
+    try:
+        for window in windows:
+            cells = counter.stats.counts["dp_cells"]
+            align(counter, window)
+            cells = counter.stats.counts["dp_cells"] - cells
+            if cells:
+                # a fresh extender allocates a traceback byte per cell, the warm one reuses its buffers
+                assert peak(Extender(), window) - peak(warm, window) >= cells
+    finally:
+        tracemalloc.stop()
+    assert counter.stats.counts["dp_cells"] > 0
+
+
+def test_worker_keeps_its_extender_across_batches(dataset, pure):
+    from mapper.models.options import MapperOptions
+
+    index, reference, batch, _ = dataset
+    # no read cache: every batch maps every read again
+    batch_reads._init_worker(index, reference, MapperOptions(k=15, w=10, readCacheMB=0))
+    extender = batch_reads._WORKER.extender
+    _, first = batch_reads.process_read_pair_batch(batch)
+    trace = extender._dp_trace
+    _, second = batch_reads.process_read_pair_batch(batch)
+    assert batch_reads._WORKER.extender is extender
+    # the second batch fits in the buffers the first one grew
+    assert extender._dp_trace is trace and len(trace) > 0
+    # the statistics are still those of each batch alone
+    assert second.counts["dp_windows"] == first.counts["dp_windows"] > 0
+
+
+@pytest.mark.parametrize("pairAware", [False, True])
+@pytest.mark.parametrize("readCacheMB", [0, 1])
+def test_duplicates_with_other_qualities(dataset, pairAware, readCacheMB):
+    from mapper.models.options import MapperOptions
+    from mapper.models.read import Read
+
+    index, reference, batch, _ = dataset
+    # every pair again, with all of its bases below the seeding threshold
+    masked = [(len(batch) + i, tuple(Read(read.identifier, read.sequence, "#" * len(read.sequence), read.isFront)
+                                     for read in readPair)) for i, readPair in batch]
+    batch_reads._init_worker(index, reference, MapperOptions(k=15, w=10, seedMinQuality=20, pairAware=pairAware,
+                                                             readCacheMB=readCacheMB))
+    batches = [batch_reads.process_read_pair_batch]
+    if hasattr(batch_reads, "process_read_pair_batch_nogil"):
+        batches.append(batch_reads.process_read_pair_batch_nogil)
+    for process in batches:
+        alignments, _ = process(batch + masked)
+        assert any(a.mapped for a in alignments[:2 * len(batch)])
+        # nothing to seed the copies with: their duplicates' seeds or cached results must not leak
+        assert not any(a.mapped for a in alignments[2 * len(batch):])
+
+
+@pytest.mark.parametrize("options, complete", [({}, True), ({"maxOccurrences": 64}, False),
+                                               ({"seedMinQuality": 20}, False)])
+def test_early_exit_needs_complete_seeds(dataset, pure, options, complete):
+    from mapper.models.options import MapperOptions
+
+    index, reference, _, _ = dataset
+    batch_reads._init_worker(index, reference, MapperOptions(k=15, w=10, **options))
+    assert batch_reads._WORKER.extender.complete_seeds is complete
@@ -0,0 +1,71 @@
+"""
+Smoke tests of the benchmark entry points: each runs as documented, on a tiny dataset.
+"""
+
+import json
+import os
+
+import pytest
+
+GENOME_SIZE = 20000
+PAIRS = 200
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    from mapper.benchmark.simulate import ReadProfile, simulate
+    return simulate(str(tmp_path_factory.mktemp("data")), GENOME_SIZE, PAIRS, ReadProfile(substitution=0.01))
+
+
+def test_simulate(run_module, tmp_path):
+    run_module("mapper.benchmark.simulate", "-o", str(tmp_path), "--genome-size", str(GENOME_SIZE),
+               "--pairs", str(PAIRS), "--repeats", "2")
+    with open(tmp_path / "truth.txt") as truth:
+        assert len(truth.readlines()) == 2 * PAIRS
+    with open(tmp_path / "r1.fq") as reads:
+        assert len(reads.readlines()) == 4 * PAIRS
+
+
+def test_grid(run_module, tmp_path):
+    results = tmp_path / "grid.json"
+    run_module("mapper.benchmark.grid", "--genome-sizes", str(GENOME_SIZE), "--pairs", str(PAIRS),
+               "--workers", "1", "--data-dir", str(tmp_path / "data"), "--json", str(results))
+    with open(results) as resultsFile:
+        grid = json.load(resultsFile)["results"]
+    assert len(grid) == 1
+    assert grid[0]["reads"] == 2 * PAIRS
+    assert grid[0]["recall"] > 0.9
+
+
+def test_backends(run_module, dataset, tmp_path):
+    results = tmp_path / "backends.json"
+    run_module("mapper.benchmark.backends", "-r", dataset["ref.fa"], "-1", dataset["r1.fq"], "-2", dataset["r2.fq"],
+               "--workers", "1", "--json", str(results))
+    with open(results) as resultsFile:
+        runs = json.load(resultsFile)
+    assert [run["backend"] for run in runs] == ["process", "thread"]
+    assert all(run["reads"] == 2 * PAIRS for run in runs)
+
+
+def test_tune(run_module, dataset, tmp_path):
+    results = tmp_path / "tune.json"
+    run_module("mapper.benchmark.tune", "-r", dataset["ref.fa"], "-1", dataset["r1.fq"], "-2", dataset["r2.fq"],
+               "--truth", dataset["truth.txt"], "--sample", "100", "--k", "13", "15", "--w", "10",
+               "--json", str(results))
+    with open(results) as resultsFile:
+        tune = json.load(resultsFile)
+    assert [(r["k"], r["w"]) for r in tune["results"]] == [(13, 10), (15, 10)]
+    assert tune["pareto_front"]
+    assert all(r["recall"] > 0.9 for r in tune["results"])
+
+
+def test_regress(run_module, tmp_path):
+    baseline = tmp_path / "baseline.json"
+    small = ["--genome-size", str(GENOME_SIZE), "--pairs", str(PAIRS), "--repeat", "1", "--baseline", str(baseline)]
+    run_module("mapper.benchmark.regress", "--update", *small)
+    with open(baseline) as baselineFile:
+        stored = json.load(baselineFile)
+    assert stored["mapped"] > 0 and set(stored["stages"]) == {"hash", "extract", "lookup", "chain", "dp", "sam", "map"}
+    assert stored["command"].startswith("python -m mapper.benchmark.regress --update")
+    # the same alignments again; timings of a run this small are noise, only the digest gates
+    run_module("mapper.benchmark.regress", "--tolerance", "1000", *small)
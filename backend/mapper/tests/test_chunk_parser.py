@@ -0,0 +1,85 @@
+"""
+Chunked FASTQ parsing from binary streams, mmm_parser/chunkParser.py.
+"""
+
+import gzip
+import io
+
+import pytest
+
+from mapper.mmm_parser.chunkParser import ChunkParser
+from mapper.mmm_parser.parser import Parser
+
+# quality lines may start with '@' or '+', and records may end in CRLF
+FASTQ = (
+    b"@p0/1\nACGTACGTAC\n+\nIIIIIIIIII\n"
+    b"@p0/2\nTTGCA\n+\n@@@@#\n"
+    b"@p1/1\nGGGGCCCCAAAATTTT\n+p1/1\n+IIIIIIIIIIIIIII\n"
+    b"@p1/2\r\nNACGT\r\n+\r\nII#II\r\n"
+    b"@p2/1\nA\n+\nI\n"
+)
+
+
+def summary(read):
+    return read.identifier, read.sequence, read.qualityScore, read.isFront
+
+
+def parse(data: bytes, chunkBytes: int) -> list:
+    parser = ChunkParser(io.BytesIO(data), chunkBytes=chunkBytes)
+    reads = []
+    while (read := parser.parseNextRead()) is not None:
+        reads.append(summary(read))
+    return reads
+
+
+EXPECTED = [
+    ("p0/1", "ACGTACGTAC", "IIIIIIIIII", True),
+    ("p0/2", "TTGCA", "@@@@#", False),
+    ("p1/1", "GGGGCCCCAAAATTTT", "+IIIIIIIIIIIIIII", True),
+    ("p1/2", "NACGT", "II#II", False),
+    ("p2/1", "A", "I", True),
+]
+
+
+@pytest.mark.parametrize("chunkBytes", list(range(1, len(FASTQ) + 2)))
+def test_records_split_across_chunks(chunkBytes):
+    # every chunk size puts the chunk boundaries at other places inside the records
+    assert parse(FASTQ, chunkBytes) == EXPECTED
+    # no final newline
+    assert parse(FASTQ.rstrip(b"\n"), chunkBytes) == EXPECTED
+
+
+def test_same_reads_as_the_line_parser():
+    parser = Parser(io.StringIO(FASTQ.decode()))
+    reads = []
+    while (read := parser.parseNextRead()) is not None:
+        reads.append(summary(read))
+    assert parse(FASTQ, ChunkParser.CHUNK_BYTES) == reads
+
+
+@pytest.mark.parametrize("chunkBytes", [1, 7, 64, ChunkParser.CHUNK_BYTES])
+def test_gzip(chunkBytes):
+    assert parse(gzip.compress(FASTQ), chunkBytes) == EXPECTED
+    # several concatenated gzip members, as bgzip writes them, split inside a record
+    members = gzip.compress(FASTQ[:50]) + gzip.compress(FASTQ[50:123]) + gzip.compress(FASTQ[123:])
+    assert parse(members, chunkBytes) == EXPECTED
+
+
+def test_empty_and_truncated_input():
+    assert parse(b"", 16) == []
+    assert parse(gzip.compress(b""), 16) == []
+    # an incomplete last record is not a read
+    assert parse(FASTQ + b"@p2/2\nACGT\n", 16) == EXPECTED
+
+
+def test_reads_only_as_far_as_asked():
+    data = FASTQ * 1000
+    stream = io.BytesIO(data)
+    parser = ChunkParser(stream, chunkBytes=256)
+    assert summary(parser.parseNextRead()) == EXPECTED[0]
+    # one chunk read, not the whole stream
+    assert stream.tell() == 256
+    rest = 0
+    while parser.parseNextRead() is not None:
+        rest += 1
+    assert rest == 5 * 1000 - 1
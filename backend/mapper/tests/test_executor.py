@@ -0,0 +1,129 @@
+"""
+Batch executors, parallelization/executor.py.
+"""
+
+import io
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from mapper.models.options import MapperOptions
+from mapper.parallelization import executor
+
+
+def read_pairs(reference: str, rng) -> list:
+    from mapper.benchmark.simulate import ReadProfile, simulate_pairs
+    from mapper.models.read import Read
+
+    readsOne, readsTwo, truth = io.StringIO(), io.StringIO(), io.StringIO()
+    simulate_pairs(reference, 20, ReadProfile(substitution=0.01), rng, readsOne, readsTwo, truth)
+
+    def reads(fastq: io.StringIO, isFront: bool):
+        lines = fastq.getvalue().split("\n")
+        return [Read(lines[i][1:], lines[i + 1], lines[i + 3], isFront) for i in range(0, len(lines) - 1, 4)]
+    return list(enumerate(zip(reads(readsOne, True), reads(readsTwo, False))))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    from mapper.benchmark.simulate import simulate_reference
+    from mapper.index.build_index import ReferenceIndexBuilder
+    from mapper.index.reference_store import ReferenceStore
+
+    # a fresh worker: nothing resident yet
+    monkeypatch.setattr(executor, "_RESIDENT", OrderedDict())
+    monkeypatch.setattr(executor, "_ACTIVE", None)
+    store = ReferenceStore(str(tmp_path))
+    rng = np.random.default_rng(9)
+    batches = {}
+    for name in ("a", "b"):
+        reference = simulate_reference(10000, rng)
+        store.put(name, name, reference, ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index(), 15, 10)
+        batches[name] = read_pairs(reference, rng)
+    return store, batches
+
+
+def test_resident_worker_switches_between_requests(store, monkeypatch):
+    store, batches = store
+    loads = []
+    load = executor.ReferenceStore.load
+    monkeypatch.setattr(executor.ReferenceStore, "load", lambda self, refId: loads.append(refId) or load(self, refId))
+    plain, pairAware = MapperOptions(), MapperOptions(pairAware=True)
+
+    def cache_hits(refId: str, options: MapperOptions) -> int:
+        # the options arrive pickled with every batch: an equal copy, not the same object
+        _, stats = executor._map_resident(store.root, refId, MapperOptions(**vars(options)), batches[refId])
+        return stats.counts["cache_hits"]
+
+    # three requests interleave their batches on one worker
+    assert cache_hits("a", plain) == 0
+    assert cache_hits("b", plain) == 0
+    assert cache_hits("a", pairAware) == 0
+    # each finds its own read cache again, and every reference was loaded once
+    assert cache_hits("a", plain) > 0
+    assert cache_hits("b", plain) > 0
+    assert cache_hits("a", pairAware) > 0
+    assert loads == ["a", "b"]
+
+    # a third option set on a reference drops its least recently used one
+    assert cache_hits("a", MapperOptions(seedMinQuality=20)) == 0
+    assert cache_hits("a", pairAware) > 0
+    assert cache_hits("a", plain) == 0
+
+
+def test_openmp_backend_maps_like_the_thread_backend():
+    from mapper.benchmark.simulate import simulate_reference
+    from mapper.index.build_index import ReferenceIndexBuilder
+
+    rng = np.random.default_rng(10)
+    reference = simulate_reference(10000, rng)
+    index = ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index()
+    pairs = read_pairs(reference, rng) * 3
+    options = MapperOptions(k=15, w=10)
+    if not hasattr(executor.batch_reads, "process_read_pair_batch_nogil"):
+        with pytest.raises(ValueError, match="compiled build"):
+            executor.make_executor("openmp", 2, index, reference, options)
+        return
+
+    def mapped(backend: str) -> list:
+        with executor.make_executor(backend, 2, index, reference, options) as batches:
+            return [alignment for alignments, _ in batches.imap(pairs) for alignment in alignments]
+    openmp = mapped("openmp")
+    assert len(openmp) == 2 * len(pairs)
+    assert openmp == mapped("thread")
+
+
+def test_concurrent_thread_executors_keep_their_own_reference():
+    from mapper.benchmark.simulate import simulate_reference
+    from mapper.index.build_index import ReferenceIndexBuilder
+
+    rng = np.random.default_rng(11)
+    jobs = {}
+    for name in ("a", "b"):
+        reference = simulate_reference(10000, rng)
+        index = ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index()
+        jobs[name] = (index, reference, read_pairs(reference, rng))
+    options = MapperOptions(k=15, w=10)
+
+    def alone(name: str) -> list:
+        index, reference, pairs = jobs[name]
+        with executor.make_executor("thread", 1, index, reference, options) as batches:
+            return [alignment for alignments, _ in batches.imap(pairs) for alignment in alignments]
+    expected = {name: alone(name) for name in jobs}
+
+    # two requests in one process, each on its own executor: the second one's workers are
+    # set up while the first one is still mapping, then their batches interleave
+    a, b = (executor.make_executor("thread", 1, *jobs[name][:2], options) for name in jobs)
+    try:
+        mapped = {name: [] for name in jobs}
+        for name, pool, part in (("a", a, slice(0, 10)), ("b", b, slice(0, 10)),
+                                 ("a", a, slice(10, None)), ("b", b, slice(10, None))):
+            for alignments, _ in pool.imap(jobs[name][2][part]):
+                mapped[name] += alignments
+    finally:
+        a.close()
+        b.close()
+    assert mapped == expected
+    assert all(sum(alignment.mapped for alignment in alignments) > len(alignments) // 2
+               for alignments in mapped.values())
@@ -0,0 +1,192 @@
+"""
+The compiled extender against its pure-Python twin, extend/extender.py.
+"""
+
+import importlib.util
+import io
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+from mapper.extend import extender
+
+
+@pytest.fixture(scope="module")
+def twins():
+    if not extender.__file__.endswith((".so", ".pyd")):
+        pytest.skip("the Cython extensions are not built (make cython)")
+    # the .py twin under another name, next to the compiled module it shadows
+    spec = importlib.util.spec_from_file_location("mapper.extend._extender_py",
+                                                  os.path.join(os.path.dirname(extender.__file__), "extender.py"))
+    pure = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = pure
+    spec.loader.exec_module(pure)
+    yield extender, pure
+    del sys.modules[spec.name]
+
+
+def summary(hit):
+    return (hit.ref_start, hit.ref_end, hit.strand_plus, hit.cigar, hit.edit_distance) if hit else None
+
+
+def test_ungapped_mismatches_case_and_n(twins):
+    for q, t in [("ACgtNa", "acGTNA"), ("acgt", "ACGA"), ("NNNN", "nnnn")]:
+        assert twins[0].ungapped_mismatches(q, t) == twins[1].ungapped_mismatches(q, t)
+
+
+def test_align_ungapped_case_and_n(twins):
+    rng = random.Random(7)
+    reference = "".join(rng.choice("ACGT") for _ in range(400))
+    read = list(reference[100:200])
+    read[10] = "N"
+    read[50] = "C" if read[50] != "C" else "G"
+    # a soft-masked stretch: lowercase bases still match their reference base
+    read = "".join(read[:30]).lower() + "".join(read[30:])
+    chain = [(100 + q, q, True) for q in range(0, 90, 10)]
+
+    hits = [summary(twin.Extender()._align_ungapped("r", read, reference, chain)) for twin in twins]
+    assert hits[0] == hits[1]
+    assert hits[0] == (100, 200, True, "100M", 2)
+
+
+@pytest.fixture(scope="module")
+def split_locus():
+    """
+    A 300 bp read whose true locus (at 1000) has one deletion after read base 150, so its
+    anchors fall on two neighbouring diagonals, and a decoy (at 3000) with four mismatches
+    whose anchors all share one diagonal and outnumber either half of the true locus.
+    """
+    rng = random.Random(11)
+    reference = [rng.choice("ACGT") for _ in range(5000)]
+    read = reference[1000:1150] + reference[1151:1301]
+    decoy = list(read)
+    for q in (5, 10, 15, 20):
+        decoy[q] = "A" if decoy[q] != "A" else "C"
+    reference[3000:3300] = decoy
+    decoyAnchors = [(3000 + q, q, True) for q in range(30, 285, 6)]
+    front = [(1000 + q, q, True) for q in range(0, 135, 6)]
+    back = [(1001 + q, q, True) for q in range(156, 285, 6)]
+    return "".join(reference), "".join(read), decoyAnchors, front, back
+
+
+def test_early_exit_keeps_a_locus_split_by_an_indel(split_locus):
+    reference, read, decoyAnchors, front, back = split_locus
+    # either half alone looks like more than the decoy's 4 edits...
+    assert extender.edit_lower_bound([q for _, q, _ in front], len(read), 15, 10) > 4
+    assert extender.edit_lower_bound([q for _, q, _ in back], len(read), 15, 10) > 4
+    # ... the two together cover the read
+    hit = extender.Extender(k=15, w=10).extend("r", read, reference, decoyAnchors + front + back)
+    assert summary(hit) == (1000, 1301, True, "150M1D150M", 1)
+    assert [h.ref_start for h in hit.secondary] == [3000]
+
+
+def test_early_exit_off_without_complete_seeds(split_locus):
+    reference, read, decoyAnchors, front, _ = split_locus
+    # as after a quality mask or occurrence cutoff: most of the true locus gave no anchors
+    anchors = decoyAnchors + front[:4]
+    pruned = extender.Extender(k=15, w=10).extend("r", read, reference, anchors)
+    assert summary(pruned) == (3000, 3300, True, "300M", 4)
+    hit = extender.Extender(k=15, w=10, complete_seeds=False).extend("r", read, reference, anchors)
+    assert summary(hit) == (1000, 1301, True, "150M1D150M", 1)
+
+
+# pre-extension filters at their most selective settings here, with an edit-rate limit
+# low enough for the q-gram filter (q = 4)
+FILTERS = dict(min_chain_anchors=3, min_chain_coverage=0.3, qgram_filter=True)
+
+
+def test_filters_keep_true_hits():
+    from mapper.benchmark.simulate import ReadProfile, simulate_pairs, simulate_reference
+    from mapper.index.build_index import ReferenceIndexBuilder
+    from mapper.seed.minimizer import Minimizer
+
+    rng = np.random.default_rng(8)
+    reference = simulate_reference(20000, rng, repeats=10, repeatLength=300, repeatDivergence=0.05)
+    readsOne, readsTwo, truth = io.StringIO(), io.StringIO(), io.StringIO()
+    # 2% edits, half of them indels: true loci split into chains on neighbouring diagonals,
+    # and chains reach the q-gram filter
+    simulate_pairs(reference, 50, ReadProfile(substitution=0.01, insertion=0.005, deletion=0.005), rng,
+                   readsOne, readsTwo, truth)
+    reads = [line for fastq in (readsOne, readsTwo) for line in fastq.getvalue().split("\n")[1::4]]
+    minimizer = Minimizer(15, 10)
+    batch = minimizer.lookup_batch([minimizer.extract(read) for read in reads],
+                                   ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index())
+
+    plain = extender.Extender(k=15, w=10, max_edit_rate=0.2)
+    filtered = extender.Extender(k=15, w=10, max_edit_rate=0.2, **FILTERS)
+    for j, read in enumerate(reads):
+        anchors = Minimizer.anchors_of(batch, j)
+        expected = plain.extend("r", read, reference, anchors)
+        hit = filtered.extend("r", read, reference, anchors)
+        assert summary(hit if hit.mapped else None) == summary(expected if expected.mapped else None)
+    # ... while the filters did drop chains of repeat copies
+    counts = filtered.stats.counts
+    assert counts["filter_anchors"] + counts["filter_coverage"] > 0 and counts["qgram_checks"] > 0
+
+
+def test_filters_count_a_locus_split_by_an_indel(split_locus):
+    reference, read, _, front, back = split_locus
+    # more anchors and read coverage than either half has alone
+    filtered = extender.Extender(k=15, w=10, min_chain_anchors=max(len(front), len(back)) + 1,
+                                 min_chain_coverage=0.6)
+    hit = filtered.extend("r", read, reference, front + back)
+    assert summary(hit) == (1000, 1301, True, "150M1D150M", 1)
+
+
+@pytest.fixture(scope="module")
+def hopeless():
+    """
+    A read unrelated to the reference but for two k-mers on one diagonal: a chain of
+    two anchors covering 30 of its 100 bases, in a window that cannot align within 10% edits.
+    """
+    rng = random.Random(13)
+    reference = "".join(rng.choice("ACGT") for _ in range(2000))
+    read = list(rng.choice("ACGT") for _ in range(100))
+    read[0:15] = reference[500:515]
+    read[50:65] = reference[550:565]
+    return reference, "".join(read), [(500, 0, True), (550, 50, True)]
+
+
+@pytest.mark.parametrize("option, counter", [
+    (dict(min_chain_anchors=3), "filter_anchors"),
+    (dict(min_chain_coverage=0.5), "filter_coverage"),
+    (dict(qgram_filter=True), "filter_qgram"),
+])
+def test_filters_drop_a_hopeless_chain(hopeless, option, counter):
+    reference, read, anchors = hopeless
+    plain = extender.Extender(k=15, w=10, max_edit_rate=0.1, profile=True)
+    assert not plain.extend("r", read, reference, anchors).mapped
+    # without the filter the chain costs a DP window
+    assert plain.stats.counts["dp_windows"] == 1
+
+    filtered = extender.Extender(k=15, w=10, max_edit_rate=0.1, profile=True, **option)
+    assert not filtered.extend("r", read, reference, anchors).mapped
+    assert filtered.stats.counts[counter] == 1
+    assert filtered.stats.counts["dp_windows"] == filtered.stats.counts["dp_cells"] == 0
+
+
+@pytest.mark.parametrize("indel", ["deletion", "insertion"])
+def test_widened_band_matches_unbanded_dp(indel):
+    rng = random.Random(17)
+    reference = "".join(rng.choice("ACGT") for _ in range(3000))
+    if indel == "deletion":
+        read = reference[1000:1100] + reference[1120:1220]
+    else:
+        read = reference[1000:1100] + "".join(rng.choice("ACGT") for _ in range(20)) + reference[1100:1180]
+    # anchors before the indel only: the chain's diagonal puts the rest of the read
+    # 20 diagonals outside the starting band of 10
+    chain = [(1000 + q, q, True) for q in range(0, 85, 5)]
+    aligner = extender.Extender(k=15, w=10)
+    assert aligner._chain_band(chain, len(read)) == 10
+    hit = aligner._align_chain("r", read, None, reference, chain)
+    assert aligner.stats.counts["band_widenings"] >= 1 and aligner.stats.counts["band_widened_windows"] == 1
+    # the same alignment as an unbanded DP over a window wider than the band ever got
+    unbanded = aligner.align_window("r", read, reference, 800, 1400, True)
+    assert summary(hit) == summary(unbanded)
+    assert hit.edit_distance == 20
+    # kept in the starting band, the indel costs far more
+    narrow = extender.Extender(k=15, w=10, max_band=10)._align_chain("r", read, None, reference, chain)
+    assert narrow.edit_distance > 40
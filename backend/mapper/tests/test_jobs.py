@@ -0,0 +1,159 @@
+"""
+Background mapping jobs, readMapper/jobs.py.
+"""
+
+import io
+import os
+import threading
+
+import pytest
+
+from mapper.models.readMapper import ReadMapperInput, ReadMapperOutput
+from mapper.readMapper.jobs import JobQueue, QueueFull
+from mapper.readMapper.readMapper import AReadMapper
+
+
+class GatedMapper(AReadMapper):
+    """
+    Holds every job until the test releases it by the content of its first reads
+    file; a job whose reads say "fail" raises.
+    """
+    def __init__(self):
+        self.gates = {}
+        self.started = {}
+        self.inputs = {}
+
+    def gate(self, name: str) -> threading.Event:
+        self.started.setdefault(name, threading.Event())
+        return self.gates.setdefault(name, threading.Event())
+
+    def mapReads(self, inputData: ReadMapperInput) -> ReadMapperOutput:
+        name = inputData.readsOne.read().decode()
+        self.inputs[name] = inputData
+        gate = self.gate(name)
+        self.started[name].set()
+        assert gate.wait(10)
+        if name == "fail":
+            raise ValueError("no reads")
+        inputData.progress(2, 2, 1)
+        if inputData.outputStream is not None:
+            inputData.outputStream.write(f"@HD\t{name}\n")
+            return ReadMapperOutput(samOutput=inputData.outputStream, numberOfMappedReads=1)
+        with open(inputData.outputLocation, "w") as out:
+            out.write(f"@HD\t{name}\n")
+        return ReadMapperOutput(samOutput=inputData.outputLocation, numberOfMappedReads=1)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    mapper = GatedMapper()
+    jobs = JobQueue(mapper, str(tmp_path / "jobs"), runners=1, maxQueued=1, keepFinished=2)
+    yield mapper, jobs
+    for gate in mapper.gates.values():
+        gate.set()
+    jobs.close()
+
+
+def submit(jobs: JobQueue, name: str, **kwargs):
+    return jobs.submit(io.BytesIO(name.encode()), io.BytesIO(b"reads two"), io.BytesIO(b">ref\nACGT\n"), **kwargs)
+
+
+def test_job_runs_queued_running_done(queue):
+    mapper, jobs = queue
+    first = submit(jobs, "first", pairAware=True)
+    assert mapper.started.setdefault("first", threading.Event()).wait(10)
+    assert first.status == "running"
+    # the uploads were copied into the job's directory, options passed through
+    assert sorted(os.listdir(first.directory)) == ["readsOne", "readsTwo", "referenceGenome"]
+    assert mapper.inputs["first"].pairAware is True
+
+    second = submit(jobs, "second")
+    assert second.status == "queued" and jobs.position(second) == 0
+    # one runner and one queued slot: a third job is turned away
+    with pytest.raises(QueueFull):
+        submit(jobs, "third")
+
+    mapper.gate("first").set()
+    first.future.result(10)
+    assert first.status == "done" and jobs.get(first.id) is first
+    assert (first.readsDone, first.readsTotal, first.mappedReads) == (2, 2, 1)
+    with open(os.path.join(first.directory, "output.sam")) as sam:
+        assert sam.read() == "@HD\tfirst\n"
+    summary = first.summary()
+    assert summary["status"] == "done" and summary["error"] is None and summary["elapsedSeconds"] >= 0
+
+    # the finished job freed its slot
+    assert mapper.started.setdefault("second", threading.Event()).wait(10)
+    third = submit(jobs, "third")
+    mapper.gate("second").set()
+    mapper.gate("third").set()
+    assert third.future.result(10).status == "done"
+
+
+def test_failed_job_keeps_its_error(queue):
+    mapper, jobs = queue
+    mapper.gate("fail").set()
+    job = submit(jobs, "fail")
+    job.future.result(10)
+    assert job.status == "failed"
+    assert job.error == "ValueError: no reads"
+    assert job.finished >= job.started >= job.submitted
+    # the queue keeps working
+    mapper.gate("next").set()
+    assert submit(jobs, "next").future.result(10).status == "done"
+
+
+def test_finished_jobs_are_retired(queue):
+    mapper, jobs = queue
+    done = []
+    for name in ("a", "b", "c"):
+        mapper.gate(name).set()
+        job = submit(jobs, name)
+        job.future.result(10)
+        done.append(job)
+    # keepFinished=2: the oldest finished job and its files are gone
+    assert jobs.get(done[0].id) is None and not os.path.exists(done[0].directory)
+    assert all(jobs.get(job.id) is job and os.path.exists(job.directory) for job in done[1:])
+
+
+def test_streamed_job(queue):
+    mapper, jobs = queue
+    job = submit(jobs, "streamed", stream=True)
+    mapper.gate("streamed").set()
+    assert b"".join(job.stream.chunks()) == b"@HD\tstreamed\n"
+    assert job.future.result(10).status == "done"
+    assert not os.path.exists(os.path.join(job.directory, "output.sam"))
+
+    failing = submit(jobs, "fail", stream=True)
+    mapper.gate("fail").set()
+    # the error reaches the reader of the stream
+    with pytest.raises(ValueError):
+        b"".join(failing.stream.chunks())
+    assert failing.future.result(10).status == "failed"
+
+
+def test_uploads_read_in_place(queue):
+    mapper, jobs = queue
+    mapper.gate("in place").set()
+    job = submit(jobs, "in place", copy=False)
+    job.future.result(10)
+    assert job.status == "done"
+    assert os.listdir(job.directory) == ["output.sam"]
+
+
+def test_job_maps_with_the_read_mapper(tmp_path):
+    from mapper.benchmark.simulate import simulate
+    from mapper.readMapper.readMapper import ReadMapper
+
+    paths = simulate(str(tmp_path / "data"), 20000, 50)
+    jobs = JobQueue(ReadMapper(), str(tmp_path / "jobs"))
+    try:
+        with open(paths["r1.fq"], "rb") as one, open(paths["r2.fq"], "rb") as two, open(paths["ref.fa"], "rb") as ref:
+            job = jobs.submit(one, two, ref, backend="thread", threads=1)
+        job.future.result(600)
+    finally:
+        jobs.close()
+    assert job.status == "done", job.error
+    assert job.readsDone == job.readsTotal == 100 and job.mappedReads > 90
+    with open(os.path.join(job.directory, "output.sam")) as sam:
+        assert sum(1 for line in sam if not line.startswith("@")) == 100
@@ -0,0 +1,88 @@
+"""
+Long-read mode: Chainer.gapped_chains and Extender._align_chain_gapped on multi-kb reads.
+"""
+
+import io
+import random
+import re
+
+import numpy as np
+import pytest
+
+from mapper.extend.extender import Extender
+from mapper.seed.minimizer import Minimizer
+
+K, W = 15, 10
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def long_read_hit(index, reference: str, read: str):
+    minimizer = Minimizer(K, W)
+    anchors = Minimizer.anchors_of(minimizer.lookup_batch([minimizer.extract_arrays(read)], index), 0)
+    return Extender(k=K, w=W, long_reads=True).extend("r", read, reference, anchors)
+
+
+def cigar_edits(hit, read: str, reference: str) -> int:
+    # replay the CIGAR along the reference: its lengths must add up, mismatches and gaps are edits;
+    # reverse-strand CIGARs run along the original read, like those of short reads
+    q_seq = read if hit.strand_plus else reverse_complement(read)
+    ops = re.findall(r"(\d+)([MID])", hit.cigar)
+    y, r, edits = 0, hit.ref_start, 0
+    for length, op in (ops if hit.strand_plus else ops[::-1]):
+        length = int(length)
+        if op == "M":
+            edits += sum(a != b for a, b in zip(q_seq[y:y + length], reference[r:r + length]))
+            y, r = y + length, r + length
+        elif op == "I":
+            edits, y = edits + length, y + length
+        else:
+            edits, r = edits + length, r + length
+    assert (y, r) == (len(read), hit.ref_end)
+    return edits
+
+
+@pytest.fixture(scope="module")
+def genome():
+    from mapper.index.build_index import ReferenceIndexBuilder
+
+    rng = random.Random(3)
+    reference = "".join(rng.choice("ACGT") for _ in range(30000))
+    return ReferenceIndexBuilder(reference, k=K, w=W).build_sorted_index(), reference
+
+
+@pytest.mark.parametrize("strand_plus", [True, False])
+def test_long_read_with_indels(genome, strand_plus):
+    index, reference = genome
+    # 4 kb from 10000 with a 3 bp deletion, a 4 bp insertion and a mismatch, each with
+    # a single optimal placement
+    read = reference[10000:11010] + reference[11013:12500] + "GATC" + reference[12500:14000]
+    read = read[:3000] + ("A" if read[3000] != "A" else "C") + read[3001:]
+    hit = long_read_hit(index, reference, read if strand_plus else reverse_complement(read))
+    assert (hit.ref_start, hit.ref_end, hit.strand_plus) == (10000, 14000, strand_plus)
+    assert hit.cigar == ("1010M3D1487M4I1500M" if strand_plus else "1500M4I1487M3D1010M")
+    assert hit.edit_distance == 8 == cigar_edits(hit, read if strand_plus else reverse_complement(read), reference)
+
+
+def test_simulated_long_reads(genome):
+    from mapper.benchmark.simulate import PROFILES, simulate_pairs
+
+    index, reference = genome
+    profile = PROFILES["long"]
+    readsOne, readsTwo, truth = io.StringIO(), io.StringIO(), io.StringIO()
+    simulate_pairs(reference, 2, profile, np.random.default_rng(4), readsOne, readsTwo, truth)
+    reads = [fastq.getvalue().split("\n")[i] for fastq in (readsOne, readsTwo) for i in (1, 5)]
+    spans = [tuple(map(int, line.split("\t")[1:])) for line in truth.getvalue().splitlines()]
+    # simulate_pairs writes the truth pair by pair, the reads file by file
+    spans = [spans[0], spans[2], spans[1], spans[3]]
+    for read, (start, end) in zip(reads, spans):
+        hit = long_read_hit(index, reference, read)
+        assert hit.mapped and len(read) == profile.length
+        # an error next to a read end may move the clip by a few bases
+        assert abs(hit.ref_start - start) <= 5 and abs(hit.ref_end - end) <= 5
+        assert "I" in hit.cigar and "D" in hit.cigar
+        assert hit.edit_distance == cigar_edits(hit, read, reference)
+        assert hit.edit_distance <= 2 * profile.errorRate * len(read)
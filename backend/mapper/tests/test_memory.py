@@ -0,0 +1,28 @@
+"""
+The memory sampler, parallelization/memory.py.
+"""
+
+import threading
+
+from mapper.parallelization.memory import MemorySampler
+
+
+def test_phases_are_sampled_on_the_background_thread(monkeypatch):
+    sampler = MemorySampler(interval=60.0)
+    threads, sampled = [], threading.Event()
+    sample = sampler.sample
+
+    def recording_sample():
+        threads.append(threading.current_thread().name)
+        sample()
+        sampled.set()
+    monkeypatch.setattr(sampler, "sample", recording_sample)
+
+    with sampler:
+        sampler.set_phase("load")
+        # far sooner than the interval: a new phase wakes the sampler
+        assert sampled.wait(10.0)
+        sampler.set_phase("mapping")
+    assert threads and set(threads) == {"memory-sampler"}
+    assert sampler.peaks["load"].rss > 0
+    assert set(sampler.peaks) == {"load", "mapping"}
@@ -0,0 +1,122 @@
+"""
+Pair-aware mapping, extend/pairing.py.
+"""
+
+import math
+import random
+import statistics
+
+import pytest
+
+from mapper.extend.extender import Alignment, Extender
+from mapper.extend.pairing import InsertSizeEstimator, PairedMapper, insert_size, mate_window
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def hit(ref_start: int, ref_end: int, strand_plus: bool, edit_distance: int = 0, mapq: int = 60) -> Alignment:
+    return Alignment(readId="r", ref_start=ref_start, ref_end=ref_end, strand_plus=strand_plus,
+                     cigar=f"{ref_end - ref_start}M", mapped=True, mapq=mapq, edit_distance=edit_distance)
+
+
+def trained(inserts) -> InsertSizeEstimator:
+    estimator = InsertSizeEstimator()
+    for insert in inserts:
+        estimator.add(insert)
+    return estimator
+
+
+def test_insert_size_estimator():
+    rng = random.Random(2)
+    inserts = [int(rng.gauss(300, 20)) for _ in range(50)]
+    estimator = InsertSizeEstimator(min_samples=20, max_samples=40)
+    for insert in inserts[:19]:
+        estimator.add(insert)
+    assert not estimator.ready
+    # outliers and discordant pairs are not learned
+    for insert in (0, -5, estimator.max_insert + 1):
+        estimator.add(insert)
+    assert estimator.n == 19
+    for insert in inserts[19:]:
+        estimator.add(insert)
+    # frozen after max_samples
+    assert estimator.ready and estimator.n == 40
+    assert estimator.mean == pytest.approx(statistics.mean(inserts[:40]))
+    assert estimator.std == pytest.approx(statistics.stdev(inserts[:40]))
+    lo, hi = estimator.bounds(4.0)
+    spread = 4.0 * estimator.std + 10
+    assert (lo, hi) == (int(estimator.mean - spread), math.ceil(estimator.mean + spread))
+    assert estimator.is_proper(300, 4.0) and not estimator.is_proper(hi + 1, 4.0)
+    assert not estimator.is_proper(None, 4.0)
+
+
+@pytest.mark.parametrize("strand_plus", [True, False])
+def test_mate_window(strand_plus):
+    mate_len, lo, hi = 100, 250, 350
+    anchor = hit(1000, 1100, True) if strand_plus else hit(2000, 2100, False)
+    ref_lo, ref_hi, mate_plus = mate_window(anchor, mate_len, lo, hi)
+    assert mate_plus is not strand_plus
+    assert (ref_lo, ref_hi) == ((1150, 1350) if strand_plus else (1750, 1950))
+    # the mate at either end of the window makes a pair of insert lo and hi
+    for start, insert in ((ref_lo, lo if strand_plus else hi), (ref_hi - mate_len, hi if strand_plus else lo)):
+        assert insert_size(anchor, hit(start, start + mate_len, mate_plus)) == insert
+
+
+def test_choose_pair_prefers_the_proper_pair():
+    mapper = PairedMapper(Extender(), "", full_search=None, estimator=trained([300] * 20))
+    # the front's primary is far from the back, its secondary (one more edit) makes a proper pair
+    front = hit(5000, 5100, True)
+    front.secondary = [hit(1000, 1100, True, edit_distance=1)]
+    back = hit(1200, 1300, False)
+    a, b = mapper._choose_pair(front, back)
+    assert (a.ref_start, b.ref_start) == (1000, 1200)
+    assert [h.ref_start for h in a.secondary] == [5000]
+    # the promoted hit's MAPQ comes from its own edit gap: the old primary has one edit less
+    assert a.mapq == 0
+
+
+@pytest.fixture(scope="module")
+def fragment():
+    rng = random.Random(5)
+    reference = "".join(rng.choice("ACGT") for _ in range(10000))
+    front = reference[2000:2100]
+    back = reverse_complement(reference[2200:2300])
+    return reference, front, back
+
+
+def pair_mapper(reference: str, searches: dict, calls: list) -> PairedMapper:
+    def full_search(readId, read, quality, seq_id):
+        calls.append(readId)
+        return searches[readId]
+    return PairedMapper(Extender(), reference, full_search=full_search, estimator=trained([300] * 20))
+
+
+def test_rescue_lands_in_the_window(fragment):
+    reference, front, back = fragment
+    calls = []
+    mapper = pair_mapper(reference, {"f": hit(2000, 2100, True)}, calls)
+    a, b = mapper.map_pair(("f", front, None), ("b", back, None), 0)
+    # found by aligning inside the insert-size window, no full search for the mate
+    assert calls == ["f"]
+    ref_lo, ref_hi, strand_plus = mate_window(a, len(back), *mapper.estimator.bounds(mapper.n_std))
+    assert (b.ref_start, b.ref_end, b.strand_plus, b.edit_distance) == (2200, 2300, False, 0)
+    assert ref_lo <= b.ref_start and b.ref_end <= ref_hi and strand_plus is False
+    assert b.mapq <= a.mapq
+
+
+def test_poor_rescue_loses_to_a_full_search(fragment):
+    reference, front, back = fragment
+    # a mate with 20% mismatches inside the window, and a perfect hit elsewhere
+    poor = list(back)
+    for q in range(0, len(poor), 5):
+        poor[q] = "A" if poor[q] != "A" else "C"
+    elsewhere = hit(8000, 8100, False)
+    calls = []
+    mapper = pair_mapper(reference, {"f": hit(2000, 2100, True), "b": elsewhere}, calls)
+    a, b = mapper.map_pair(("f", front, None), ("b", "".join(poor), None), 0)
+    assert calls == ["f", "b"]
+    assert b is elsewhere
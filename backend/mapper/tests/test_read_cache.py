@@ -0,0 +1,16 @@
+"""
+The per-worker read cache, parallelization/read_cache.py.
+"""
+
+from mapper.models.read import Read
+from mapper.parallelization.read_cache import ReadCache
+
+
+def test_reads_key_with_qualities():
+    sequence = "ACGTACGTAC"
+    high, low = Read("a", sequence, "I" * 10, True), Read("b", sequence, "#" * 10, True)
+    # the sequence alone is the key unless qualities mask the seeds
+    assert ReadCache.reads_key((high,), False) == ReadCache.reads_key((low,), False) == ReadCache.key(sequence)
+    assert ReadCache.reads_key((high,), True) != ReadCache.reads_key((low,), True)
+    assert ReadCache.reads_key((high, low), True) != ReadCache.reads_key((low, high), True)
+    assert ReadCache.reads_key((high, low), False) == ReadCache.key(sequence, sequence)
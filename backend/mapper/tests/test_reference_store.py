@@ -0,0 +1,96 @@
+"""
+The on-disk reference store, index/reference_store.py.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from mapper.index.build_index import ReferenceIndexBuilder
+from mapper.index.reference_store import ReferenceStore
+from mapper.index.sorted_index import SortedMinimizerIndex
+
+
+@pytest.fixture(scope="module")
+def references():
+    from mapper.benchmark.simulate import simulate_reference
+
+    rng = np.random.default_rng(12)
+    built = {}
+    for name in ("a", "b", "c"):
+        reference = simulate_reference(5000, rng)
+        built[name] = reference, ReferenceIndexBuilder(reference, k=15, w=10).build_sorted_index()
+    return built
+
+
+def put(store: ReferenceStore, name: str, references: dict, lastUsed: float = None) -> str:
+    reference, index = references[name]
+    refId = ReferenceStore.reference_id(reference, 15, 10)
+    store.put(refId, name, reference, index, 15, 10)
+    if lastUsed is not None:
+        os.utime(os.path.join(store.path(refId), "meta.json"), (lastUsed, lastUsed))
+    return refId
+
+
+def test_reference_id():
+    assert ReferenceStore.reference_id("ACGT", 15, 10) == ReferenceStore.reference_id("ACGT", 15, 10)
+    assert len({ReferenceStore.reference_id(*args) for args in
+                [("ACGT", 15, 10), ("ACGA", 15, 10), ("ACGT", 13, 10), ("ACGT", 15, 5)]}) == 4
+
+
+def test_put_load_round_trip(tmp_path, references):
+    store = ReferenceStore(str(tmp_path))
+    refId = put(store, "a", references)
+    reference, index = references["a"]
+    assert refId in store and "missing" not in store
+    assert store.meta(refId) == {"name": "a", "length": len(reference), "k": 15, "w": 10, "id": refId}
+
+    loadedIndex, loadedReference = store.load(refId)
+    assert loadedReference == reference
+    for name in SortedMinimizerIndex.ARRAYS:
+        loaded = getattr(loadedIndex, name)
+        assert isinstance(loaded, np.memmap) and not loaded.flags.writeable
+        assert loaded.dtype == getattr(index, name).dtype
+        assert np.array_equal(loaded, getattr(index, name))
+    # lookups through the memory-mapped arrays
+    hashes = index.keys[::7]
+    assert [a.tolist() for a in loadedIndex.lookup(hashes)] == [a.tolist() for a in index.lookup(hashes)]
+    assert [a.tolist() for a in SortedMinimizerIndex.load(store.path(refId), mmap=False).lookup(hashes)] == \
+        [a.tolist() for a in index.lookup(hashes)]
+
+    # storing the same reference again (e.g. a concurrent upload) keeps the stored one
+    put(store, "a", references)
+    assert store.ids() == [refId]
+    # no staging directories left behind
+    assert os.listdir(tmp_path) == [refId]
+
+
+def test_list_and_remove(tmp_path, references):
+    store = ReferenceStore(str(tmp_path))
+    a = put(store, "a", references, lastUsed=1000)
+    b = put(store, "b", references, lastUsed=2000)
+    assert store.ids() == [b, a]
+    store.touch(a)
+    assert store.ids() == [a, b]
+    listed = store.list()
+    assert [entry["name"] for entry in listed] == ["a", "b"]
+    assert all(entry["bytes"] == store.size(entry["id"]) > 0 for entry in listed)
+    store.remove(a)
+    assert a not in store and store.ids() == [b] and not os.path.exists(store.path(a))
+
+
+def test_least_recently_used_are_evicted(tmp_path, references):
+    unbounded = ReferenceStore(str(tmp_path / "size"))
+    size = unbounded.size(put(unbounded, "a", references))
+    # room for two references
+    store = ReferenceStore(str(tmp_path / "store"), maxBytes=int(2.5 * size))
+    a = put(store, "a", references, lastUsed=1000)
+    b = put(store, "b", references, lastUsed=2000)
+    store.touch(a)
+    c = put(store, "c", references)
+    assert set(store.ids()) == {a, c}
+    assert b not in store
+    # the reference just stored stays even when it alone exceeds the limit
+    tiny = ReferenceStore(str(tmp_path / "tiny"), maxBytes=1)
+    assert put(tiny, "a", references) in tiny
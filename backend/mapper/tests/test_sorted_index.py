@@ -0,0 +1,99 @@
+"""
+The sorted minimizer index, index/sorted_index.py, against the dict index it replaced.
+"""
+
+import numpy as np
+import pytest
+
+from mapper.index.build_index import ReferenceIndexBuilder
+from mapper.index.sorted_index import SortedMinimizerIndex
+from mapper.seed.minimizer import Minimizer
+
+K, W = 15, 10
+
+
+@pytest.fixture(scope="module")
+def indexes():
+    from mapper.benchmark.simulate import simulate_reference
+
+    # repeat copies give minimizers with many hits, for the occurrence cutoff
+    rng = np.random.default_rng(6)
+    reference = simulate_reference(20000, rng, repeats=12, repeatLength=300)
+    builder = ReferenceIndexBuilder(reference, k=K, w=W)
+    return reference, builder.build_index(), builder.build_sorted_index(), rng
+
+
+def queries(reference: str, index: dict, rng) -> list:
+    extractor = Minimizer(K, W)
+    reads = [reference[start:start + 150] for start in rng.integers(0, len(reference) - 150, 20)]
+    # reads from nowhere: (almost) every minimizer absent
+    reads += ["".join("ACGT"[b] for b in rng.integers(0, 4, 150)) for _ in range(3)]
+    kmers = [extractor.extract(read) for read in reads]
+    keys = sorted(index)
+    # the first and last keys, and absent hashes before, between and after them
+    edges = [keys[0], keys[-1], keys[0] - 1, keys[0] + 1 if keys[1] > keys[0] + 1 else keys[-1] - 1, 2**64 - 2]
+    kmers.append([(h, q, 0, bool(q % 2)) for q, h in enumerate(edges)])
+    kmers.append([])
+    return kmers
+
+
+def test_from_dict_matches_build_sorted_index(indexes):
+    _, index, sortedIndex, _ = indexes
+    fromDict = SortedMinimizerIndex.from_dict(index)
+    for name in SortedMinimizerIndex.ARRAYS:
+        assert np.array_equal(getattr(fromDict, name), getattr(sortedIndex, name))
+    assert len(sortedIndex) == len(index)
+    for h in list(index)[:200]:
+        assert h in sortedIndex and sortedIndex[h] == index[h]
+    assert 0 not in sortedIndex
+    with pytest.raises(KeyError):
+        sortedIndex[0]
+
+
+@pytest.mark.parametrize("max_occurrences", [0, 2])
+def test_lookup_batch_matches_dict_lookup(indexes, max_occurrences):
+    reference, index, sortedIndex, rng = indexes
+    kmers = queries(reference, index, rng)
+    extractor = Minimizer(K, W, max_occurrences=max_occurrences)
+    batch = extractor.lookup_batch(kmers, sortedIndex)
+    for j, readKmers in enumerate(kmers):
+        expected = extractor.filter_and_lookup(readKmers, index)
+        ref_pos, read_pos, same = Minimizer.anchors_of(batch, j)
+        assert list(zip(ref_pos.tolist(), read_pos.tolist(), same.tolist())) == expected
+    if max_occurrences:
+        # the cutoff did drop repetitive minimizers of these reads
+        assert any(len(index[h]) > max_occurrences for read in kmers for h, *_ in read if h in index)
+
+
+def test_lookup_of_an_empty_index():
+    empty = SortedMinimizerIndex.from_minimizers([])
+    start, end = empty.lookup(np.array([1, 2], dtype=np.uint64))
+    assert start.tolist() == end.tolist() == [0, 0]
+    assert Minimizer(K, W).lookup_batch([[(1, 0, 0, False)]], empty)[3].tolist() == [0, 0]
+
+
+@pytest.mark.parametrize("arrays", [False, True])
+def test_lookup_batch_dedup_keeps_rows(indexes, arrays):
+    reference, index, sortedIndex, _ = indexes
+    # reads repeating each other's minimizers: whole duplicates, overlaps and a reverse complement
+    first, second = reference[1000:1150], reference[1100:1250]
+    reverse = first.translate(str.maketrans("ACGT", "TGCA"))[::-1]
+    reads = [first, second, first, reverse, second[:80], first]
+    extractor = Minimizer(K, W)
+    extract = extractor.extract_arrays if arrays else extractor.extract
+    kmers = [extract(read) for read in reads]
+    batch = extractor.lookup_batch(kmers, sortedIndex)
+
+    hashes = [h for read in kmers for h in (read[0].tolist() if arrays else [m[0] for m in read])]
+    assert extractor.lookups == len(hashes)
+    assert extractor.unique_lookups == len(set(hashes)) < len(hashes)
+    for j, readKmers in enumerate(kmers):
+        # row j holds read j's anchors, in the order a lookup of that read alone gives
+        alone = Minimizer(K, W).lookup_batch([readKmers], sortedIndex)
+        for batched, single in zip(Minimizer.anchors_of(batch, j), Minimizer.anchors_of(alone, 0)):
+            assert batched.tolist() == single.tolist()
+        if not arrays:
+            expected = extractor.filter_and_lookup(readKmers, index)
+            assert list(zip(*(a.tolist() for a in Minimizer.anchors_of(batch, j)))) == expected
+    # duplicate reads get identical rows
+    assert [a.tolist() for a in Minimizer.anchors_of(batch, 0)] == [a.tolist() for a in Minimizer.anchors_of(batch, 2)]
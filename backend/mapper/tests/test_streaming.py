@@ -0,0 +1,103 @@
+"""
+SAM output streamed to a reader thread, readMapper/streaming.py.
+"""
+
+import threading
+import time
+
+import pytest
+
+from mapper.readMapper.streaming import SAMStream, StreamCancelled
+
+
+def test_chunks_in_order():
+    stream = SAMStream()
+    stream.CHUNK_BYTES = 10
+    reader = stream.chunks()
+    stream.write("@HD\n")
+    # below CHUNK_BYTES: buffered until flush
+    assert stream._queue.empty()
+    stream.write("r1\tACGT\n")
+    assert stream._queue.qsize() == 1
+    stream.write("r2\n")
+    stream.flush()
+    stream.flush()
+    stream.write("r3\n")
+    stream.close()
+    assert list(reader) == [b"@HD\nr1\tACGT\n", b"r2\n", b"r3\n"]
+
+
+def test_slow_reader_holds_the_writer_back():
+    stream = SAMStream(maxChunks=2)
+    written = []
+
+    def writer():
+        for i in range(5):
+            stream.write(f"r{i}\n")
+            stream.flush()
+            written.append(i)
+        stream.close()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.3)
+    # two chunks wait for the reader, the writer is blocked on the third
+    assert written == [0, 1]
+    assert b"".join(stream.chunks()) == b"r0\nr1\nr2\nr3\nr4\n"
+    thread.join(10)
+    assert written == [0, 1, 2, 3, 4]
+
+
+def test_error_follows_the_chunks_before_it():
+    stream = SAMStream()
+    stream.write("@HD\n")
+    stream.flush()
+    stream.write("partial\n")
+    stream.close(ValueError("mapping failed"))
+    reader = stream.chunks()
+    assert next(reader) == b"@HD\n"
+    with pytest.raises(ValueError, match="mapping failed"):
+        next(reader)
+
+
+def test_reader_going_away_cancels_the_writer():
+    stream = SAMStream(maxChunks=1)
+    stream.write("@HD\n")
+    stream.flush()
+    reader = stream.chunks()
+    assert next(reader) == b"@HD\n"
+    # the client disconnects: the generator is closed
+    reader.close()
+    with pytest.raises(StreamCancelled):
+        stream.write("r1\n")
+    # a blocked writer gives up too, and closing is a no-op
+    blocked = SAMStream(maxChunks=1)
+    blocked.write("a\n")
+    blocked.flush()
+    threading.Timer(0.2, blocked.cancel).start()
+    with pytest.raises(StreamCancelled):
+        blocked.write("b\n")
+        blocked.flush()
+    blocked.close()
+
+
+def test_read_mapper_streams_the_sam_it_writes(tmp_path):
+    from mapper.benchmark.simulate import simulate
+    from mapper.models.readMapper import ReadMapperInput
+    from mapper.readMapper.readMapper import ReadMapper
+
+    paths = simulate(str(tmp_path / "data"), 20000, 50)
+
+    def map_reads(**output) -> None:
+        with open(paths["r1.fq"], "rb") as one, open(paths["r2.fq"], "rb") as two, open(paths["ref.fa"], "rb") as ref:
+            ReadMapper().mapReads(ReadMapperInput(readsOne=one, readsTwo=two, referenceGenome=ref, backend="thread",
+                                                  threads=1, **output))
+    map_reads(outputLocation=str(tmp_path / "out.sam"))
+    stream = SAMStream()
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.extend(stream.chunks()))
+    reader.start()
+    map_reads(outputLocation=None, outputStream=stream)
+    stream.close()
+    reader.join(10)
+    with open(tmp_path / "out.sam", "rb") as sam:
+        assert b"".join(chunks) == sam.read()